@@ -0,0 +1,129 @@
+'''
+Benchmarks for the Tagging Assistant. These run against the local
+stand-in session (see session_backend.py), so no Snowflake account
+is required and results are reproducible.
+
+Usage: python benchmark.py [latency_ms]
+'''
+import sys, json, statistics
+from time import perf_counter
+import constants, sql_builder, warehouse_catalog, session_backend, query_scheduler
+
+BENCHMARK_SCALES = [10, 1000, 10000]
+
+BENCHMARK_REPEATS = 3
+
+def render_page_queries(session, selected_wh, selected_tag='DEPARTMENT'):
+    '''
+    Issues the statements a full page render runs for an authenticated
+    user with a warehouse and a tag selected, in the same order as
+    warehouse_tagging_assistant.go().
+    '''
+    run_sql = lambda sql: session.sql(sql).collect()
+    wh_catalog = warehouse_catalog.load_catalog(run_sql)
+    run_sql(constants.USAGE_AGGREGATE_SQL)
+    run_sql(sql_builder.get_schedule_tasks_sql(selected_wh))
+    run_sql("show parameters like 'timezone'")
+    run_sql('show tags in tagging_assist_db.tagging')
+    run_sql(sql_builder.get_current_tag_value_sql(selected_tag, selected_wh))
+    run_sql(constants.TAG_VALUE_INDEX_SQL)
+    return wh_catalog
+
+def get_page_statements(selected_wh, selected_tag='DEPARTMENT'):
+    '''
+    The statement behind each named page query, see get_page_query() in
+    warehouse_tagging_assistant.py. The stand-in fetches usage with one
+    statement whichever usage source is configured.
+    '''
+    return {
+        'warehouses': 'show warehouses',
+        'tag_inventory': constants.WAREHOUSE_TAG_INVENTORY_SQL,
+        'usage': constants.USAGE_AGGREGATE_SQL,
+        'schedule_tasks': sql_builder.get_schedule_tasks_sql(selected_wh),
+        'timezone': constants.TIMEZONE_PARAMETER_SQL,
+        'tags': constants.TAG_LIST_SQL,
+        'current_tag_value': sql_builder.get_current_tag_value_sql(selected_tag, selected_wh),
+        'tag_values': constants.TAG_VALUE_INDEX_SQL,
+        'chargeback': sql_builder.get_chargeback_sql(selected_tag)
+        }
+
+def render_page_queries_concurrent(session, selected_wh, view=None):
+    '''
+    Same statements as render_page_queries, submitted up front through a
+    QueryScheduler the way warehouse_tagging_assistant.schedule_page_queries
+    does. If view is given, only that view's dependencies are run.
+    '''
+    run_sql = lambda sql: session.sql(sql).collect()
+    page_statements = get_page_statements(selected_wh)
+    job_names = constants.VIEW_DEPENDENCIES[view] if view else page_statements.keys()
+    scheduler = query_scheduler.QueryScheduler()
+    for name in job_names:
+        scheduler.submit(name, None, run_sql, page_statements[name])
+    scheduler.wait()
+    if 'warehouses' in job_names:
+        return warehouse_catalog.get_catalog(scheduler.get('warehouses', None, run_sql, 'show warehouses')
+                                            ,scheduler.get('tag_inventory', None, run_sql, constants.WAREHOUSE_TAG_INVENTORY_SQL))
+    return {}
+
+def benchmark_view_renders(warehouse_count, latency_seconds=0.0):
+    '''
+    Round trips and seconds for rendering each view on its own.
+    '''
+    session = session_backend.StandInSession(warehouse_count=warehouse_count, latency_seconds=latency_seconds)
+    results = {}
+    for view in constants.VIEW_DEPENDENCIES.keys():
+        session.round_trips = 0
+        start = perf_counter()
+        render_page_queries_concurrent(session, session.warehouse_names[0], view)
+        results[view] = {'round_trips': session.round_trips, 'seconds': round(perf_counter() - start, 4)}
+    session.close()
+    return {'warehouses': warehouse_count, 'latency_ms': round(latency_seconds * 1000), 'views': results}
+
+def benchmark_page_render(warehouse_count, latency_seconds=0.0, repeats=BENCHMARK_REPEATS, concurrent=False):
+    '''
+    Renders the page workload repeats times against a stand-in of the
+    given size and returns round trips per render and latency stats.
+    '''
+    session = session_backend.StandInSession(warehouse_count=warehouse_count, latency_seconds=latency_seconds)
+    timings = []
+    for i in range(repeats):
+        session.round_trips = 0
+        start = perf_counter()
+        if concurrent:
+            wh_catalog = render_page_queries_concurrent(session, session.warehouse_names[0])
+        else:
+            wh_catalog = render_page_queries(session, session.warehouse_names[0])
+        timings.append(perf_counter() - start)
+    assert len(wh_catalog) == warehouse_count
+    session.close()
+    return {
+        'warehouses': warehouse_count,
+        'concurrent': concurrent,
+        'latency_ms': round(latency_seconds * 1000),
+        'round_trips': session.round_trips,
+        'median_seconds': round(statistics.median(timings), 4),
+        'max_seconds': round(max(timings), 4)
+        }
+
+if __name__ == '__main__':
+    latency_seconds = 0.0
+    if len(sys.argv) > 1:
+        latency_seconds = int(sys.argv[1]) / 1000
+
+    # The warehouse lookup must stay at a fixed number of round trips no
+    # matter how many warehouses exist in the account.
+    max_lookup_round_trips = 2
+    is_ok = True
+    for warehouse_count in BENCHMARK_SCALES:
+        session = session_backend.StandInSession(warehouse_count=warehouse_count, active_ratio=0)
+        warehouse_catalog.load_catalog(lambda sql: session.sql(sql).collect())
+        if session.round_trips > max_lookup_round_trips:
+            print('Warehouse lookup regressed to ' + str(session.round_trips) + ' round trips', file=sys.stderr)
+            is_ok = False
+        session.close()
+
+        print(json.dumps(benchmark_page_render(warehouse_count, latency_seconds)))
+        print(json.dumps(benchmark_page_render(warehouse_count, latency_seconds, concurrent=True)))
+        print(json.dumps(benchmark_view_renders(warehouse_count, latency_seconds)))
+
+    sys.exit(0 if is_ok else 1)
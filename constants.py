@@ -19,13 +19,13 @@ Try these steps:
   - The Account URL may require special formatting for regions outside of 
     AWS us-west-2
   - For Accounts in AWS US-East-1, try xyz12345.us-east-1
-3. Go to the Warehouses tab, select an existing warehouse and choose "Enable 
+3. Go to the Warehouses view, select an existing warehouse and choose "Enable 
    Assistant"
   - There is also a space here to create a new warehouse.
 4. Modify the warehouse with whatever settings might be best.
-5. Go to the Tags tab, and create some tags. Useful tags might include 
+5. Go to the Tags view, and create some tags. Useful tags might include 
    `department` or `consumer`.
-6. Now that tags are created, go to the Apply Tags tab and apply tag 
+6. Now that tags are created, go to the Apply Tags view and apply tag 
    values to a warehouse. You might set a warehouse `department` tag 
    value to "Accounting" or something along those lines.
 '''
@@ -44,7 +44,7 @@ by a provider who did not incur that cost in the first place.
 If there are issues running this app, try doing a hard refresh or using 
 the _**Reset Session**_ button under _**Additional Options**_. If issues 
 persist when it may have worked in the past, try running the Preinstallation 
-script on the Authentication tab. Something may have changed since the last 
+script on the Authentication view. Something may have changed since the last 
 time you ran the app!
 '''
 
@@ -60,10 +60,48 @@ DEFAULT_TIMEZONE = 'America/Los_Angeles'
 
 DEFAULT_CRON = '0 0 * * *' # Daily at midnight
 
+# 'snowpark' for a live account, 'standin' for the local SQLite stand-in. See session_backend.py
+DEFAULT_SESSION_BACKEND = 'snowpark'
+
+# Shared session pool, see session_pool.py
+SESSION_POOL_MAX_SIZE = 10
+
+SESSION_POOL_IDLE_SECONDS = 1800
+
+SESSION_POOL_KEEPALIVE_SECONDS = 300
+
+# A lease not checked out or heartbeated for this long is closed, see session_pool.py
+SESSION_POOL_LEASE_SECONDS = 600
+
+SESSION_POOL_CHECKOUT_TIMEOUT_SECONDS = 30
+
+# Extra sessions opened on connect for the query scheduler's workers, so concurrent queries don't share one session
+SESSION_POOL_WORKER_SESSIONS = 3
+
 DISK_CACHE_MAX_AGE_SECONDS = 600
 
 MEMORY_CACHE_MAX_AGE_SECONDS = 600
 
+# Rows fetched per batch when a result is streamed instead of collected (see result_stream.py)
+STREAM_BATCH_ROWS = 100000
+
+# Largest streamed result kept as a DataFrame, in rows and in bytes of memory
+STREAM_MAX_ROWS = 5000000
+
+STREAM_MAX_BYTES = 512 * 1024 * 1024
+
+# Rows of usage detail shown in the usage table
+USAGE_DETAIL_MAX_ROWS = 10000
+
+# Where persisted query results are kept, see result_cache.py
+RESULT_CACHE_DIR = '.result_cache'
+
+# Disk space persisted query results may take up before the least recently used are evicted, see disk_cache.py
+RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Memory cached query results may take up before the least recently used are dropped, see result_cache.py. At least STREAM_MAX_BYTES, so any streamed result fits
+RESULT_CACHE_MAX_MEMORY_BYTES = 1024 * 1024 * 1024
+
 # 1 second, 1 minute, 5 minutes, 10 minutes, 30 minutes, 1 hour, 2 hours, 4 hours, 8 hours, 12 hours, never suspend
 WAREHOUSE_AUTO_SUSPEND_STEPS = [1, 60, 300, 600, 1800, 3600, 7200, 14400, 28800, 43200, 0]
 
@@ -92,13 +130,142 @@ def REVERSE_WAREHOUSE_SIZES():
     return_dict[WAREHOUSE_SIZES[key]['code']] = key
   return return_dict
 
+# Computed once at import, for lookups inside loops.
+WAREHOUSE_CODE_LIST = GET_WAREHOUSE_CODE_LIST()
+
+WAREHOUSE_CODE_INDEX = dict((code, i) for i, code in enumerate(WAREHOUSE_CODE_LIST))
+
+WAREHOUSE_SIZE_BY_CODE = REVERSE_WAREHOUSE_SIZES()
+
 COMMENT_MAX_LENGTH = 500
 
-SUGGESTED_VALUE_SQL = '''-- Get a list of existing values for this tag
-select nvl(listagg(distinct tag_value, ', ') within group (order by tag_value), '') as suggested_values
+TAG_VALUE_INDEX_SQL = '''-- Get every value of every assistant tag on warehouses, with the number of warehouses set to it, in one pass
+select tag_name, tag_value, count(*) as object_count
   from snowflake.account_usage.tag_references
+ where tag_database = 'TAGGING_ASSIST_DB'
+   and tag_schema = 'TAGGING'
+   and domain = 'WAREHOUSE'
+   and object_deleted is null
+ group by tag_name, tag_value
+'''
+
+# tag_references lags by up to 3 hours, so the tag value index is only fetched again after this long.
+TAG_VALUE_INDEX_MAX_AGE_SECONDS = 3600
+
+# Existing values offered for the Tag Value input of the Apply Tags view
+TAG_SUGGESTION_LIMIT = 20
+
+TAG_LIST_SQL = 'show tags in tagging_assist_db.tagging'
+
+TIMEZONE_PARAMETER_SQL = "show parameters like 'timezone'"
+
+# 'tasks' creates one Snowflake task per schedule. 'dispatcher' keeps schedules in the 
+# scheduling.warehouse_schedules table, evaluated by one dispatcher task for all warehouses. 
+# See snowflake_pre_script.sql
+SCHEDULING_ENGINE = 'tasks'
+
+# Schedule table rows, shaped like the output of show tasks so either engine can be displayed the same way.
+SCHEDULE_TABLE_SQL = '''-- Get the schedules of the dispatcher engine
+select 'resize_' || warehouse_name || '_schedule_' || schedule_index as "name"
+      ,'USING CRON ' || cron || ' ' || timezone as "schedule"
+      ,'alter warehouse ' || warehouse_name || ' set warehouse_size = ' || warehouse_size as "definition"
+      ,iff(enabled, 'started', 'suspended') as "state"
+  from tagging_assist_db.scheduling.warehouse_schedules
 '''
 
+# Views of the app, and the named page queries each one needs. Only the active view's 
+# queries are run. See schedule_page_queries() in warehouse_tagging_assistant.py
+VIEW_DEPENDENCIES = {
+    'Authentication': [],
+    'Warehouses': ['warehouses', 'tag_inventory', 'timezone', 'usage', 'schedule_tasks'],
+    'Tags': ['tags'],
+    'Apply Tags': ['warehouses', 'tag_inventory', 'tags', 'current_tag_value', 'tag_values'],
+    'Chargeback': ['tags', 'chargeback'],
+    }
+
+# Warehouses per page of the warehouse picker. Only one page is sent to the browser.
+WAREHOUSE_PICKER_PAGE_SIZE = 50
+
+# Worker threads used to run a rerun's independent queries concurrently
+QUERY_SCHEDULER_MAX_WORKERS = 8
+
+WAREHOUSE_TAG_INVENTORY_SQL = '''-- Get assistant tag assignments for every warehouse in one pass
+select warehouse_name, assistant_enabled, tag_assignments
+  from tagging_assist_db.metadata.warehouse_applied_tags
+'''
+
+# Warehouse name used for account-wide usage aggregates
+ACCOUNT_USAGE_KEY = '<account>'
+
+# Average hourly credits by day of week and by hour of day, both per warehouse 
+# and account-wide (ACCOUNT_USAGE_KEY warehouse_name), computed in Snowflake.
+USAGE_AGGREGATE_SQL = '''-- Aggregate warehouse usage by day of week and hour of day
+with usage as (
+    select warehouse_name, start_day_name, start_hour, round(credits_used, 2) as credits_used
+      from tagging_assist_db.metadata.warehouse_usage_last_month
+     where start_time is not null
+    )
+select warehouse_name, 'day' as aggregate_by, start_day_name as aggregate_key, avg(credits_used)::float as credits_used
+  from usage group by 1, 3
+union all
+select warehouse_name, 'hour', start_hour, avg(credits_used)::float
+  from usage group by 1, 3
+union all
+select ''' + "'" + ACCOUNT_USAGE_KEY + "'" + ''', 'day', start_day_name, avg(credits_used)::float
+  from usage group by 3
+union all
+select ''' + "'" + ACCOUNT_USAGE_KEY + "'" + ''', 'hour', start_hour, avg(credits_used)::float
+  from usage group by 3
+'''
+
+USAGE_INCREMENTAL_SQL = '''-- Hourly metering rows for the local usage store
+select warehouse_name, start_time, credits_used
+  from snowflake.account_usage.warehouse_metering_history
+'''
+
+# 'store' serves usage charts from the local incremental usage store (see usage_store.py), 
+# 'server' aggregates the warehouse_usage_last_month view in Snowflake on every cache miss.
+USAGE_SOURCE = 'store'
+
+USAGE_STORE_DIR = '.usage_store'
+
+USAGE_STORE_WINDOW_DAYS = 30
+
+# account_usage can revise recent hours, so they are re-read on each refresh.
+USAGE_STORE_LATE_ARRIVAL_HOURS = 6
+
+USAGE_DETAIL_SQL = '''-- Hourly usage rows for one warehouse
+select warehouse_name, start_time, start_day_name, start_hour, round(credits_used, 2)::float as credits_used
+  from tagging_assist_db.metadata.warehouse_usage_last_month
+'''
+
+QUERY_INTERVAL_SQL = '''-- Query start and end times of one warehouse, for the auto suspend simulator
+select date_part(epoch_millisecond, start_time) as start_ms
+      ,date_part(epoch_millisecond, end_time) as end_ms
+  from snowflake.account_usage.query_history
+'''
+
+CHARGEBACK_SQL = '''-- Daily credits by value of one tag, from the hourly rollup tables
+select nvl(t.tag_value, '<none set>') as tag_value
+      ,to_date(u.start_time) as usage_date
+      ,sum(u.credits_used)::float as credits_used
+  from tagging_assist_db.metadata.warehouse_usage_hourly u
+  left join tagging_assist_db.metadata.warehouse_tag_usage_hourly t
+    on t.warehouse_name = u.warehouse_name
+   and t.start_time = u.start_time
+'''
+
+# Periods offered by the chargeback view, in days
+CHARGEBACK_DAY_OPTIONS = [7, 30, 90]
+
+CHARGEBACK_DEFAULT_DAYS = 30
+
+# Days of query history replayed by the auto suspend simulator (see suspend_simulator.py)
+SUSPEND_SIMULATION_DAYS = 14
+
+# Days of query and load history analyzed by the right-sizing advisor (see sizing_advisor.py)
+SIZING_ANALYSIS_DAYS = 28
+
 CRON_HELP_TEXT = ''' 
 Cron strings are formatted as 5 parts separated by a space. 
 In order, each of the 5 parts refers to: minute, hour, day 
@@ -0,0 +1,319 @@
+'''
+Cron timeline engine. Compiles a warehouse's resize schedules (cron
+string, timezone and size, as the save procedures take them) into the
+minutes they fire at over a week or a month. From these it resolves
+the size the warehouse is at every minute, finds schedules that
+conflict with another one or change nothing, and projects the credits
+the sizes would use.
+
+Cron fields are read the way the dispatcher procedure in
+snowflake_pre_script.sql reads them: lists, ranges, steps, month and
+day names, 0 or 7 for Sunday, and either day field matching when both
+are restricted. When schedules fire in the same minute the one with
+the highest index wins, as in the dispatcher. Compiled fields, local
+clocks and fire minutes are memoized, so a schedule shared by many
+warehouses, or unchanged between reruns, is only expanded once.
+
+pandas is only imported by the functions that convert timezones or
+build DataFrames, so importing this module (e.g. through
+warehouse_plan in the CLI) doesn't load it.
+'''
+import functools
+from datetime import datetime, timezone
+import numpy as np
+import constants
+
+WEEK_MINUTES = 7 * 24 * 60
+
+MONTH_MINUTES = 30 * 24 * 60
+
+DAY_NAMES = {'sun': 0, 'mon': 1, 'tue': 2, 'wed': 3, 'thu': 4, 'fri': 5, 'sat': 6}
+
+MONTH_NAMES = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+
+# (name, lowest value, highest value, names) of each cron field, in order.
+CRON_FIELDS = [
+    ('minute', 0, 59, None),
+    ('hour', 0, 23, None),
+    ('day', 1, 31, None),
+    ('month', 1, 12, MONTH_NAMES),
+    ('day of week', 0, 7, DAY_NAMES)
+    ]
+
+# Credits per hour of each size, indexed like constants.WAREHOUSE_CODE_LIST.
+SIZE_CREDIT_RATES = np.array([constants.WAREHOUSE_SIZES[constants.WAREHOUSE_SIZE_BY_CODE[code]]['credit_rate'] for code in constants.WAREHOUSE_CODE_LIST], dtype='float64')
+
+CALENDAR_DAY_NAMES = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+def _to_number(token, names=None):
+    if names and token in names:
+        return names[token]
+    if not token.isdigit():
+        raise ValueError('Invalid CRON value: ' + token)
+    return int(token)
+
+def compile_field(field, lowest, highest, names=None):
+    '''
+    Returns a boolean array, indexed by value, of the values a cron
+    field matches. Raises ValueError if the field is invalid.
+    '''
+    mask = np.zeros(highest + 1, dtype=bool)
+    for part in field.lower().split(','):
+        range_part, step = part, 1
+        if '/' in part:
+            range_part, step_text = part.split('/', 1)
+            step = _to_number(step_text)
+            if step < 1:
+                raise ValueError('Invalid CRON step: ' + part)
+        if range_part in ('*', '?'):
+            low, high = lowest, highest
+        else:
+            bounds = range_part.split('-')
+            if len(bounds) > 2:
+                raise ValueError('Invalid CRON range: ' + part)
+            low = _to_number(bounds[0], names)
+            # A single value with a step runs to the end of the range, e.g. 5/15.
+            high = _to_number(bounds[1], names) if len(bounds) == 2 else (highest if '/' in part else low)
+        if low < lowest or high > highest or low > high:
+            raise ValueError('CRON value out of range: ' + part)
+        mask[low:high + 1:step] = True
+    return mask
+
+@functools.lru_cache(maxsize=1024)
+def compile_cron(cron):
+    '''
+    Returns the (minute, hour, day, month, day of week) masks of a cron
+    string and whether each day field is restricted. Raises ValueError
+    if the string is invalid.
+    '''
+    fields = cron.split()
+    if len(fields) != 5:
+        raise ValueError('Invalid CRON schedule: ' + cron)
+    masks = [compile_field(field, lowest, highest, names) for field, (name, lowest, highest, names) in zip(fields, CRON_FIELDS)]
+    # 7 is Sunday too.
+    masks[4][0] |= masks[4][7]
+    masks[4] = masks[4][:7]
+    for mask in masks:
+        mask.flags.writeable = False
+    return tuple(masks) + (fields[2] not in ('*', '?'), fields[4] not in ('*', '?'))
+
+@functools.lru_cache(maxsize=64)
+def get_local_clock(local_timezone, start_minute, minutes):
+    '''
+    Returns the local (minute, hour, day, month, day of week) of each
+    minute from start_minute (minutes since the epoch, UTC) on, as a
+    tuple of arrays. Sunday is day of week 0. Raises ValueError for an
+    unknown timezone.
+    '''
+    import pandas as pd
+    utc_times = pd.DatetimeIndex(pd.to_datetime((start_minute + np.arange(minutes, dtype='int64')) * 60, unit='s', utc=True))
+    try:
+        local_times = utc_times.tz_convert(local_timezone)
+    except Exception:
+        raise ValueError('Unknown timezone: ' + str(local_timezone))
+    clock = (
+        np.asarray(local_times.minute, dtype='int8'),
+        np.asarray(local_times.hour, dtype='int8'),
+        np.asarray(local_times.day, dtype='int8'),
+        np.asarray(local_times.month, dtype='int8'),
+        ((np.asarray(local_times.dayofweek) + 1) % 7).astype('int8')
+        )
+    for values in clock:
+        values.flags.writeable = False
+    return clock
+
+@functools.lru_cache(maxsize=4096)
+def get_fire_minutes(cron, local_timezone, start_minute, minutes):
+    '''
+    Returns the offsets from start_minute of the minutes at which a cron
+    schedule in a timezone fires, as a sorted array.
+    '''
+    minute_mask, hour_mask, day_mask, month_mask, day_of_week_mask, day_restricted, day_of_week_restricted = compile_cron(cron)
+    minute, hour, day, month, day_of_week = get_local_clock(local_timezone, start_minute, minutes)
+    fires = minute_mask[minute] & hour_mask[hour] & month_mask[month]
+    if day_restricted and day_of_week_restricted:
+        fires &= day_mask[day] | day_of_week_mask[day_of_week]
+    else:
+        fires &= day_mask[day] & day_of_week_mask[day_of_week]
+    fire_minutes = np.flatnonzero(fires).astype('int32')
+    fire_minutes.flags.writeable = False
+    return fire_minutes
+
+def get_week_start(local_timezone=constants.DEFAULT_TIMEZONE, now=None):
+    '''
+    Returns the minute since the epoch of the latest Sunday 00:00 in the
+    timezone, where calendar weeks start.
+    '''
+    import pandas as pd
+    local_now = pd.Timestamp(now or datetime.now(timezone.utc)).tz_convert(local_timezone)
+    local_start = (local_now - pd.Timedelta(days=(local_now.dayofweek + 1) % 7)).normalize()
+    return int(local_start.tz_convert('UTC').timestamp()) // 60
+
+def _get_size_index(size):
+    size_code = constants.WAREHOUSE_SIZES[size]['code'] if size in constants.WAREHOUSE_SIZES else str(size).lower()
+    if size_code not in constants.WAREHOUSE_CODE_INDEX:
+        raise ValueError('Unknown warehouse size: ' + str(size))
+    return constants.WAREHOUSE_CODE_INDEX[size_code]
+
+def _resolve_changes(event_minutes, event_orders, event_sizes):
+    # Minutes at which the size changes hands and the size set then. Sizes
+    # only change when a schedule fires, so the timeline is kept as these
+    # change points. Of schedules firing together the highest index wins.
+    order = np.lexsort((event_orders, event_minutes))
+    event_minutes, event_sizes = event_minutes[order], event_sizes[order]
+    is_last = np.append(event_minutes[1:] != event_minutes[:-1], True)[:len(event_minutes)]
+    return event_minutes[is_last], event_sizes[is_last]
+
+def _get_sizes_at(change_minutes, change_sizes, minutes, initial_size):
+    # The size in effect at each of minutes, carried forward from the last change.
+    positions = np.searchsorted(change_minutes, minutes, side='right') - 1
+    if len(change_minutes) == 0:
+        return np.full(len(minutes), initial_size, dtype='int8')
+    return np.where(positions >= 0, change_sizes[np.maximum(positions, 0)], initial_size).astype('int8')
+
+class ScheduleTimeline():
+    '''
+    schedules: [{index, size, cron, tz}], size a code or a size name.
+    start_minute: minutes since the epoch the timeline starts at, see get_week_start.
+    minutes: length of the timeline, e.g. WEEK_MINUTES or MONTH_MINUTES.
+    initial_size: size the warehouse is at if no schedule fired before the start, a code or size name.
+
+    Schedules are also expanded over the period before the start, so
+    the size at the start is the one the last earlier schedule set.
+    Schedules that can't be compiled are left out and listed in errors.
+    '''
+    def __init__(self, schedules, start_minute, minutes=WEEK_MINUTES, initial_size=None):
+        self.start_minute = start_minute
+        self.minutes = minutes
+        self.initial_size = _get_size_index(initial_size) if initial_size else -1
+        self.errors = {}
+
+        self.schedules = []
+        event_minutes = []
+        for schedule in sorted(schedules, key=lambda schedule: schedule['index']):
+            try:
+                size_index = _get_size_index(schedule['size'])
+                event_minutes.append(get_fire_minutes(' '.join(schedule['cron'].split()), schedule['tz'], start_minute - minutes, minutes * 2))
+            except (ValueError, KeyError) as err:
+                self.errors[schedule['index']] = str(err)
+                continue
+            self.schedules.append(dict(schedule, size_index=size_index))
+
+        # One event per fire, offsets counted from the start of the period before.
+        self.event_minutes = np.concatenate(event_minutes or [np.empty(0, dtype='int32')])
+        self.event_orders = np.repeat(np.arange(len(self.schedules)), [len(fire_minutes) for fire_minutes in event_minutes]).astype('int64')
+        self.size_indexes = np.array([schedule['size_index'] for schedule in self.schedules], dtype='int8')
+        self.event_sizes = self.size_indexes[self.event_orders]
+        self.change_minutes, self.change_sizes = _resolve_changes(self.event_minutes, self.event_orders, self.event_sizes)
+        self.sizes = _get_sizes_at(self.change_minutes, self.change_sizes, np.arange(minutes, minutes * 2), self.initial_size)
+
+    def get_conflicts(self):
+        '''
+        Returns the pairs of schedules that fire in the same minute with
+        different sizes, as {'indexes', 'minutes', 'first_minute'}. The
+        dispatcher applies the higher index, separate tasks race.
+        '''
+        in_window = self.event_minutes >= self.minutes
+        order = np.lexsort((self.event_orders[in_window], self.event_minutes[in_window]))
+        window_minutes, window_orders = self.event_minutes[in_window][order], self.event_orders[in_window][order]
+        # Events are sorted by minute, then schedule. A schedule fires at most once a minute, so the
+        # schedules firing together are a run of at most len(self.schedules) events, and every pair
+        # in a run is an event and one of the next few after it.
+        firsts, seconds, pair_minutes = [], [], []
+        for distance in range(1, len(self.schedules)):
+            together = window_minutes[distance:] == window_minutes[:-distance]
+            if not together.any():
+                break
+            first, second = window_orders[:-distance][together], window_orders[distance:][together]
+            differ = self.size_indexes[first] != self.size_indexes[second]
+            firsts.append(first[differ])
+            seconds.append(second[differ])
+            pair_minutes.append(window_minutes[distance:][together][differ])
+        if not sum(len(first) for first in firsts):
+            return []
+
+        # Group the fires by pair. Pair keys are small integers, which a stable sort orders in linear time.
+        pair_keys = (np.concatenate(firsts) * len(self.schedules) + np.concatenate(seconds)).astype(np.min_scalar_type(len(self.schedules) ** 2))
+        order = np.argsort(pair_keys, kind='stable')
+        pair_keys, pair_minutes = pair_keys[order], np.concatenate(pair_minutes)[order]
+        starts = np.flatnonzero(np.append(True, pair_keys[1:] != pair_keys[:-1]))
+        counts = np.diff(np.append(starts, len(pair_keys)))
+        first_minutes = np.minimum.reduceat(pair_minutes, starts)
+        return [{
+            'indexes': (self.schedules[int(key) // len(self.schedules)]['index'], self.schedules[int(key) % len(self.schedules)]['index']),
+            'minutes': int(count),
+            'first_minute': self.start_minute + int(first_minute) - self.minutes
+            } for key, count, first_minute in zip(pair_keys[starts], counts, first_minutes)]
+
+    def get_redundant(self):
+        '''
+        Returns {index: reason} for the schedules that never fire in the
+        timeline, or whose removal would leave every minute's size as it is.
+        '''
+        # Two timelines are the same if they agree at the start and at every change point.
+        check_minutes = np.unique(np.append(self.event_minutes[self.event_minutes >= self.minutes], self.minutes))
+        sizes = _get_sizes_at(self.change_minutes, self.change_sizes, check_minutes, self.initial_size)
+        redundant = {}
+        for i, schedule in enumerate(self.schedules):
+            is_other = self.event_orders != i
+            if is_other[self.event_minutes >= self.minutes].all():
+                redundant[schedule['index']] = 'never runs in this period'
+                continue
+            change_minutes, change_sizes = _resolve_changes(self.event_minutes[is_other], self.event_orders[is_other], self.event_sizes[is_other])
+            if np.array_equal(_get_sizes_at(change_minutes, change_sizes, check_minutes, self.initial_size), sizes):
+                redundant[schedule['index']] = 'never changes the size'
+        return redundant
+
+    def get_warnings(self, local_timezone=constants.DEFAULT_TIMEZONE):
+        '''
+        Returns the errors, conflicts and redundant schedules as messages.
+        '''
+        warnings = ['Schedule ' + str(index) + ' can\'t be previewed: ' + error for index, error in self.errors.items()]
+        for conflict in self.get_conflicts():
+            warnings.append('Schedules ' + str(conflict['indexes'][0]) + ' and ' + str(conflict['indexes'][1]) + ' set different sizes at the same time '
+                            + str(conflict['minutes']) + ' time(s), first ' + format_minute(conflict['first_minute'], local_timezone))
+        for index, reason in self.get_redundant().items():
+            warnings.append('Schedule ' + str(index) + ' ' + reason)
+        return warnings
+
+    def get_size_minutes(self):
+        '''
+        Returns {size name: minutes} over the timeline.
+        '''
+        counts = np.bincount(self.sizes[self.sizes >= 0], minlength=len(constants.WAREHOUSE_CODE_LIST))
+        return dict((constants.WAREHOUSE_SIZE_BY_CODE[code], int(count)) for code, count in zip(constants.WAREHOUSE_CODE_LIST, counts) if count)
+
+    def get_projected_credits(self, active_fractions=None, local_timezone=constants.DEFAULT_TIMEZONE):
+        '''
+        Returns the credits the timeline's sizes would use. active_fractions
+        is a (7, 24) array of the share of each local day and hour the
+        warehouse runs (see usage_cube.UsageCube.get_active_fractions);
+        without it the warehouse is taken to run all the time. Minutes of
+        unknown size count for nothing.
+        '''
+        rates = np.where(self.sizes >= 0, SIZE_CREDIT_RATES[np.maximum(self.sizes, 0)], 0.0) / 60
+        if active_fractions is None:
+            return float(rates.sum())
+        minute, hour, day, month, day_of_week = get_local_clock(local_timezone, self.start_minute, self.minutes)
+        return float((rates * np.asarray(active_fractions)[day_of_week, hour]).sum())
+
+    def get_calendar(self, local_timezone=constants.DEFAULT_TIMEZONE):
+        '''
+        Returns the size of each local day and hour as a DataFrame of days
+        by hours, the largest one where the size changes within the hour.
+        Over more than a week, the largest of all weeks is shown.
+        '''
+        import pandas as pd
+        minute, hour, day, month, day_of_week = get_local_clock(local_timezone, self.start_minute, self.minutes)
+        grid = np.full(7 * 24, -1, dtype='int8')
+        np.maximum.at(grid, day_of_week.astype('int64') * 24 + hour, self.sizes)
+        size_names = [constants.WAREHOUSE_SIZE_BY_CODE[code] for code in constants.WAREHOUSE_CODE_LIST]
+        labels = [size_names[index] if index >= 0 else '' for index in grid]
+        return pd.DataFrame(np.array(labels).reshape(7, 24), index=CALENDAR_DAY_NAMES, columns=[str(hour).zfill(2) for hour in range(24)])
+
+def format_minute(epoch_minute, local_timezone=constants.DEFAULT_TIMEZONE):
+    import pandas as pd
+    return pd.Timestamp(epoch_minute * 60, unit='s', tz='UTC').tz_convert(local_timezone).strftime('%a %Y-%m-%d %H:%M')
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,195 @@
+'''
+Size-capped disk cache of query results, the persistent tier behind
+result_cache.ResultCache. Results are keyed by account, data set name
+and statement.
+
+DataFrames are written as uncompressed Arrow IPC files and read back
+through a memory map, so numeric columns are loaded into pandas
+without copying. Results Arrow can't hold (e.g. lists of Snowpark
+rows) are pickled. Once the files are over the byte budget the least
+recently used are evicted. File modification times record last use,
+so the order survives a restart.
+'''
+import os, glob, json, hashlib, pickle, threading
+from time import time
+import pandas as pd
+import pyarrow as pa
+import constants
+
+ARROW_EXTENSION = '.arrow'
+
+PICKLE_EXTENSION = '.pickle'
+
+# Schema metadata field holding the key, fetch time and DataFrame attrs of an Arrow file.
+METADATA_FIELD = b'result_cache'
+
+def _digest(text, length):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:length]
+
+class DiskCache():
+    '''
+    cache_dir: where the files are written, see constants.RESULT_CACHE_DIR.
+    max_bytes: budget for all files, see constants.RESULT_CACHE_MAX_BYTES.
+    '''
+    def __init__(self, cache_dir=constants.RESULT_CACHE_DIR, max_bytes=constants.RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # path -> [bytes, last used]
+        self.files = {}
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'expired': 0}
+        self._scan()
+
+    def _scan(self):
+        for path in glob.glob(os.path.join(self.cache_dir, '*')):
+            if path.endswith('.tmp'):
+                # Left over from a write that didn't finish.
+                self._delete(path)
+            elif path.endswith((ARROW_EXTENSION, PICKLE_EXTENSION)):
+                file_stat = os.stat(path)
+                self.files[path] = [file_stat.st_size, file_stat.st_mtime]
+
+    def _get_prefix(self, account, name=None):
+        # Files of one account, and of one data set, share a prefix, so they can be found without reading them.
+        return _digest(account, 12) + '_' + (_digest(name, 12) + '_' if name is not None else '')
+
+    def _get_base_path(self, key):
+        return os.path.join(self.cache_dir, self._get_prefix(key[0], key[1]) + _digest(key[2], 32))
+
+    def _delete(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self.files.pop(path, None)
+
+    def _read_arrow(self, path):
+        # The DataFrame's columns stay backed by the mapped file where pandas allows it.
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        stored = json.loads(table.schema.metadata[METADATA_FIELD])
+        value = table.to_pandas(split_blocks=True)
+        value.attrs.update(stored['attrs'])
+        return tuple(stored['key']), value, stored['fetched_at']
+
+    def _read_pickle(self, path):
+        with open(path, 'rb') as f:
+            stored = pickle.load(f)
+        return stored['key'], stored['rows'], stored['fetched_at']
+
+    def read(self, key, ttl):
+        '''
+        Returns (value, fetched_at) for the key, or None if there is no
+        file for it or the file is older than ttl seconds.
+        '''
+        base_path = self._get_base_path(key)
+        with self.lock:
+            for extension, read_file in ((ARROW_EXTENSION, self._read_arrow), (PICKLE_EXTENSION, self._read_pickle)):
+                path = base_path + extension
+                if path not in self.files:
+                    continue
+                try:
+                    stored_key, value, fetched_at = read_file(path)
+                except Exception:
+                    self._delete(path)
+                    continue
+                if stored_key != key:
+                    continue
+                if time() - fetched_at >= ttl:
+                    self._delete(path)
+                    self.stats['expired'] += 1
+                    continue
+                self.files[path][1] = time()
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                self.stats['hits'] += 1
+                return value, fetched_at
+            self.stats['misses'] += 1
+            return None
+
+    def _write_file(self, path, key, value, fetched_at):
+        # Write to a temp file first so readers never see a partial file.
+        temp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            if path.endswith(ARROW_EXTENSION):
+                table = pa.Table.from_pandas(value, preserve_index=False)
+                metadata = dict(table.schema.metadata or {})
+                metadata[METADATA_FIELD] = json.dumps({'key': key, 'fetched_at': fetched_at, 'attrs': value.attrs})
+                table = table.replace_schema_metadata(metadata)
+                with pa.OSFile(temp_path, 'wb') as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            else:
+                with open(temp_path, 'wb') as f:
+                    pickle.dump({'key': key, 'rows': value, 'fetched_at': fetched_at}, f)
+            os.replace(temp_path, path)
+        except Exception:
+            self._delete(temp_path)
+            raise
+
+    def write(self, key, value, fetched_at):
+        '''
+        Stores a result, as Arrow if it is a DataFrame Arrow can hold,
+        otherwise pickled, then evicts files until the cache fits the
+        budget. A result larger than the whole budget is not kept.
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        base_path = self._get_base_path(key)
+        with self.lock:
+            path = None
+            if isinstance(value, pd.DataFrame):
+                try:
+                    path = base_path + ARROW_EXTENSION
+                    self._write_file(path, key, value, fetched_at)
+                except (pa.ArrowException, TypeError, ValueError):
+                    # e.g. object columns of mixed types
+                    path = None
+            if path is None:
+                path = base_path + PICKLE_EXTENSION
+                self._write_file(path, key, value, fetched_at)
+            for other_path in (base_path + ARROW_EXTENSION, base_path + PICKLE_EXTENSION):
+                if other_path != path and other_path in self.files:
+                    self._delete(other_path)
+            self.files[path] = [os.path.getsize(path), time()]
+            self.stats['writes'] += 1
+            self._evict()
+
+    def _evict(self):
+        total_bytes = sum(size for size, last_used in self.files.values())
+        for path in sorted(self.files.keys(), key=lambda path: self.files[path][1]):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= self.files[path][0]
+            self._delete(path)
+            self.stats['evictions'] += 1
+
+    def remove(self, key):
+        base_path = self._get_base_path(key)
+        with self.lock:
+            self._delete(base_path + ARROW_EXTENSION)
+            self._delete(base_path + PICKLE_EXTENSION)
+
+    def remove_matching(self, account, name=None, keep_keys=()):
+        '''
+        Removes the files of an account, optionally only those of one
+        data set, except the files of keep_keys.
+        '''
+        prefix = os.path.join(self.cache_dir, self._get_prefix(account, name))
+        keep_paths = [self._get_base_path(key) + extension for key in keep_keys for extension in (ARROW_EXTENSION, PICKLE_EXTENSION)]
+        with self.lock:
+            for path in list(self.files.keys()):
+                if path.startswith(prefix) and path not in keep_paths:
+                    self._delete(path)
+
+    def status(self):
+        with self.lock:
+            return {
+                'files': len(self.files),
+                'bytes': sum(size for size, last_used in self.files.values()),
+                'max_bytes': self.max_bytes,
+                'stats': dict(self.stats)
+                }
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,211 @@
+'''
+Query instrumentation for the Tagging Assistant. Every statement the
+app runs goes through QueryLog.execute(), which records a fingerprint,
+wall time, row count, estimated bytes and whether the result was served
+from the memo cache. Records are grouped per rerun for the debug panel,
+written to the 'tagging_assistant.query' logger as JSON, and rolled up
+into process-wide counters that can be exported in OpenMetrics format.
+'''
+import os, re, json, hashlib, logging, threading
+from collections import deque
+from time import perf_counter, time
+
+logger = logging.getLogger('tagging_assistant.query')
+
+# Rows sampled to estimate the size of a result set.
+BYTE_ESTIMATE_SAMPLE_ROWS = 100
+
+# Number of previous reruns kept per browser session.
+RERUN_HISTORY_SIZE = 20
+
+_metric_lock = threading.Lock()
+_metric_totals = {}
+
+def normalize_sql(sql):
+    '''
+    Strips comments and literals from a statement so that statements
+    that differ only by warehouse name, tag name etc. share a fingerprint.
+    '''
+    sql = re.sub('--[^\\n]*', '', sql)
+    sql = re.sub('\\$\\$.*?\\$\\$', '?', sql, flags=re.DOTALL)
+    sql = re.sub("'(?:[^']|'')*'", '?', sql)
+    sql = re.sub('\\b\\d+(\\.\\d+)?\\b', '?', sql)
+    return re.sub('\\s+', ' ', sql).strip().lower()
+
+def fingerprint(sql):
+    '''
+    Returns a short, stable id for the normalized statement.
+    '''
+    return hashlib.md5(normalize_sql(sql).encode('utf-8')).hexdigest()[:12]
+
+def count_rows(rows):
+    '''
+    Returns the number of rows of a row list or DataFrame, or None for
+    other results (e.g. merged intervals or slot sums), whose length is
+    not the number of rows the statement returned.
+    '''
+    if rows is None:
+        return 0
+    if isinstance(rows, list) or hasattr(rows, 'memory_usage'):
+        return len(rows)
+    return None
+
+def estimate_bytes(rows):
+    '''
+    Estimates the size of a result set from a sample of its rows.
+    DataFrames and arrays report their own size. Returns None for other
+    results that are not row lists.
+    '''
+    if hasattr(rows, 'memory_usage'):
+        return int(rows.memory_usage(deep=True).sum())
+    if hasattr(rows, 'nbytes'):
+        return int(rows.nbytes)
+    if rows is None:
+        return 0
+    if not isinstance(rows, list):
+        return None
+    if len(rows) == 0:
+        return 0
+    sample = rows[:BYTE_ESTIMATE_SAMPLE_ROWS]
+    sample_bytes = 0
+    for row in sample:
+        for value in row:
+            sample_bytes += len(str(value))
+    return int(sample_bytes * len(rows) / len(sample))
+
+def _update_metrics(record):
+    key = (record['fingerprint'], record['source'], record['cached'])
+    with _metric_lock:
+        if key not in _metric_totals:
+            _metric_totals[key] = {'statement': record['statement'], 'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0}
+        totals = _metric_totals[key]
+        totals['count'] += 1
+        totals['seconds'] += record['seconds']
+        # Results that are not row lists have no row or byte count to add.
+        totals['rows'] += record['rows'] or 0
+        totals['bytes'] += record['bytes'] or 0
+
+def render_openmetrics():
+    '''
+    Returns the process-wide query counters in OpenMetrics text format.
+    '''
+    metric_names = {
+        'count': ('tagging_assistant_queries', 'Statements executed or served from cache.'),
+        'seconds': ('tagging_assistant_query_seconds', 'Wall time spent on statements.'),
+        'rows': ('tagging_assistant_query_rows', 'Rows returned by statements.'),
+        'bytes': ('tagging_assistant_query_bytes', 'Estimated bytes returned by statements.')
+        }
+    with _metric_lock:
+        totals = dict((key, dict(value)) for key, value in _metric_totals.items())
+
+    lines = []
+    for total_key, (metric_name, metric_help) in metric_names.items():
+        lines.append('# TYPE ' + metric_name + ' counter')
+        lines.append('# HELP ' + metric_name + ' ' + metric_help)
+        for (query_fingerprint, source, cached), value in sorted(totals.items()):
+            labels = 'fingerprint="' + query_fingerprint + '",source="' + source + '",cached="' + str(cached).lower() + '"'
+            lines.append(metric_name + '_total{' + labels + '} ' + str(round(value[total_key], 6)))
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+def write_openmetrics(path):
+    '''
+    Writes the OpenMetrics text to a file, e.g. for the node_exporter
+    textfile collector. Written to a temp file first so scrapers never
+    read a partial file.
+    '''
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(render_openmetrics())
+    os.replace(temp_path, path)
+
+class QueryLog():
+    '''
+    Per browser session log of the statements run during each rerun.
+    '''
+    def __init__(self):
+        self.reruns = deque(maxlen=RERUN_HISTORY_SIZE)
+        self.current = None
+        # Executions per thread, so cache hits are detected correctly when queries run concurrently.
+        self.thread_state = threading.local()
+        self.start_rerun()
+
+    def start_rerun(self):
+        self.current = {'started_at': time(), 'start': perf_counter(), 'queries': []}
+        self.reruns.append(self.current)
+
+    def record(self, sql, seconds, rows, cached, source, started=None, row_count=None):
+        '''
+        Records one statement. row_count overrides the count taken from
+        rows, e.g. for a streamed result that was reduced as it arrived.
+        '''
+        if started is None:
+            started = perf_counter() - seconds
+        record = {
+            'fingerprint': fingerprint(sql),
+            'statement': normalize_sql(sql)[:200],
+            'source': source,
+            'cached': cached,
+            'offset': round(started - self.current['start'], 4),
+            'seconds': round(seconds, 4),
+            'rows': row_count if row_count is not None else count_rows(rows),
+            'bytes': estimate_bytes(rows)
+            }
+        self.current['queries'].append(record)
+        _update_metrics(record)
+        logger.info(json.dumps(record))
+        return record
+
+    def execute(self, session, sql, source='direct'):
+        '''
+        Runs sql on the session, records it and returns the rows.
+        '''
+        started = perf_counter()
+        rows = session.sql(sql).collect()
+        self.thread_state.executions = getattr(self.thread_state, 'executions', 0) + 1
+        self.record(sql, perf_counter() - started, rows, False, source, started)
+        return rows
+
+    def execute_stream(self, session, sql, consume, source='stream'):
+        '''
+        Runs sql on the session and passes the unfetched result to
+        consume, which reads it in batches (see result_stream.py).
+        Records and returns what consume returns.
+        '''
+        started = perf_counter()
+        result = consume(session.sql(sql))
+        self.thread_state.executions = getattr(self.thread_state, 'executions', 0) + 1
+        self.record(sql, perf_counter() - started, result, False, source, started)
+        return result
+
+    def cached(self, cache_function, sql, account, source):
+        '''
+        Calls a memoized function of (sql, account). If the function body
+        did not record an execution, the result came from the cache and
+        is recorded as a hit.
+        '''
+        execution_count = getattr(self.thread_state, 'executions', 0)
+        started = perf_counter()
+        rows = cache_function(sql, account)
+        if getattr(self.thread_state, 'executions', 0) == execution_count:
+            self.record(sql, perf_counter() - started, rows, True, source, started)
+        return rows
+
+    def summary(self):
+        '''
+        Round trips, total query time and cache hit rate of the current rerun.
+        '''
+        queries = self.current['queries']
+        hits = len([query for query in queries if query['cached']])
+        return {
+            'statements': len(queries),
+            'round_trips': len(queries) - hits,
+            'query_seconds': round(sum(query['seconds'] for query in queries), 4),
+            'cache_hit_rate': round(hits / len(queries), 3) if queries else 0.0
+            }
+
+    def slowest(self, n=5):
+        return sorted(self.current['queries'], key=lambda query: query['seconds'], reverse=True)[:n]
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,77 @@
+'''
+Runs independent queries concurrently. At the top of a rerun the app
+submits every statement it expects to need, each under a name and an
+args key describing its inputs (selected warehouse, tag, etc.). The tabs
+then ask for results by name. If the inputs changed since submission, or
+nothing was submitted under that name, the query runs in place instead,
+so a missed prefetch costs no more than the serial path did.
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import constants
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    '''
+    Returns the thread pool shared by all schedulers in this process.
+    '''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=constants.QUERY_SCHEDULER_MAX_WORKERS, thread_name_prefix='query_scheduler')
+        return _executor
+
+class QueryScheduler():
+    '''
+    thread_initializer is called in the worker thread before each job,
+    e.g. to attach the Streamlit script run context so the job can use
+    st.session_state and memoized functions, or to lease a session of
+    its own. thread_finalizer is called after each job, even if it raised.
+    '''
+    def __init__(self, thread_initializer=None, thread_finalizer=None):
+        self.thread_initializer = thread_initializer
+        self.thread_finalizer = thread_finalizer
+        self.jobs = {}
+
+    def _run(self, function, args):
+        if self.thread_initializer:
+            self.thread_initializer()
+        try:
+            return function(*args)
+        finally:
+            if self.thread_finalizer:
+                self.thread_finalizer()
+
+    def submit(self, name, args_key, function, *args):
+        '''
+        Starts function(*args) in the background under name.
+        '''
+        self.jobs[name] = {'args_key': args_key, 'future': get_executor().submit(self._run, function, args)}
+        return self.jobs[name]['future']
+
+    def get(self, name, args_key, function, *args):
+        '''
+        Returns the result of the job submitted under name if it was
+        submitted with the same args_key, otherwise runs function(*args)
+        in place.
+        '''
+        job = self.jobs.get(name)
+        if job and job['args_key'] == args_key:
+            return job['future'].result()
+        return function(*args)
+
+    def wait(self):
+        '''
+        Waits for every submitted job, e.g. before the session is released.
+        Errors are left for whoever consumes the result.
+        '''
+        for job in self.jobs.values():
+            try:
+                job['future'].result()
+            except Exception:
+                pass
+
+if __name__ == '__main__':
+    pass
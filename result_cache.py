@@ -0,0 +1,196 @@
+'''
+Keyed cache of query results, shared by every browser session of the
+app process. Entries are keyed by account, a name for the data set
+(e.g. 'warehouses' or 'tag_inventory') and the statement, so a single
+data set of a single account can be invalidated without dropping
+anything else. After a change, callers can patch the cached rows
+(write-through) instead of dropping them and fetching them again.
+
+Entries are held in memory until they expire, or until the memory
+tier is over its byte budget, when the least recently used are
+dropped. Expired entries are dropped whenever an entry is added.
+
+Persisted entries are also written to a size-capped disk cache (see
+disk_cache.py), so they survive a restart of the app the same way
+st.experimental_memo(persist='disk') did.
+'''
+import threading
+from collections import OrderedDict
+from time import time
+import constants, disk_cache, query_log
+
+def estimate_bytes(rows):
+    '''
+    Returns the approximate memory taken by cached rows: a row list, a
+    DataFrame, an array, or a tuple of them, e.g. (slot sums, slot hours).
+    '''
+    if isinstance(rows, tuple):
+        return sum(estimate_bytes(part) for part in rows)
+    return query_log.estimate_bytes(rows) or 0
+
+class ResultCache():
+    '''
+    cache_dir is where persisted entries are written, see
+    constants.RESULT_CACHE_DIR, and max_disk_bytes the most they may
+    take up, see constants.RESULT_CACHE_MAX_BYTES. max_memory_bytes is
+    the budget of entries held in memory, see
+    constants.RESULT_CACHE_MAX_MEMORY_BYTES.
+    '''
+    def __init__(self, cache_dir=constants.RESULT_CACHE_DIR, max_disk_bytes=constants.RESULT_CACHE_MAX_BYTES
+                ,max_memory_bytes=constants.RESULT_CACHE_MAX_MEMORY_BYTES):
+        self.disk = disk_cache.DiskCache(cache_dir, max_disk_bytes)
+        self.max_memory_bytes = max_memory_bytes
+        self.lock = threading.Lock()
+        # (account, name, sql) -> {'rows', 'fetched_at', 'ttl', 'persist', 'bytes'}, least recently used first
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        # One lock per key, so concurrent misses on the same key fetch once.
+        self.key_locks = {}
+        self.stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'invalidated': 0, 'patched': 0, 'expired': 0, 'evicted': 0}
+
+    def _get_key_lock(self, key):
+        with self.lock:
+            if key not in self.key_locks:
+                self.key_locks[key] = threading.Lock()
+            return self.key_locks[key]
+
+    def _write(self, key, entry):
+        self.disk.write(key, entry['rows'], entry['fetched_at'])
+
+    def _read(self, key, ttl):
+        stored = self.disk.read(key, ttl)
+        if stored is None:
+            return None
+        return {'rows': stored[0], 'fetched_at': stored[1], 'ttl': ttl, 'persist': True}
+
+    def _is_fresh(self, entry, now=None):
+        return entry is not None and (time() if now is None else now) - entry['fetched_at'] < entry['ttl']
+
+    def _pop(self, key):
+        # Drops an entry from memory only. Caller must hold the lock.
+        entry = self.entries.pop(key)
+        self.memory_bytes -= entry['bytes']
+        key_lock = self.key_locks.get(key)
+        if key_lock is not None and not key_lock.locked():
+            del self.key_locks[key]
+        return entry
+
+    def _get_fresh(self, key):
+        # Returns the rows of a fresh entry, marking it recently used, or None. Caller must hold the lock.
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if not self._is_fresh(entry):
+            self._pop(key)
+            self.stats['expired'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry
+
+    def _put(self, key, entry):
+        '''
+        Adds an entry, then drops expired entries and the least recently
+        used until the memory tier fits its budget. Persisted entries
+        stay on disk. Caller must hold the lock.
+        '''
+        if key in self.entries:
+            self._pop(key)
+        entry['bytes'] = estimate_bytes(entry['rows'])
+        self.entries[key] = entry
+        self.memory_bytes += entry['bytes']
+        now = time()
+        for other_key in [other_key for other_key, other_entry in self.entries.items() if not self._is_fresh(other_entry, now)]:
+            self._pop(other_key)
+            self.stats['expired'] += 1
+        while self.memory_bytes > self.max_memory_bytes and self.entries:
+            self._pop(next(iter(self.entries)))
+            self.stats['evicted'] += 1
+
+    def get(self, account, name, sql, loader, ttl, persist=False):
+        '''
+        Returns the cached rows for (account, name, sql), or calls
+        loader() and caches what it returns for ttl seconds.
+        '''
+        key = (account, name, sql)
+        with self.lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                return entry['rows']
+
+        with self._get_key_lock(key):
+            with self.lock:
+                # Another thread may have fetched it while this one waited.
+                entry = self._get_fresh(key)
+                if entry is not None:
+                    return entry['rows']
+
+            entry = self._read(key, ttl) if persist else None
+            if entry:
+                self.stats['disk_hits'] += 1
+            else:
+                entry = {'rows': loader(), 'fetched_at': time(), 'ttl': ttl, 'persist': persist}
+                self.stats['misses'] += 1
+                if persist:
+                    self._write(key, entry)
+
+            with self.lock:
+                self._put(key, entry)
+            return entry['rows']
+
+    def _matching_keys(self, account, name=None, sql=None):
+        return [key for key in self.entries.keys()
+                if key[0] == account and (name is None or key[1] == name) and (sql is None or key[2] == sql)]
+
+    def invalidate(self, account, name=None, sql=None):
+        '''
+        Drops the entries of an account, optionally only those of one
+        data set or one statement. Returns the number of entries dropped.
+        '''
+        with self.lock:
+            keys = self._matching_keys(account, name, sql)
+            for key in keys:
+                entry = self._pop(key)
+                if entry['persist']:
+                    self.disk.remove(key)
+            if sql is None:
+                # Also entries only on disk, e.g. from before a restart.
+                self.disk.remove_matching(account, name)
+            self.stats['invalidated'] += len(keys)
+        return len(keys)
+
+    def patch(self, account, name, patch_rows):
+        '''
+        Write-through update after a change. patch_rows is called with
+        the cached rows of each entry of the data set and returns the
+        new rows. Patched entries keep their original expiry, so the real
+        data is still fetched again on schedule. Entries that are only on
+        disk can't be patched and are dropped. Returns the number of
+        entries patched.
+        '''
+        with self.lock:
+            keys = [key for key in self._matching_keys(account, name) if self._is_fresh(self.entries[key])]
+            for key in keys:
+                entry = self.entries[key]
+                entry['rows'] = patch_rows(entry['rows'])
+                self.memory_bytes -= entry['bytes']
+                entry['bytes'] = estimate_bytes(entry['rows'])
+                self.memory_bytes += entry['bytes']
+                if entry['persist']:
+                    self._write(key, entry)
+            self.disk.remove_matching(account, name, keys)
+            self.stats['patched'] += len(keys)
+        return len(keys)
+
+    def status(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.memory_bytes,
+                'max_bytes': self.max_memory_bytes,
+                'stats': dict(self.stats),
+                'disk': self.disk.status()
+                }
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,85 @@
+'''
+Streaming fetch of query results. collect() turns a whole result into
+a list of Row objects; these helpers read it in batches instead, so
+only one batch of rows is held at a time. Results are either consumed
+batch by batch (iter_batches, iter_array_chunks) or gathered into one
+compact DataFrame under a row and byte budget (fetch_frame).
+
+Snowpark results are read with to_pandas_batches. Sessions without it
+(e.g. the stand-in, see session_backend.py) are read with
+to_local_iterator, or collect() as a last resort, in batches of rows.
+'''
+import itertools
+import numpy as np
+import pandas as pd
+import constants
+
+class ResultBudgetExceeded(Exception):
+    pass
+
+def _get_row_iterator(dataframe):
+    if hasattr(dataframe, 'to_local_iterator'):
+        return iter(dataframe.to_local_iterator())
+    return iter(dataframe.collect())
+
+def iter_batches(dataframe, batch_rows=constants.STREAM_BATCH_ROWS):
+    '''
+    Yields the result of a Snowpark (or stand-in) DataFrame as pandas
+    DataFrames of up to about batch_rows rows each.
+    '''
+    if hasattr(dataframe, 'to_pandas_batches'):
+        for batch in dataframe.to_pandas_batches():
+            yield batch
+        return
+
+    rows = _get_row_iterator(dataframe)
+    while True:
+        chunk = list(itertools.islice(rows, batch_rows))
+        if not chunk:
+            return
+        yield pd.DataFrame.from_records([tuple(row) for row in chunk], columns=list(chunk[0].asDict().keys()))
+
+def iter_array_chunks(dataframe, column_count, batch_rows=constants.STREAM_BATCH_ROWS):
+    '''
+    Yields the rows of a numeric result as (n, column_count) float
+    arrays. Nulls become NaN.
+    '''
+    for batch in iter_batches(dataframe, batch_rows):
+        yield batch.to_numpy(dtype='float64', na_value=np.nan).reshape(-1, column_count)
+
+def fetch_frame(dataframe, max_rows=None, max_bytes=None, truncate=False, batch_rows=constants.STREAM_BATCH_ROWS):
+    '''
+    Returns the whole result as one DataFrame, built from batches. If
+    the result is over max_rows rows or max_bytes bytes (in memory),
+    ResultBudgetExceeded is raised, or with truncate=True the rows that
+    fit are returned with attrs['truncated'] set.
+    '''
+    batches = []
+    row_count = 0
+    byte_count = 0
+    truncated = False
+    for batch in iter_batches(dataframe, batch_rows):
+        row_count += len(batch)
+        byte_count += int(batch.memory_usage(deep=True).sum())
+        over_rows = max_rows is not None and row_count > max_rows
+        over_bytes = max_bytes is not None and byte_count > max_bytes
+        if over_rows or over_bytes:
+            if not truncate:
+                raise ResultBudgetExceeded('Result is over the budget of ' + (str(max_rows) + ' rows' if over_rows else str(max_bytes) + ' bytes'))
+            if over_rows:
+                batches.append(batch.iloc[:len(batch) - (row_count - max_rows)])
+            truncated = True
+            break
+        batches.append(batch)
+
+    if not batches:
+        result_df = pd.DataFrame()
+    elif len(batches) == 1:
+        result_df = batches[0].reset_index(drop=True)
+    else:
+        result_df = pd.concat(batches, ignore_index=True)
+    result_df.attrs['truncated'] = truncated
+    return result_df
+
+if __name__ == '__main__':
+    pass
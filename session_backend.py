@@ -0,0 +1,300 @@
+'''
+Session backends for the Tagging Assistant. The app only ever calls
+session.sql(sql).collect() and session.close(), so any object with that
+shape can stand in for a Snowpark Session.
+
+The 'standin' backend is a local SQLite database seeded with synthetic
+warehouses, tags, tasks and usage at a configurable scale, with optional
+injected latency per round trip. It is intended for benchmarking and
+load testing the app without a Snowflake account.
+'''
+import os, re, json, random, sqlite3, threading
+from datetime import datetime, timedelta
+from time import sleep
+import constants
+
+class StandInRow(tuple):
+    '''
+    Mimics a Snowpark Row: values can be read by position or by
+    column name.
+    '''
+    def __new__(cls, fields, values):
+        row = super().__new__(cls, values)
+        row._fields = fields
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._fields.index(key))
+        return tuple.__getitem__(self, key)
+
+    def asDict(self):
+        return dict(zip(self._fields, self))
+
+class StandInDataFrame():
+    def __init__(self, session, sql):
+        self.session = session
+        self.sql_text = sql
+
+    def collect(self):
+        return self.session.execute(self.sql_text)
+
+    def to_local_iterator(self):
+        return iter(self.collect())
+
+class StandInSession():
+    '''
+    Offline stand-in for a Snowpark Session.
+    warehouse_count: number of synthetic warehouses to create.
+    active_ratio: share of warehouses with metering history.
+    usage_days: days of hourly metering history per active warehouse.
+    latency_seconds: sleep added to every round trip.
+    '''
+    def __init__(self, warehouse_count=10, active_ratio=0.1, usage_days=30, latency_seconds=0.0, seed=0):
+        self.latency_seconds = latency_seconds
+        self.round_trips = 0
+        self.statements = []
+        self.warehouse_names = []
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.connection.create_function('system_get_tag', 3, self._get_tag)
+        self._seed(warehouse_count, active_ratio, usage_days, random.Random(seed))
+
+    def _seed(self, warehouse_count, active_ratio, usage_days, rand):
+        cur = self.connection.cursor()
+        cur.execute('''create table warehouses (name, state, type, size, min_cluster_count, max_cluster_count
+            ,started_clusters, running, queued, is_default, is_current, auto_suspend, auto_resume, available
+            ,provisioning, quiescing, other, created_on, resumed_on, updated_on, owner, comment
+            ,enable_query_acceleration, query_acceleration_max_scale_factor, resource_monitor, scaling_policy)''')
+        cur.execute('create table tags (created_on, name, database_name, schema_name, owner, comment, allowed_values)')
+        cur.execute('''create table tasks (created_on, name, id, database_name, schema_name, owner, comment
+            ,warehouse, schedule, predecessors, state, definition, "condition")''')
+        cur.execute('create table parameters (key, value, "default", level, description, type)')
+        cur.execute('create table tag_references (object_name, domain, tag_database, tag_schema, tag_name, tag_value, object_deleted)')
+        cur.execute('create table warehouse_applied_tags (warehouse_name, assistant_enabled, tag_assignments)')
+        cur.execute('''create table warehouse_usage_last_month (warehouse_name, assistant_enabled, tag_assignments
+            ,credits_used, start_time, end_time, start_date, start_day_name, start_hour)''')
+        cur.execute('create table warehouse_metering_history (warehouse_name, start_time, end_time, credits_used)')
+        cur.execute('''create table query_history (warehouse_name, warehouse_size, start_time, end_time, execution_time
+            ,queued_overload_time, bytes_spilled_to_local_storage, bytes_spilled_to_remote_storage)''')
+        cur.execute('create table warehouse_load_history (warehouse_name, start_time, end_time, avg_running, avg_queued_load)')
+        cur.execute('create table warehouse_usage_hourly (warehouse_name, start_time, credits_used, credits_used_compute, credits_used_cloud_services, updated_at)')
+        cur.execute('create table warehouse_tag_usage_hourly (warehouse_name, start_time, tag_name, tag_value, updated_at, primary key (warehouse_name, start_time, tag_name))')
+        cur.execute('create table warehouse_schedules (warehouse_name, schedule_index, warehouse_size, cron, timezone, enabled, updated_at)')
+
+        created_on = '2022-01-01 00:00:00'
+        size_names = list(constants.WAREHOUSE_SIZES.keys())[:6]
+        departments = ['Accounting', 'Engineering', 'Finance', 'Marketing', 'Sales']
+
+        cur.executemany('insert into tags values (?, ?, ?, ?, ?, ?, ?)', [
+            (created_on, 'TAG_ASSISTANT_ENABLED', 'TAGGING_ASSIST_DB', 'TAGGING', 'SYSADMIN', '', '["n","y"]'),
+            (created_on, 'DEPARTMENT', 'TAGGING_ASSIST_DB', 'TAGGING', 'SYSADMIN', '', None)
+            ])
+        cur.execute("insert into parameters values ('TIMEZONE', ?, 'America/Los_Angeles', '', 'timezone', 'STRING')", (constants.DEFAULT_TIMEZONE,))
+
+        warehouse_rows = []
+        tag_reference_rows = []
+        applied_tag_rows = []
+        task_rows = []
+        schedule_rows = []
+        usage_rows = []
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        for i in range(warehouse_count):
+            wh_name = 'WH_' + str(i).zfill(len(str(warehouse_count)))
+            size = rand.choice(size_names)
+            self.warehouse_names.append(wh_name)
+            warehouse_rows.append((wh_name, 'SUSPENDED', 'STANDARD', size, 1, 1, 0, 0, 0, 'N', 'N', 600, 'true'
+                                  ,'', '', '', '', created_on, created_on, created_on, 'SYSADMIN', 'Synthetic warehouse'
+                                  ,'false', 8, 'null', 'STANDARD'))
+
+            enabled = 'y' if i % 2 == 0 else 'n'
+            tag_reference_rows.append((wh_name, 'WAREHOUSE', 'TAGGING_ASSIST_DB', 'TAGGING', 'TAG_ASSISTANT_ENABLED', enabled))
+            tag_assignments = {}
+            if i % 3 == 0:
+                tag_assignments['DEPARTMENT'] = departments[i % len(departments)]
+                tag_reference_rows.append((wh_name, 'WAREHOUSE', 'TAGGING_ASSIST_DB', 'TAGGING', 'DEPARTMENT', tag_assignments['DEPARTMENT']))
+            applied_tag_rows.append((wh_name, enabled, json.dumps(tag_assignments)))
+
+            if enabled == 'y' and i % 4 == 0:
+                task_rows.append((created_on, 'RESIZE_' + wh_name + '_SCHEDULE_1', str(i), 'TAGGING_ASSIST_DB', 'SCHEDULING'
+                                 ,'TASKADMIN', '', 'TAGGING_ASSIST_SCHEDULER_WH', 'USING CRON 0 8 * * 1-5 ' + constants.DEFAULT_TIMEZONE
+                                 ,'[]', 'started', 'alter warehouse ' + wh_name.lower() + ' set warehouse_size = small', None))
+                schedule_rows.append((wh_name.lower(), 1, 'small', '0 8 * * 1-5', constants.DEFAULT_TIMEZONE, 1, created_on))
+
+            if rand.random() < active_ratio:
+                for hour in range(usage_days * 24):
+                    start_time = now - timedelta(hours=hour + 1)
+                    usage_rows.append((wh_name, enabled, json.dumps(tag_assignments), round(rand.random() * constants.WAREHOUSE_SIZES[size]['credit_rate'], 3)
+                                      ,start_time.strftime('%Y-%m-%d %H:%M:%S'), (start_time + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+                                      ,start_time.strftime('%Y-%m-%d'), start_time.strftime('%w %a'), start_time.strftime('%H')))
+
+        cur.executemany('insert into warehouses values (' + ', '.join(['?'] * 26) + ')', warehouse_rows)
+        cur.executemany('insert into tag_references (object_name, domain, tag_database, tag_schema, tag_name, tag_value) values (?, ?, ?, ?, ?, ?)', tag_reference_rows)
+        cur.executemany('insert into warehouse_applied_tags values (?, ?, ?)', applied_tag_rows)
+        cur.executemany('insert into tasks values (' + ', '.join(['?'] * 13) + ')', task_rows)
+        cur.executemany('insert into warehouse_schedules values (?, ?, ?, ?, ?, ?, ?)', schedule_rows)
+        cur.executemany('insert into warehouse_usage_last_month values (?, ?, ?, ?, ?, ?, ?, ?, ?)', usage_rows)
+        cur.execute('insert into warehouse_metering_history select warehouse_name, start_time, end_time, credits_used from warehouse_usage_last_month')
+        # The rollup tables as the rollup task would leave them.
+        cur.execute('''insert into warehouse_usage_hourly
+            select warehouse_name, start_time, credits_used, credits_used, 0, start_time
+              from warehouse_metering_history''')
+        cur.execute('''insert into warehouse_tag_usage_hourly
+            select u.warehouse_name, u.start_time, r.tag_name, r.tag_value, u.start_time
+              from warehouse_usage_hourly u
+              join tag_references r on r.object_name = u.warehouse_name
+             where r.tag_name <> 'TAG_ASSISTANT_ENABLED' ''')
+        # One query per active hour, its offset, duration, queueing and spilling derived from the hour's credits.
+        cur.execute('''insert into query_history
+            select warehouse_name, 'X-Small'
+                  ,datetime(start_time, '+' || (cast(credits_used * 1000 as integer) % 3000) || ' seconds')
+                  ,datetime(start_time, '+' || (cast(credits_used * 1000 as integer) % 3000 + cast(credits_used * 600 as integer) + 1) || ' seconds')
+                  ,(cast(credits_used * 600 as integer) + 1) * 1000
+                  ,iif(start_hour between '09' and '11', cast(credits_used * 600 as integer) * 500, 0)
+                  ,iif(credits_used > 1, cast(credits_used * 1073741824 as integer), 0)
+                  ,0
+              from warehouse_usage_last_month''')
+        cur.execute('''insert into warehouse_load_history
+            select warehouse_name, start_time, end_time, min(credits_used / 4.0, 1.0), iif(start_hour between '09' and '11', 0.5, 0)
+              from warehouse_usage_last_month''')
+        self.connection.commit()
+
+    def _get_tag(self, tag_name, object_name, domain):
+        tag_name = tag_name.split('.')[-1].upper()
+        result = self.connection.execute('select tag_value from tag_references where tag_name = ? and object_name = ? and domain = ?'
+                                        ,(tag_name, object_name.upper(), domain.upper())).fetchone()
+        if result:
+            return result[0]
+        return None
+
+    def _set_warehouse_tags(self, statement):
+        # Applies the bulk tagging procedure's changes to tag_references and reports each warehouse like it does.
+        literal = re.search("parse_json\\('(.*)'\\)", statement, flags=re.DOTALL).group(1)
+        tag_changes = json.loads(literal.replace("''", "'").replace('\\\\', '\\'))
+        result = {'warehouses': {}}
+        for warehouse_name, tag_values in tag_changes.items():
+            if not self.connection.execute('select 1 from warehouses where name = ?', (warehouse_name,)).fetchone():
+                result['warehouses'][warehouse_name] = {'result': 'ERROR', 'message': "Warehouse '" + warehouse_name + "' does not exist or not authorized."}
+                continue
+            for tag_name, tag_value in tag_values.items():
+                self.connection.execute('delete from tag_references where object_name = ? and domain = ? and tag_name = ?', (warehouse_name, 'WAREHOUSE', tag_name.upper()))
+                if tag_value is not None:
+                    self.connection.execute('insert into tag_references (object_name, domain, tag_database, tag_schema, tag_name, tag_value) values (?, ?, ?, ?, ?, ?)'
+                                           ,(warehouse_name, 'WAREHOUSE', 'TAGGING_ASSIST_DB', 'TAGGING', tag_name.upper(), tag_value))
+            result['warehouses'][warehouse_name] = {'result': 'success'}
+        self.connection.commit()
+        return result
+
+    def _save_many_warehouse_schedules(self, statement):
+        # Reports each warehouse of the bulk schedules procedure like it does, without keeping the schedules.
+        literal = re.search("parse_json\\('(.*)'\\)", statement, flags=re.DOTALL).group(1)
+        schedule_changes = json.loads(literal.replace("''", "'").replace('\\\\', '\\'))
+        result = {'warehouses': {}}
+        for warehouse_name, schedules in schedule_changes.items():
+            if not self.connection.execute('select 1 from warehouses where name = ?', (warehouse_name,)).fetchone():
+                result['warehouses'][warehouse_name] = {'error': "Warehouse '" + warehouse_name + "' does not exist or not authorized.", 'schedules': {}, 'dropped': {}}
+                continue
+            result['warehouses'][warehouse_name] = {'schedules': dict((str(schedule['index']), {'action': 'saved', 'result': 'success'}) for schedule in schedules), 'dropped': {}}
+        return result
+
+    def _query(self, sql, params=(), lowercase_columns=False, quoted_columns=()):
+        # show commands return lower case column names, selects return upper case unless quoted.
+        cur = self.connection.execute(sql, params)
+        fields = [col[0] if col[0] in quoted_columns else col[0].lower() if lowercase_columns else col[0].upper() for col in cur.description]
+        return [StandInRow(fields, row) for row in cur.fetchall()]
+
+    def _status(self, message='Statement executed successfully.'):
+        return [StandInRow(['status'], (message,))]
+
+    def _translate(self, sql):
+        # Rewrite the handful of Snowflake-isms used by the app into SQLite.
+        sql = re.sub('(tagging_assist_db\\.)?(metadata|scheduling)\\.|snowflake\\.account_usage\\.', '', sql, flags=re.IGNORECASE)
+        sql = re.sub('\\biff\\(', 'iif(', sql, flags=re.IGNORECASE)
+        sql = re.sub('system\\$get_tag', 'system_get_tag', sql, flags=re.IGNORECASE)
+        sql = re.sub('::(float|string|varchar|number|int)', '', sql, flags=re.IGNORECASE)
+        sql = re.sub('\\bnvl\\(', 'ifnull(', sql, flags=re.IGNORECASE)
+        sql = re.sub('\\bto_date\\(', 'date(', sql, flags=re.IGNORECASE)
+        sql = re.sub('date_part\\(epoch_millisecond, (\\w+)\\)', 'cast(round((julianday(\\1) - 2440587.5) * 86400000) as integer)', sql, flags=re.IGNORECASE)
+        sql = re.sub('date_part\\(epoch_second, (\\w+)\\)', 'cast(round((julianday(\\1) - 2440587.5) * 86400) as integer)', sql, flags=re.IGNORECASE)
+        sql = re.sub('date_trunc\\(hour, (\\w+)\\)', "strftime('%Y-%m-%d %H:00:00', \\1)", sql, flags=re.IGNORECASE)
+        sql = re.sub('dateadd\\(day, (-?\\d+), current_timestamp\\(\\)\\)', "datetime('now', 'localtime', '\\1 day')", sql, flags=re.IGNORECASE)
+        sql = re.sub("to_timestamp_(?:tz|ltz|ntz)\\(('[^']*')(?:, '[^']*')?\\)", '\\1', sql, flags=re.IGNORECASE)
+        sql = re.sub("listagg\\(distinct ([^,]+), '[^']*'\\) within group \\([^)]*\\)", 'group_concat(distinct \\1)', sql, flags=re.IGNORECASE)
+        return sql
+
+    def execute(self, sql):
+        '''
+        Runs a single statement and returns a list of StandInRow. Each
+        call counts as one round trip and sleeps for latency_seconds.
+        '''
+        with self.lock:
+            self.round_trips += 1
+            self.statements.append(sql)
+        # Sleep outside the lock so concurrent callers overlap like real network waits.
+        if self.latency_seconds:
+            sleep(self.latency_seconds)
+        with self.lock:
+            return self._execute(sql)
+
+    def _execute(self, sql):
+        statement = re.sub('^\\s*(--[^\\n]*\\n\\s*)*', '', sql).strip().rstrip(';')
+        statement_lower = statement.lower()
+        like_match = re.search("like '([^']*)'", statement_lower)
+        like_filter = ''
+        like_params = ()
+        if like_match:
+            like_filter = ' where lower(name) like ?'
+            like_params = (like_match.group(1),)
+
+        if statement_lower.startswith('show warehouses'):
+            return self._query('select * from warehouses' + like_filter + ' order by name', like_params, True)
+        elif statement_lower.startswith('show tags'):
+            return self._query('select * from tags' + like_filter + ' order by name', like_params, True)
+        elif statement_lower.startswith('show tasks'):
+            return self._query('select * from tasks' + like_filter + ' order by name', like_params, True)
+        elif statement_lower.startswith('show parameters'):
+            return self._query('select * from parameters where lower(key) like ?', like_params or ('%',), True)
+        elif statement_lower.startswith('call '):
+            procedure_name = re.match('call\\s+([\\w.$]+)', statement_lower).group(1).split('.')[-1].upper()
+            if procedure_name == 'SP_SET_WAREHOUSE_TAGS':
+                return [StandInRow([procedure_name], (json.dumps(self._set_warehouse_tags(statement)),))]
+            if procedure_name == 'SP_SAVE_MANY_WAREHOUSE_SCHEDULES':
+                return [StandInRow([procedure_name], (json.dumps(self._save_many_warehouse_schedules(statement)),))]
+            return [StandInRow([procedure_name], (json.dumps({'create': {'result': 'success'}, 'resume': {'result': 'success'}
+                                                             ,'grant': {'result': 'success'}, 'alter': 'success', 'drop': 'success'}),))]
+        elif statement_lower.startswith(('alter ', 'create ', 'grant ', 'drop ', 'use ', 'merge ', 'update ', 'delete ', 'execute ')):
+            return self._status()
+        return self._query(self._translate(statement), quoted_columns=re.findall('as "([^"]+)"', statement))
+
+    def sql(self, sql):
+        return StandInDataFrame(self, sql)
+
+    def close(self):
+        self.connection.close()
+
+def get_backend_name():
+    '''
+    The backend is chosen with the TAGGING_ASSIST_BACKEND environment
+    variable, falling back to constants.DEFAULT_SESSION_BACKEND.
+    '''
+    return os.environ.get('TAGGING_ASSIST_BACKEND', constants.DEFAULT_SESSION_BACKEND).lower()
+
+def create_backend_session(connection_params):
+    '''
+    Returns a session for the configured backend. connection_params
+    is the Snowpark connection dict built by create_session(). The
+    stand-in backend ignores it and reads its scale and latency from
+    TAGGING_ASSIST_STANDIN_WAREHOUSES and TAGGING_ASSIST_STANDIN_LATENCY_MS.
+    '''
+    if get_backend_name() == 'standin':
+        return StandInSession(
+            warehouse_count=int(os.environ.get('TAGGING_ASSIST_STANDIN_WAREHOUSES', 100)),
+            latency_seconds=int(os.environ.get('TAGGING_ASSIST_STANDIN_LATENCY_MS', 0)) / 1000
+            )
+
+    # Imported here so the stand-in backend does not require Snowpark.
+    import snowflake.snowpark as sp
+    return sp.Session.builder.configs(connection_params).create()
+
+if __name__ == '__main__':
+    pass
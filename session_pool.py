@@ -0,0 +1,369 @@
+'''
+Process-wide pool of sessions shared by all browser sessions of the
+app. Sessions are keyed by account, user, role and a salted digest of
+the password, so a session is only reused by someone who connected
+with the same credentials. The credentials themselves are only used to
+open sessions while connecting and are never kept, so once a key has
+no open sessions left its users have to connect again.
+
+Each rerun checks a session out under an owner id (one per browser
+session) and releases it at the end. An owner that already holds a
+session gets the same one back. Only released sessions are handed to
+another owner: every checkout and heartbeat refreshes a lease, and a
+lease that goes SESSION_POOL_LEASE_SECONDS without one (e.g. the
+browser session went away mid-rerun) is closed, not reused, as its
+owner may still be running queries on it. Idle sessions are health
+checked before reuse, outside the lock, and closed after
+SESSION_POOL_IDLE_SECONDS. The total number of open sessions is capped
+at SESSION_POOL_MAX_SIZE.
+
+A Snowpark session must not run queries from several threads at once,
+so connecting also opens up to SESSION_POOL_WORKER_SESSIONS idle
+sessions for the same key while the credentials are at hand. Query
+scheduler workers lease those with try_checkout.
+'''
+import hmac, hashlib, secrets, threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+import constants
+
+# Random per process, so pool keys can't be used to guess passwords.
+_KEY_SALT = secrets.token_bytes(16)
+
+class SessionPoolError(Exception):
+    pass
+
+def get_pool_key(connection_params):
+    '''
+    Returns the pool key for a set of Snowpark connection params.
+    '''
+    password_digest = hmac.new(_KEY_SALT, str(connection_params.get('password', '')).encode('utf-8'), hashlib.sha256).hexdigest()
+    return '|'.join([
+        str(connection_params.get('account', '')).lower(),
+        str(connection_params.get('user', '')).lower(),
+        str(connection_params.get('role', '')).lower(),
+        password_digest
+        ])
+
+class SessionPool():
+    '''
+    create_session is a callable that takes connection params and
+    returns a new session, e.g. session_backend.create_backend_session.
+    '''
+    def __init__(self, create_session, max_size=constants.SESSION_POOL_MAX_SIZE
+                ,idle_seconds=constants.SESSION_POOL_IDLE_SECONDS
+                ,keepalive_seconds=constants.SESSION_POOL_KEEPALIVE_SECONDS
+                ,lease_seconds=constants.SESSION_POOL_LEASE_SECONDS):
+        self.create_session = create_session
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.lease_seconds = lease_seconds
+        self.condition = threading.Condition()
+        # key -> list of {'session', 'last_used'}
+        self.idle = {}
+        # owner -> {'key', 'session', 'heartbeat'}, session is None while connecting or health checking
+        self.leases = {}
+        # Slots reserved for worker sessions being opened outside the lock.
+        self.opening = 0
+        self.stats = {'created': 0, 'reused': 0, 'health_check_failures': 0, 'evicted': 0, 'reclaimed': 0, 'disconnected': 0}
+
+    def _open_count(self):
+        return len(self.leases) + self.opening + sum(len(sessions) for sessions in self.idle.values())
+
+    def _has_sessions(self, key):
+        return bool(self.idle.get(key)) or any(lease['key'] == key for lease in self.leases.values())
+
+    def _close(self, session):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def _evict(self, now):
+        '''
+        Closes idle sessions past their idle time and leases whose
+        heartbeat went stale. Caller must hold the condition.
+        '''
+        for key, sessions in list(self.idle.items()):
+            for entry in list(sessions):
+                if now - entry['last_used'] > self.idle_seconds:
+                    sessions.remove(entry)
+                    self._close(entry['session'])
+                    self.stats['evicted'] += 1
+            if not sessions:
+                del self.idle[key]
+
+        for owner, lease in list(self.leases.items()):
+            if lease['session'] is not None and now - lease['heartbeat'] > self.lease_seconds:
+                # The owner may still be using it, so it is never handed to anyone else.
+                del self.leases[owner]
+                self._close(lease['session'])
+                self.stats['reclaimed'] += 1
+                self.condition.notify_all()
+
+    def _evict_lru_idle(self):
+        # Make room by closing the least recently used idle session of any key.
+        oldest = None
+        for key, sessions in self.idle.items():
+            for entry in sessions:
+                if oldest is None or entry['last_used'] < oldest[1]['last_used']:
+                    oldest = (key, entry)
+        if oldest is None:
+            return False
+        self.idle[oldest[0]].remove(oldest[1])
+        self._close(oldest[1]['session'])
+        self.stats['evicted'] += 1
+        return True
+
+    def _is_healthy(self, session):
+        try:
+            session.sql('select 1').collect()
+            return True
+        except Exception:
+            return False
+
+    def _take_idle(self, key, owner, now):
+        '''
+        Leases the most recently used idle session of key to owner.
+        Returns (session, needs_check): a session idle past the keepalive
+        is returned with needs_check set and its lease left unfinished,
+        for _finish_health_check to run outside the lock. Returns (None,
+        False) if there is no idle session. Caller must hold the condition.
+        '''
+        idle_sessions = self.idle.get(key)
+        if not idle_sessions:
+            return None, False
+        entry = idle_sessions.pop()
+        if now - entry['last_used'] <= self.keepalive_seconds:
+            self.leases[owner] = {'key': key, 'session': entry['session'], 'heartbeat': now}
+            self.stats['reused'] += 1
+            return entry['session'], False
+        # Reserves the slot, like a session being connected.
+        self.leases[owner] = {'key': key, 'session': None, 'heartbeat': now}
+        return entry['session'], True
+
+    def _finish_health_check(self, owner, session):
+        '''
+        Health checks a session taken by _take_idle, without holding the
+        condition so a slow connection only holds up its new owner.
+        Completes the lease and returns True if it is healthy, otherwise
+        drops the lease, closes the session and returns False.
+        '''
+        healthy = self._is_healthy(session)
+        with self.condition:
+            lease = self.leases.get(owner)
+            if healthy and lease is not None and lease['session'] is None:
+                lease['session'] = session
+                lease['heartbeat'] = time()
+                self.stats['reused'] += 1
+                self.condition.notify_all()
+                return True
+            if lease is not None and lease['session'] is None:
+                del self.leases[owner]
+            if not healthy:
+                self.stats['health_check_failures'] += 1
+            self.condition.notify_all()
+        self._close(session)
+        return False
+
+    def connect(self, connection_params, owner, timeout=constants.SESSION_POOL_CHECKOUT_TIMEOUT_SECONDS
+                ,worker_sessions=constants.SESSION_POOL_WORKER_SESSIONS):
+        '''
+        Returns (key, session): the pool key to check out with later and
+        a session leased to owner, reusing an idle session of the same
+        credentials if there is one. connection_params are only used to
+        open new sessions and are not kept. Up to worker_sessions idle
+        sessions are opened alongside, as room allows. Raises
+        SessionPoolError if the pool stays full for timeout seconds.
+        '''
+        key, session = self._connect_owner(connection_params, owner, timeout)
+        self._open_worker_sessions(key, connection_params, worker_sessions)
+        return key, session
+
+    def _connect_owner(self, connection_params, owner, timeout):
+        key = get_pool_key(connection_params)
+        deadline = time() + timeout
+        while True:
+            with self.condition:
+                now = time()
+                self._evict(now)
+                lease = self.leases.get(owner)
+                if lease and lease['session'] is not None:
+                    if lease['key'] == key:
+                        lease['heartbeat'] = now
+                        return key, lease['session']
+                    self._release(owner, now)
+                elif lease:
+                    if now >= deadline:
+                        raise SessionPoolError('Timed out waiting for a session to connect.')
+                    # An earlier rerun of this owner is still connecting.
+                    self.condition.wait(deadline - now)
+                    continue
+
+                session, needs_check = self._take_idle(key, owner, now)
+                if session is not None and not needs_check:
+                    return key, session
+
+                if session is None:
+                    if self._open_count() < self.max_size or self._evict_lru_idle():
+                        # Reserve the slot before connecting, which happens outside the lock.
+                        self.leases[owner] = {'key': key, 'session': None, 'heartbeat': now}
+                        break
+
+                    if now >= deadline:
+                        raise SessionPoolError('All ' + str(self.max_size) + ' pooled sessions are in use. Try again shortly.')
+                    self.condition.wait(deadline - now)
+                    continue
+
+            if self._finish_health_check(owner, session):
+                return key, session
+
+        try:
+            session = self.create_session(connection_params)
+        except Exception:
+            with self.condition:
+                del self.leases[owner]
+                self.condition.notify_all()
+            raise
+
+        with self.condition:
+            self.leases[owner]['session'] = session
+            self.leases[owner]['heartbeat'] = time()
+            self.stats['created'] += 1
+            self.condition.notify_all()
+        return key, session
+
+    def _open_worker_sessions(self, key, connection_params, worker_sessions):
+        # Tops the idle sessions of key up to worker_sessions. A failed connect only means one worker less.
+        with self.condition:
+            self._evict(time())
+            count = min(worker_sessions - len(self.idle.get(key, [])), self.max_size - self._open_count())
+            if count <= 0:
+                return
+            self.opening += count
+
+        def create_worker_session(_):
+            try:
+                return self.create_session(connection_params)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            sessions = [session for session in executor.map(create_worker_session, range(count)) if session is not None]
+
+        with self.condition:
+            self.opening -= count
+            now = time()
+            self.idle.setdefault(key, []).extend({'session': session, 'last_used': now} for session in sessions)
+            self.stats['created'] += len(sessions)
+            self.condition.notify_all()
+
+    def try_checkout(self, key, owner):
+        '''
+        Returns an idle session of key leased to owner, or None without
+        waiting if there isn't one.
+        '''
+        while True:
+            with self.condition:
+                now = time()
+                lease = self.leases.get(owner)
+                if lease:
+                    if lease['key'] == key and lease['session'] is not None:
+                        lease['heartbeat'] = now
+                        return lease['session']
+                    return None
+                session, needs_check = self._take_idle(key, owner, now)
+                if session is None or not needs_check:
+                    return session
+            if self._finish_health_check(owner, session):
+                return session
+
+    def checkout(self, key, owner, timeout=constants.SESSION_POOL_CHECKOUT_TIMEOUT_SECONDS):
+        '''
+        Returns a session for key leased to owner. Raises SessionPoolError
+        if the key has no open sessions left (e.g. they were idle too
+        long) or none frees up within timeout seconds.
+        '''
+        deadline = time() + timeout
+        while True:
+            with self.condition:
+                now = time()
+                self._evict(now)
+                lease = self.leases.get(owner)
+                if lease and lease['key'] == key and lease['session'] is not None:
+                    lease['heartbeat'] = now
+                    return lease['session']
+                elif lease and lease['session'] is not None:
+                    # The owner switched credentials, hand back the old session.
+                    self._release(owner, now)
+                    continue
+                elif lease is None:
+                    session, needs_check = self._take_idle(key, owner, now)
+                    if session is not None and not needs_check:
+                        return session
+                    if session is None and not self._has_sessions(key):
+                        raise SessionPoolError('Session expired. Please connect again.')
+
+                if lease is not None or session is None:
+                    if now >= deadline:
+                        raise SessionPoolError('Timed out waiting for a session. Try again shortly.')
+                    # Another owner with the same credentials, or an earlier rerun still connecting, holds the session.
+                    self.condition.wait(deadline - now)
+                    continue
+
+            if self._finish_health_check(owner, session):
+                return session
+
+    def heartbeat(self, owner):
+        '''
+        Marks the owner's session as still in use, e.g. before each query,
+        so a long rerun's lease isn't taken for stale.
+        '''
+        with self.condition:
+            lease = self.leases.get(owner)
+            if lease is not None:
+                lease['heartbeat'] = time()
+
+    def _release(self, owner, now):
+        lease = self.leases.pop(owner, None)
+        if lease and lease['session'] is not None:
+            self.idle.setdefault(lease['key'], []).append({'session': lease['session'], 'last_used': now})
+            self.condition.notify_all()
+
+    def release(self, owner):
+        '''
+        Returns the owner's session, if any, to the pool.
+        '''
+        with self.condition:
+            self._release(owner, time())
+
+    def disconnect(self, key, owner):
+        '''
+        Closes the owner's session and every idle session of key, so the
+        credentials have to be given again. Sessions of key leased to
+        other owners are left to them.
+        '''
+        with self.condition:
+            lease = self.leases.get(owner)
+            if lease and lease['session'] is not None:
+                del self.leases[owner]
+                self._close(lease['session'])
+                self.stats['disconnected'] += 1
+            for entry in self.idle.pop(key, []):
+                self._close(entry['session'])
+                self.stats['disconnected'] += 1
+            self.condition.notify_all()
+
+    def status(self):
+        with self.condition:
+            return {
+                'open': self._open_count(),
+                'leased': len(self.leases),
+                'idle': sum(len(sessions) for sessions in self.idle.values()),
+                'max_size': self.max_size,
+                'stats': dict(self.stats)
+                }
+
+if __name__ == '__main__':
+    pass
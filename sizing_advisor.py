@@ -0,0 +1,155 @@
+'''
+Right-sizing advisor. Folds a warehouse's hourly query and load stats
+(see sql_builder.get_warehouse_load_sql) into hour of week slots, 0
+being Sunday 00:00 in the account timezone, and proposes a size for
+each slot, plus the resize schedules that would apply those sizes.
+
+Rows are streamed in chunks and added to per slot sums as they
+arrive, so memory holds 168 slots however long the history is.
+'''
+import numpy as np
+import pandas as pd
+import constants, result_stream
+
+HOURS_PER_WEEK = 168
+
+DAY_NAMES = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+# Columns of get_warehouse_load_sql after hour_start, summed per slot.
+SLOT_COLUMNS = ['queries', 'execution_seconds', 'queued_seconds', 'local_spill_gb', 'remote_spill_gb', 'avg_running', 'avg_queued_load', 'size_index']
+
+# Queued time per second of execution at which a slot is sized up.
+QUEUED_RATIO_UPSIZE = 0.2
+
+# GB spilled to local storage per hour at which a slot is sized up.
+LOCAL_SPILL_GB_UPSIZE = 1.0
+
+# Average running load below which a slot without queueing or spilling is sized down.
+AVG_RUNNING_DOWNSIZE = 0.3
+
+def get_hour_of_week(epoch_seconds, local_timezone=constants.DEFAULT_TIMEZONE):
+    '''
+    Returns the hour of week slot of each epoch second in the timezone.
+    '''
+    local_times = pd.DatetimeIndex(pd.to_datetime(epoch_seconds, unit='s', utc=True)).tz_convert(local_timezone)
+    return ((np.asarray(local_times.dayofweek) + 1) % 7) * 24 + np.asarray(local_times.hour)
+
+def aggregate_slots(dataframe, local_timezone=constants.DEFAULT_TIMEZONE):
+    '''
+    Streams the result of get_warehouse_load_sql and returns (slot_sums,
+    slot_hours): the sum of each SLOT_COLUMNS column per slot, as a
+    (168, 8) array, and the number of hours seen per slot.
+    '''
+    slot_sums = np.zeros((HOURS_PER_WEEK, len(SLOT_COLUMNS)))
+    slot_hours = np.zeros(HOURS_PER_WEEK)
+    for chunk in result_stream.iter_array_chunks(dataframe, len(SLOT_COLUMNS) + 1):
+        chunk = chunk[~np.isnan(chunk[:, 0])]
+        if len(chunk) == 0:
+            continue
+        slots = get_hour_of_week(chunk[:, 0], local_timezone)
+        values = np.nan_to_num(chunk[:, 1:])
+        for column in range(len(SLOT_COLUMNS)):
+            slot_sums[:, column] += np.bincount(slots, weights=values[:, column], minlength=HOURS_PER_WEEK)
+        slot_hours += np.bincount(slots, minlength=HOURS_PER_WEEK)
+    return slot_sums, slot_hours
+
+def get_slot_averages(slot_sums, slot_hours):
+    '''
+    Returns a dict of SLOT_COLUMNS name -> per hour average of each slot.
+    '''
+    hours = np.maximum(slot_hours, 1)
+    return dict((column_name, slot_sums[:, column] / hours) for column, column_name in enumerate(SLOT_COLUMNS))
+
+def get_slot_sizes(slot_sums):
+    '''
+    Returns the size index each slot's queries ran at, averaged over the
+    queries and rounded, or -1 for slots without queries.
+    '''
+    queries = slot_sums[:, SLOT_COLUMNS.index('queries')]
+    size_index_sums = slot_sums[:, SLOT_COLUMNS.index('size_index')]
+    return np.where(queries > 0, np.rint(size_index_sums / np.maximum(queries, 1)), -1).astype(int)
+
+def recommend_sizes(slot_sums, slot_hours):
+    '''
+    Returns the recommended size index (into constants.WAREHOUSE_CODE_LIST)
+    of each slot, or -1 for slots without queries. Starting from the size
+    the slot's queries ran at (see get_slot_sizes), slots spilling to
+    remote storage go up two sizes, slots spilling locally or queueing
+    go up one, and lightly loaded slots without either go down one.
+    '''
+    averages = get_slot_averages(slot_sums, slot_hours)
+    queued_ratio = averages['queued_seconds'] / np.maximum(averages['execution_seconds'], 1)
+    is_queueing = (queued_ratio >= QUEUED_RATIO_UPSIZE) | (averages['avg_queued_load'] > 0)
+
+    size_change = np.zeros(HOURS_PER_WEEK, dtype=int)
+    size_change = np.where(averages['avg_running'] < AVG_RUNNING_DOWNSIZE, -1, size_change)
+    size_change = np.where(is_queueing | (averages['local_spill_gb'] >= LOCAL_SPILL_GB_UPSIZE), 1, size_change)
+    size_change = np.where(averages['remote_spill_gb'] > 0, 2, size_change)
+
+    slot_sizes = get_slot_sizes(slot_sums)
+    recommended = np.clip(slot_sizes + size_change, 0, len(constants.WAREHOUSE_CODE_LIST) - 1)
+    return np.where(slot_sizes >= 0, recommended, -1)
+
+def get_recommendation_grid(recommended):
+    '''
+    Returns the recommended sizes as a DataFrame of days by hours, blank
+    where there were no queries.
+    '''
+    size_names = [constants.WAREHOUSE_SIZE_BY_CODE[code] for code in constants.WAREHOUSE_CODE_LIST]
+    labels = [size_names[index] if index >= 0 else '' for index in recommended]
+    return pd.DataFrame(np.array(labels).reshape(7, 24), index=DAY_NAMES, columns=[str(hour).zfill(2) for hour in range(24)])
+
+def _get_runs(sizes):
+    # (start slot, length, size index) of each run of equal sizes, wrapping around the week.
+    change_slots = np.flatnonzero(sizes != np.roll(sizes, 1))
+    if len(change_slots) == 0:
+        return [(0, HOURS_PER_WEEK, int(sizes[0]))]
+    lengths = np.diff(np.append(change_slots, change_slots[0] + HOURS_PER_WEEK))
+    return [(int(slot), int(length), int(sizes[slot])) for slot, length in zip(change_slots, lengths)]
+
+def _group_runs(runs):
+    # One schedule per start hour and size, covering every day a run starts then.
+    groups = {}
+    for slot, length, size_index in runs:
+        groups.setdefault((slot % 24, size_index), []).append(slot // 24)
+    return groups
+
+def build_schedules(recommended, local_timezone=constants.DEFAULT_TIMEZONE, max_count=constants.MAX_SCHEDULE_COUNT):
+    '''
+    Returns resize schedules ({index, size, cron, tz}, the form the save
+    procedures take) that set each slot's recommended size. Slots
+    without queries keep the size of the slot before them. If more than
+    max_count schedules would be needed, the shortest runs are merged
+    into the larger neighbouring size until they fit.
+    '''
+    has_data = recommended >= 0
+    if not has_data.any():
+        return []
+    # Carry the last recommendation forward over idle slots, wrapping around the week.
+    source_slots = np.where(has_data, np.arange(HOURS_PER_WEEK), -1)
+    source_slots = np.maximum.accumulate(source_slots)
+    source_slots[source_slots < 0] = np.flatnonzero(has_data)[-1]
+    sizes = recommended[source_slots]
+
+    runs = _get_runs(sizes)
+    while len(_group_runs(runs)) > max_count:
+        shortest = min(range(len(runs)), key=lambda i: runs[i][1])
+        neighbour_size = max(runs[shortest - 1][2], runs[(shortest + 1) % len(runs)][2])
+        sizes[runs[shortest][0]:runs[shortest][0] + runs[shortest][1]] = neighbour_size
+        if runs[shortest][0] + runs[shortest][1] > HOURS_PER_WEEK:
+            sizes[:runs[shortest][0] + runs[shortest][1] - HOURS_PER_WEEK] = neighbour_size
+        runs = _get_runs(sizes)
+
+    schedules = []
+    for (hour, size_index), days in sorted(_group_runs(runs).items()):
+        day_field = '*' if len(days) == 7 else ','.join(str(day) for day in sorted(days))
+        schedules.append({
+            'index': len(schedules) + 1,
+            'size': constants.WAREHOUSE_CODE_LIST[size_index],
+            'cron': '0 ' + str(hour) + ' * * ' + day_field,
+            'tz': local_timezone
+            })
+    return schedules
+
+if __name__ == '__main__':
+    pass
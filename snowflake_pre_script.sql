@@ -17,6 +17,9 @@ use role accountadmin;
 -- We will use sysadmin to do most of our work, so it will need read-access to the snowflake db.
 grant imported privileges on database snowflake to role sysadmin;
 
+-- The usage rollup task reads metering history and tag references as taskadmin.
+grant imported privileges on database snowflake to role taskadmin;
+
 -- Account-level task permissions
 grant execute task, execute managed task on account to role taskadmin;
 
@@ -88,6 +91,63 @@ select nvl(a.warehouse_name, b.warehouse_name) as warehouse_name
 )
 ;
 
+-- Hourly rollups for cost attribution, kept up to date by the scheduling.refresh_warehouse_usage_rollups 
+-- task so chargeback reports read these small tables instead of account_usage.
+create table if not exists warehouse_usage_hourly (
+    warehouse_name varchar not null
+   ,start_time timestamp_ltz not null
+   ,credits_used number(38, 9)
+   ,credits_used_compute number(38, 9)
+   ,credits_used_cloud_services number(38, 9)
+   ,updated_at timestamp_ltz default current_timestamp()
+   ,primary key (warehouse_name, start_time)
+)
+comment = 'Credits used by each warehouse per hour, from warehouse_metering_history.'
+;
+
+create table if not exists warehouse_tag_usage_hourly (
+    warehouse_name varchar not null
+   ,start_time timestamp_ltz not null
+   ,tag_name varchar not null
+   ,tag_value varchar
+   ,updated_at timestamp_ltz default current_timestamp()
+   ,primary key (warehouse_name, start_time, tag_name)
+)
+comment = 'Tags assigned to each warehouse in each hour of warehouse_usage_hourly, as of when the hour was rolled up.'
+;
+
+grant usage on schema metadata to role taskadmin;
+grant select, insert, update, delete on table warehouse_usage_hourly to role taskadmin;
+grant select, insert, update, delete on table warehouse_tag_usage_hourly to role taskadmin;
+
+-- Schedule table for the dispatcher scheduling engine (SCHEDULING_ENGINE = 'dispatcher' in constants.py).
+-- One row per schedule, evaluated by a single dispatcher task instead of one task per schedule.
+use schema scheduling;
+
+create table if not exists warehouse_schedules (
+    warehouse_name varchar not null
+   ,schedule_index number not null
+   ,warehouse_size varchar not null
+   ,cron varchar not null
+   ,timezone varchar not null
+   ,enabled boolean default true
+   ,updated_at timestamp_ltz default current_timestamp()
+   ,primary key (warehouse_name, schedule_index)
+)
+comment = 'Warehouse resize schedules evaluated by sp_dispatch_warehouse_schedules.'
+;
+
+create table if not exists warehouse_schedule_dispatches (
+    dispatched_through timestamp_tz not null
+   ,resized variant
+   ,dispatched_at timestamp_ltz default current_timestamp()
+)
+comment = 'One row per dispatcher tick. The latest dispatched_through is where the next tick starts.'
+;
+
+grant select, insert, update, delete on table warehouse_schedules to role taskadmin;
+grant select, insert, delete on table warehouse_schedule_dispatches to role taskadmin;
+
 -- Warehouses --
 create warehouse if not exists tagging_assist_scheduler_wh
   warehouse_size = xsmall
@@ -245,3 +305,642 @@ $$
 ;
 
 grant usage on procedure sp_pause_resume_warehouse_size_task(varchar, varchar) to role sysadmin;
+
+create or replace procedure sp_reconcile_warehouse_size_tasks(WAREHOUSE_NAME varchar, SCHEDULES variant)
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure for making the resizing tasks of a warehouse match a list of schedules in one call. Creates or replaces changed schedules, resumes paused ones and drops tasks not in the list.'
+execute as owner
+as 
+$$
+// Initialize Variables
+var result = {schedules: {}, dropped: {}};
+var valid_sizes = ['xsmall', 'small', 'medium', 'large', 'xlarge', 'xxlarge', 'xxxlarge', 'x4large', 'x5large', 'x6large'];
+
+// Function to easily execute and return first-record, single-column results.
+function run_sql(script_text, return_column) {
+	var statement = snowflake.createStatement({sqlText: script_text});
+	var fun_is_ok = true;
+	var fun_result = {};
+	
+	try {
+		var stmt_result = statement.execute();
+	}
+	catch(err) {
+		err.statement = script_text
+		fun_result = err;
+		fun_is_ok = false;
+		fun_result.result = "ERROR";
+	}
+	if(fun_is_ok) {
+		stmt_result.next();
+		fun_result.result = stmt_result.getColumnValue(return_column);
+	}
+	return fun_result;
+}
+
+var warehouse_name = WAREHOUSE_NAME.toLowerCase();
+if(!/^[a-z0-9_$]+$/.test(warehouse_name)) {
+	result.error = "Invalid warehouse name: " + WAREHOUSE_NAME;
+	return result;
+}
+var task_prefix = "resize_" + warehouse_name + "_schedule_";
+
+// Capture the current task set of this warehouse.
+var existing = {};
+var show_result = snowflake.createStatement({sqlText: "show tasks like '" + task_prefix + "%' in schema scheduling"}).execute();
+while(show_result.next()) {
+	var existing_name = show_result.getColumnValue("name").toLowerCase();
+	if(existing_name.indexOf(task_prefix) == 0 && /^[0-9]+$/.test(existing_name.substring(task_prefix.length))) {
+		existing[existing_name] = {
+			schedule: show_result.getColumnValue("schedule"),
+			definition: show_result.getColumnValue("definition").trim().toLowerCase(),
+			state: show_result.getColumnValue("state")
+		};
+	}
+}
+
+for(var i = 0; i < SCHEDULES.length; i++) {
+	var schedule = SCHEDULES[i];
+	var schedule_result = {};
+	result.schedules[schedule.index] = schedule_result;
+
+	// Values are placed into DDL, so only allow what a valid schedule can contain.
+	if(!/^[0-9]+$/.test(String(schedule.index)) || valid_sizes.indexOf(schedule.size) < 0
+		|| !/^[0-9A-Za-z*,\/?#\- ]+$/.test(schedule.cron) || !/^[A-Za-z0-9_\/+\-]+$/.test(schedule.tz)) {
+		schedule_result.action = "invalid";
+		schedule_result.result = "ERROR";
+		continue;
+	}
+
+	var task_name = task_prefix + schedule.index;
+	var task_schedule = "USING CRON " + schedule.cron + " " + schedule.tz;
+	var task_definition = "alter warehouse " + warehouse_name + " set warehouse_size = " + schedule.size;
+	var current = existing[task_name];
+	delete existing[task_name];
+
+	if(!current || current.schedule != task_schedule || current.definition != task_definition) {
+		schedule_result.action = current ? "replaced" : "created";
+		schedule_result.create = run_sql(`-- Create task
+create or replace task scheduling.` + task_name + `
+  warehouse = tagging_assist_scheduler_wh
+  schedule = '` + task_schedule + `' 
+as 
+` + task_definition + `
+`, 1);
+		schedule_result.grant = run_sql("grant all on task scheduling." + task_name + " to role sysadmin", 1);
+		schedule_result.resume = run_sql("alter task scheduling." + task_name + " resume", 1);
+	}
+	else if(current.state != "started") {
+		schedule_result.action = "resumed";
+		schedule_result.resume = run_sql("alter task scheduling." + task_name + " resume", 1);
+	}
+	else {
+		schedule_result.action = "unchanged";
+	}
+}
+
+// Anything left over is no longer in the list of schedules.
+for(var task_name in existing) {
+	result.dropped[task_name] = run_sql("drop task scheduling." + task_name, 1);
+}
+
+return result;
+$$
+;
+
+grant usage on procedure sp_reconcile_warehouse_size_tasks(varchar, variant) to role sysadmin;
+
+create or replace procedure sp_set_warehouse_size_tasks_state(WAREHOUSE_NAME varchar, ACTION varchar)
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure for suspending or resuming all resizing tasks of a warehouse. Only tasks not already in the target state are altered.'
+execute as owner
+as 
+$$
+// Initialize Variables
+var result = {altered: {}, unchanged: []};
+var target_states = {suspend: "suspended", resume: "started"};
+
+if(!(ACTION in target_states)) {
+	result.error = "Action: " + ACTION + " not supported";
+	return result;
+}
+
+var warehouse_name = WAREHOUSE_NAME.toLowerCase();
+if(!/^[a-z0-9_$]+$/.test(warehouse_name)) {
+	result.error = "Invalid warehouse name: " + WAREHOUSE_NAME;
+	return result;
+}
+var task_prefix = "resize_" + warehouse_name + "_schedule_";
+
+var show_result = snowflake.createStatement({sqlText: "show tasks like '" + task_prefix + "%' in schema scheduling"}).execute();
+var task_names = [];
+while(show_result.next()) {
+	var task_name = show_result.getColumnValue("name").toLowerCase();
+	if(task_name.indexOf(task_prefix) != 0 || !/^[0-9]+$/.test(task_name.substring(task_prefix.length))) {
+		continue;
+	}
+	if(show_result.getColumnValue("state") == target_states[ACTION]) {
+		result.unchanged.push(task_name);
+	}
+	else {
+		task_names.push(task_name);
+	}
+}
+
+for(var i = 0; i < task_names.length; i++) {
+	var alter_sql = "alter task scheduling." + task_names[i] + " " + ACTION;
+	try {
+		var alter_result = snowflake.createStatement({sqlText: alter_sql}).execute();
+		alter_result.next();
+		result.altered[task_names[i]] = {result: alter_result.getColumnValue(1)};
+	}
+	catch(err) {
+		err.statement = alter_sql;
+		err.result = "ERROR";
+		result.altered[task_names[i]] = err;
+	}
+}
+
+return result;
+$$
+;
+
+grant usage on procedure sp_set_warehouse_size_tasks_state(varchar, varchar) to role sysadmin;
+
+create or replace procedure sp_save_warehouse_schedules(WAREHOUSE_NAME varchar, SCHEDULES variant)
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure for saving all schedules of a warehouse to the schedule table of the dispatcher engine in one call. Schedules not in the list are deleted.'
+execute as owner
+as 
+$$
+// Initialize Variables
+var result = {schedules: {}, dropped: {}};
+var valid_sizes = ['xsmall', 'small', 'medium', 'large', 'xlarge', 'xxlarge', 'xxxlarge', 'x4large', 'x5large', 'x6large'];
+
+var warehouse_name = WAREHOUSE_NAME.toLowerCase();
+if(!/^[a-z0-9_$]+$/.test(warehouse_name)) {
+	result.error = "Invalid warehouse name: " + WAREHOUSE_NAME;
+	return result;
+}
+
+var cron_names = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec", "sun", "mon", "tue", "wed", "thu", "fri", "sat"];
+
+// The dispatcher matches numbers, names, ranges, steps, * and ?. Returns the first token it can't, e.g. L, W or #.
+function get_unsupported_cron_token(cron) {
+	var fields = cron.trim().split(/\s+/);
+	if(fields.length != 5) {
+		return cron;
+	}
+	var tokens = fields.join(",").toLowerCase().split(/[,\/\-]/);
+	for(var i = 0; i < tokens.length; i++) {
+		if(!/^([0-9]+|\*|\?)$/.test(tokens[i]) && cron_names.indexOf(tokens[i]) < 0) {
+			return tokens[i];
+		}
+	}
+	return null;
+}
+
+var valid_schedules = [];
+for(var i = 0; i < SCHEDULES.length; i++) {
+	var schedule = SCHEDULES[i];
+	var schedule_result = {action: "saved", result: "success"};
+	result.schedules[schedule.index] = schedule_result;
+
+	if(!/^[0-9]+$/.test(String(schedule.index)) || valid_sizes.indexOf(schedule.size) < 0
+		|| !/^[0-9A-Za-z*,\/?#\- ]+$/.test(schedule.cron) || !/^[A-Za-z0-9_\/+\-]+$/.test(schedule.tz)) {
+		schedule_result.action = "invalid";
+		schedule_result.result = "ERROR";
+		continue;
+	}
+	var unsupported_token = get_unsupported_cron_token(schedule.cron);
+	if(unsupported_token !== null) {
+		schedule_result.action = "invalid";
+		schedule_result.result = "ERROR";
+		schedule_result.message = "Unsupported CRON value '" + unsupported_token + "' in '" + schedule.cron + "': the dispatcher engine does not support L, W or #";
+		continue;
+	}
+	// The dispatcher converts every tick to the schedule's timezone, so reject unknown ones here.
+	try {
+		snowflake.createStatement({sqlText: "select convert_timezone(?, current_timestamp())", binds: [schedule.tz]}).execute();
+	}
+	catch(err) {
+		schedule_result.action = "invalid";
+		schedule_result.result = "ERROR";
+		schedule_result.message = err.message;
+		continue;
+	}
+	valid_schedules.push({index: Number(schedule.index), size: schedule.size, cron: schedule.cron, tz: schedule.tz});
+}
+
+try {
+	snowflake.createStatement({sqlText: "begin"}).execute();
+
+	var keep_indexes = valid_schedules.map(function(schedule) { return schedule.index; });
+	var drop_stmt = snowflake.createStatement({sqlText: `select schedule_index
+  from scheduling.warehouse_schedules
+ where warehouse_name = ?
+   and not array_contains(schedule_index::variant, parse_json(?))`, binds: [warehouse_name, JSON.stringify(keep_indexes)]}).execute();
+	while(drop_stmt.next()) {
+		result.dropped["resize_" + warehouse_name + "_schedule_" + drop_stmt.getColumnValue(1)] = {result: "success"};
+	}
+	snowflake.createStatement({sqlText: `delete from scheduling.warehouse_schedules
+ where warehouse_name = ?
+   and not array_contains(schedule_index::variant, parse_json(?))`, binds: [warehouse_name, JSON.stringify(keep_indexes)]}).execute();
+
+	snowflake.createStatement({sqlText: `merge into scheduling.warehouse_schedules t
+using (
+    select ? as warehouse_name
+          ,value:index::number as schedule_index
+          ,value:size::varchar as warehouse_size
+          ,value:cron::varchar as cron
+          ,value:tz::varchar as timezone
+      from table(flatten(parse_json(?)))
+    ) s
+   on t.warehouse_name = s.warehouse_name
+  and t.schedule_index = s.schedule_index
+ when matched then update set
+      warehouse_size = s.warehouse_size
+     ,cron = s.cron
+     ,timezone = s.timezone
+     ,enabled = true
+     ,updated_at = current_timestamp()
+ when not matched then insert (warehouse_name, schedule_index, warehouse_size, cron, timezone)
+      values (s.warehouse_name, s.schedule_index, s.warehouse_size, s.cron, s.timezone)`, binds: [warehouse_name, JSON.stringify(valid_schedules)]}).execute();
+
+	snowflake.createStatement({sqlText: "commit"}).execute();
+}
+catch(err) {
+	snowflake.createStatement({sqlText: "rollback"}).execute();
+	result.error = err.message;
+}
+
+return result;
+$$
+;
+
+grant usage on procedure sp_save_warehouse_schedules(varchar, variant) to role sysadmin;
+
+create or replace procedure sp_save_many_warehouse_schedules(ENGINE varchar, WAREHOUSE_SCHEDULES variant)
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure for saving all schedules of many warehouses in one call. WAREHOUSE_SCHEDULES maps each warehouse name to its list of schedules. ENGINE is the scheduling engine, tasks or dispatcher. Reports the result of each warehouse.'
+execute as caller
+as 
+$$
+// Initialize Variables
+var result = {warehouses: {}};
+var procedures = {tasks: "sp_reconcile_warehouse_size_tasks", dispatcher: "sp_save_warehouse_schedules"};
+
+var procedure_name = procedures[ENGINE];
+if(procedure_name === undefined) {
+	result.error = "Invalid scheduling engine: " + ENGINE;
+	return result;
+}
+
+// Each warehouse is independent, so one failure doesn't stop the others.
+for(var warehouse_name in WAREHOUSE_SCHEDULES) {
+	try {
+		var call_stmt = snowflake.createStatement({sqlText: "call tagging_assist_db.utility." + procedure_name + "(?, parse_json(?))"
+			,binds: [warehouse_name, JSON.stringify(WAREHOUSE_SCHEDULES[warehouse_name])]}).execute();
+		call_stmt.next();
+		result.warehouses[warehouse_name] = call_stmt.getColumnValue(1);
+	}
+	catch(err) {
+		result.warehouses[warehouse_name] = {error: err.message, schedules: {}, dropped: {}};
+	}
+}
+
+return result;
+$$
+;
+
+grant usage on procedure sp_save_many_warehouse_schedules(varchar, variant) to role sysadmin;
+
+create or replace procedure sp_set_warehouse_tags(TAG_CHANGES variant)
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure for setting and unsetting assistant tags on many warehouses in one call. TAG_CHANGES maps each warehouse name to {tag name: value}, a null value unsets the tag. Reports the result of each warehouse.'
+execute as caller
+as 
+$$
+// Initialize Variables
+var result = {warehouses: {}};
+
+for(var warehouse_name in TAG_CHANGES) {
+	var tag_values = TAG_CHANGES[warehouse_name];
+	var warehouse_result = {result: "success", statements: []};
+	result.warehouses[warehouse_name] = warehouse_result;
+
+	var set_tags = [];
+	var unset_tags = [];
+	var invalid_tags = [];
+	for(var tag_name in tag_values) {
+		if(!/^[A-Za-z_][A-Za-z0-9_$]*$/.test(tag_name)) {
+			invalid_tags.push(tag_name);
+		}
+		else if(tag_values[tag_name] === null || tag_values[tag_name] === undefined) {
+			unset_tags.push("tagging_assist_db.tagging." + tag_name);
+		}
+		else {
+			set_tags.push("tagging_assist_db.tagging." + tag_name + " = '" + String(tag_values[tag_name]).replace(/\\/g, "\\\\").replace(/'/g, "''") + "'");
+		}
+	}
+	if(invalid_tags.length > 0) {
+		warehouse_result.result = "ERROR";
+		warehouse_result.message = "Invalid tag names: " + invalid_tags.join(", ");
+		continue;
+	}
+
+	// Names come from show warehouses, so they are quoted as they are.
+	var warehouse_identifier = '"' + warehouse_name.replace(/"/g, '""') + '"';
+	if(set_tags.length > 0) {
+		warehouse_result.statements.push("alter warehouse " + warehouse_identifier + " set tag " + set_tags.join(", "));
+	}
+	if(unset_tags.length > 0) {
+		warehouse_result.statements.push("alter warehouse " + warehouse_identifier + " unset tag " + unset_tags.join(", "));
+	}
+
+	// Each warehouse is independent, so one failure doesn't stop the others.
+	try {
+		for(var i = 0; i < warehouse_result.statements.length; i++) {
+			snowflake.createStatement({sqlText: warehouse_result.statements[i]}).execute();
+		}
+	}
+	catch(err) {
+		warehouse_result.result = "ERROR";
+		warehouse_result.message = err.message;
+	}
+}
+
+return result;
+$$
+;
+
+grant usage on procedure sp_set_warehouse_tags(variant) to role sysadmin;
+
+create or replace procedure sp_dispatch_warehouse_schedules()
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure run by the dispatcher task. Evaluates every enabled schedule for the minutes since the last tick and resizes the warehouses that are due.'
+execute as owner
+as 
+$$
+// Initialize Variables
+var result = {minutes: 0, resized: {}};
+var valid_sizes = ['xsmall', 'small', 'medium', 'large', 'xlarge', 'xxlarge', 'xxxlarge', 'x4large', 'x5large', 'x6large'];
+// Missed ticks are caught up, but no further back than this.
+var max_catch_up_minutes = 60;
+var day_names = {sun: 0, mon: 1, tue: 2, wed: 3, thu: 4, fri: 5, sat: 6};
+var month_names = {jan: 1, feb: 2, mar: 3, apr: 4, may: 5, jun: 6, jul: 7, aug: 8, sep: 9, oct: 10, nov: 11, dec: 12};
+
+function to_cron_number(token, names) {
+	if(names && token in names) {
+		return names[token];
+	}
+	return /^[0-9]+$/.test(token) ? parseInt(token, 10) : NaN;
+}
+
+// Does one cron field (e.g. "*/15", "1-5", "mon,wed,fri") match value?
+function cron_field_matches(field, value, min, max, names) {
+	var parts = field.toLowerCase().split(",");
+	for(var i = 0; i < parts.length; i++) {
+		var range = parts[i];
+		var step = 1;
+		if(range.indexOf("/") >= 0) {
+			step = to_cron_number(range.split("/")[1]);
+			range = range.split("/")[0];
+		}
+		var low = min;
+		var high = max;
+		if(range != "*" && range != "?") {
+			var bounds = range.split("-");
+			low = to_cron_number(bounds[0], names);
+			high = bounds.length > 1 ? to_cron_number(bounds[1], names) : (parts[i].indexOf("/") >= 0 ? max : low);
+		}
+		if(value >= low && value <= high && (value - low) % step == 0) {
+			return true;
+		}
+	}
+	return false;
+}
+
+function cron_matches(cron, minute, hour, day, month, day_of_week) {
+	var fields = cron.trim().split(/\s+/);
+	if(fields.length != 5) {
+		return false;
+	}
+	if(!cron_field_matches(fields[0], minute, 0, 59) || !cron_field_matches(fields[1], hour, 0, 23)
+		|| !cron_field_matches(fields[3], month, 1, 12, month_names)) {
+		return false;
+	}
+	var day_matches = cron_field_matches(fields[2], day, 1, 31);
+	var day_of_week_matches = cron_field_matches(fields[4], day_of_week, 0, 6, day_names) || (day_of_week == 0 && cron_field_matches(fields[4], 7, 0, 7, day_names));
+	// As in cron, when both day fields are restricted either one may match.
+	var day_restricted = ["*", "?"].indexOf(fields[2]) < 0;
+	var day_of_week_restricted = ["*", "?"].indexOf(fields[4]) < 0;
+	if(day_restricted && day_of_week_restricted) {
+		return day_matches || day_of_week_matches;
+	}
+	return day_matches && day_of_week_matches;
+}
+
+// Work out which minutes this tick covers.
+var tick_stmt = snowflake.createStatement({sqlText: `select to_varchar(this_tick, 'YYYY-MM-DD HH24:MI:SS TZH:TZM')
+      ,datediff(minute, nvl(last_tick, dateadd(minute, -1, this_tick)), this_tick)
+  from (
+    select date_trunc(minute, current_timestamp()) as this_tick
+          ,(select max(dispatched_through) from scheduling.warehouse_schedule_dispatches) as last_tick
+    )`}).execute();
+tick_stmt.next();
+var dispatch_through = tick_stmt.getColumnValue(1);
+result.minutes = Math.min(Math.max(tick_stmt.getColumnValue(2), 0), max_catch_up_minutes);
+
+// Local time parts of each covered minute, in each schedule's own timezone. Latest minute first.
+var due = {};
+if(result.minutes > 0) {
+	var schedule_stmt = snowflake.createStatement({sqlText: `with
+  ticks as (
+    select dateadd(minute, -(row_number() over (order by seq4()) - 1), to_timestamp_tz(?, 'YYYY-MM-DD HH24:MI:SS TZH:TZM')) as tick
+      from table(generator(rowcount => ` + result.minutes + `))
+    )
+  ,local_ticks as (
+    select s.warehouse_name
+          ,s.warehouse_size
+          ,s.cron
+          ,s.schedule_index
+          ,t.tick
+          ,convert_timezone(s.timezone, t.tick) as local_tick
+      from scheduling.warehouse_schedules s
+     cross join ticks t
+     where s.enabled
+    )
+select warehouse_name
+      ,warehouse_size
+      ,cron
+      ,date_part(minute, local_tick) as local_minute
+      ,date_part(hour, local_tick) as local_hour
+      ,date_part(day, local_tick) as local_day
+      ,date_part(month, local_tick) as local_month
+      ,mod(date_part(dayofweekiso, local_tick), 7) as local_day_of_week
+  from local_ticks
+ order by tick desc, schedule_index desc`, binds: [dispatch_through]}).execute();
+
+	while(schedule_stmt.next()) {
+		var warehouse_name = schedule_stmt.getColumnValue(1);
+		// Only the latest due schedule of each warehouse matters.
+		if(warehouse_name in due) {
+			continue;
+		}
+		if(cron_matches(schedule_stmt.getColumnValue(3), schedule_stmt.getColumnValue(4), schedule_stmt.getColumnValue(5)
+			, schedule_stmt.getColumnValue(6), schedule_stmt.getColumnValue(7), schedule_stmt.getColumnValue(8))) {
+			due[warehouse_name] = schedule_stmt.getColumnValue(2);
+		}
+	}
+}
+
+for(var warehouse_name in due) {
+	if(valid_sizes.indexOf(due[warehouse_name]) < 0) {
+		result.resized[warehouse_name] = {result: "ERROR", message: "Invalid size: " + due[warehouse_name]};
+		continue;
+	}
+	try {
+		var alter_stmt = snowflake.createStatement({sqlText: "alter warehouse identifier(?) set warehouse_size = " + due[warehouse_name], binds: [warehouse_name]}).execute();
+		alter_stmt.next();
+		result.resized[warehouse_name] = {size: due[warehouse_name], result: alter_stmt.getColumnValue(1)};
+	}
+	catch(err) {
+		result.resized[warehouse_name] = {size: due[warehouse_name], result: "ERROR", message: err.message};
+	}
+}
+
+snowflake.createStatement({sqlText: `insert into scheduling.warehouse_schedule_dispatches (dispatched_through, resized)
+select to_timestamp_tz(?, 'YYYY-MM-DD HH24:MI:SS TZH:TZM'), parse_json(?)`, binds: [dispatch_through, JSON.stringify(result.resized)]}).execute();
+snowflake.createStatement({sqlText: "delete from scheduling.warehouse_schedule_dispatches where dispatched_at < dateadd(day, -7, current_timestamp())"}).execute();
+
+return result;
+$$
+;
+
+-- One serverless task for all schedules in the table. It is created suspended, resume it 
+-- when switching to the dispatcher engine: alter task scheduling.dispatch_warehouse_schedules resume;
+create task if not exists scheduling.dispatch_warehouse_schedules
+  user_task_managed_initial_warehouse_size = 'XSMALL'
+  schedule = 'USING CRON * * * * * UTC'
+  comment = 'Dispatcher for the schedule table. Resizes every warehouse that is due in one run.'
+as 
+call tagging_assist_db.utility.sp_dispatch_warehouse_schedules()
+;
+
+grant all on task scheduling.dispatch_warehouse_schedules to role sysadmin;
+
+create or replace procedure sp_refresh_warehouse_usage_rollups()
+returns variant
+language javascript
+--called on null input
+comment = 'Procedure run by the rollup task. Merges the hours of warehouse metering history since the last run, and the tags assigned to each warehouse, into the hourly rollup tables.'
+execute as owner
+as 
+$$
+// Initialize Variables
+var result = {};
+// account_usage can revise recent hours, so they are merged again on each run.
+var late_arrival_hours = 6;
+// How far back an empty rollup is filled on its first run.
+var backfill_days = 90;
+
+var from_stmt = snowflake.createStatement({sqlText: `select to_varchar(nvl(dateadd(hour, -` + late_arrival_hours + `, max(start_time))
+      ,dateadd(day, -` + backfill_days + `, date_trunc(hour, current_timestamp()))), 'YYYY-MM-DD HH24:MI:SS TZH:TZM')
+  from metadata.warehouse_usage_hourly`}).execute();
+from_stmt.next();
+result.refreshed_from = from_stmt.getColumnValue(1);
+
+snowflake.createStatement({sqlText: "begin"}).execute();
+try {
+	var usage_stmt = snowflake.createStatement({sqlText: `merge into metadata.warehouse_usage_hourly t
+using (
+    select warehouse_name, start_time, credits_used, credits_used_compute, credits_used_cloud_services
+      from snowflake.account_usage.warehouse_metering_history
+     where start_time >= to_timestamp_tz(?, 'YYYY-MM-DD HH24:MI:SS TZH:TZM')
+    ) s
+on t.warehouse_name = s.warehouse_name and t.start_time = s.start_time
+when matched and (t.credits_used <> s.credits_used or t.credits_used_compute <> s.credits_used_compute
+    or t.credits_used_cloud_services <> s.credits_used_cloud_services) then update set
+     credits_used = s.credits_used
+    ,credits_used_compute = s.credits_used_compute
+    ,credits_used_cloud_services = s.credits_used_cloud_services
+    ,updated_at = current_timestamp()
+when not matched then insert (warehouse_name, start_time, credits_used, credits_used_compute, credits_used_cloud_services)
+    values (s.warehouse_name, s.start_time, s.credits_used, s.credits_used_compute, s.credits_used_cloud_services)`, binds: [result.refreshed_from]}).execute();
+	usage_stmt.next();
+	result.usage = {inserted: usage_stmt.getColumnValue(1), updated: usage_stmt.getColumnValue(2)};
+
+	// Hours being merged are attributed to the tags assigned now.
+	var current_tags_sql = `select object_name as warehouse_name, tag_name, tag_value
+      from snowflake.account_usage.tag_references
+     where tag_database = 'TAGGING_ASSIST_DB'
+       and tag_schema = 'TAGGING'
+       and tag_name <> 'TAG_ASSISTANT_ENABLED'
+       and domain = 'WAREHOUSE'
+       and object_deleted is null`;
+
+	var tags_stmt = snowflake.createStatement({sqlText: `merge into metadata.warehouse_tag_usage_hourly t
+using (
+    select u.warehouse_name, u.start_time, c.tag_name, c.tag_value
+      from metadata.warehouse_usage_hourly u
+      join (` + current_tags_sql + `) c on c.warehouse_name = u.warehouse_name
+     where u.start_time >= to_timestamp_tz(?, 'YYYY-MM-DD HH24:MI:SS TZH:TZM')
+    ) s
+on t.warehouse_name = s.warehouse_name and t.start_time = s.start_time and t.tag_name = s.tag_name
+when matched and t.tag_value is distinct from s.tag_value then update set
+     tag_value = s.tag_value
+    ,updated_at = current_timestamp()
+when not matched then insert (warehouse_name, start_time, tag_name, tag_value)
+    values (s.warehouse_name, s.start_time, s.tag_name, s.tag_value)`, binds: [result.refreshed_from]}).execute();
+	tags_stmt.next();
+	result.tags = {inserted: tags_stmt.getColumnValue(1), updated: tags_stmt.getColumnValue(2)};
+
+	// Tags unset since the hour was last merged.
+	var unset_stmt = snowflake.createStatement({sqlText: `delete from metadata.warehouse_tag_usage_hourly t
+ where t.start_time >= to_timestamp_tz(?, 'YYYY-MM-DD HH24:MI:SS TZH:TZM')
+   and not exists (
+    select 1 from (` + current_tags_sql + `) c
+     where c.warehouse_name = t.warehouse_name and c.tag_name = t.tag_name
+    )`, binds: [result.refreshed_from]}).execute();
+	unset_stmt.next();
+	result.tags.deleted = unset_stmt.getColumnValue(1);
+
+	snowflake.createStatement({sqlText: "commit"}).execute();
+}
+catch(err) {
+	snowflake.createStatement({sqlText: "rollback"}).execute();
+	result.error = err.message;
+}
+
+return result;
+$$
+;
+
+grant usage on procedure sp_refresh_warehouse_usage_rollups() to role sysadmin;
+
+-- Rolls up the new hours of metering history every hour. Run it once right away to backfill:
+-- execute task scheduling.refresh_warehouse_usage_rollups;
+create task if not exists scheduling.refresh_warehouse_usage_rollups
+  user_task_managed_initial_warehouse_size = 'XSMALL'
+  schedule = 'USING CRON 15 * * * * UTC'
+  comment = 'Merges new warehouse metering history and tag assignments into the hourly rollup tables.'
+as 
+call tagging_assist_db.utility.sp_refresh_warehouse_usage_rollups()
+;
+
+alter task scheduling.refresh_warehouse_usage_rollups resume;
+
+grant all on task scheduling.refresh_warehouse_usage_rollups to role sysadmin;
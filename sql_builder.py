@@ -0,0 +1,308 @@
+'''
+Builds the SQL statements the Tagging Assistant runs, for the Streamlit
+app and the headless CLI (tagging_cli.py) alike. Only depends on
+constants, so it can be imported without Streamlit.
+'''
+import re, json
+import constants
+
+TAG_SCHEMA = 'tagging_assist_db.tagging'
+
+SCHEDULE_TABLE = 'tagging_assist_db.scheduling.warehouse_schedules'
+
+# Warehouse properties that can be altered, in the order they are written.
+WAREHOUSE_PROPERTIES = [
+    'warehouse_size',
+    'auto_suspend',
+    'auto_resume',
+    'comment',
+    'scaling_policy',
+    'min_cluster_count',
+    'max_cluster_count',
+    'enable_query_acceleration',
+    'query_acceleration_max_scale_factor'
+    ]
+
+# Max statements per execute immediate block, see get_batch_sql.
+BATCH_MAX_STATEMENTS = 200
+
+# Max warehouses per call of the bulk tagging procedure, see get_set_tags_calls.
+TAG_CALL_MAX_WAREHOUSES = 500
+
+# Max warehouses per call of the bulk schedules procedure, see get_save_schedules_calls.
+SCHEDULE_CALL_MAX_WAREHOUSES = 100
+
+def quote_literal(value):
+    '''
+    Returns value as a single quoted SQL string literal.
+    '''
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "''") + "'"
+
+def quote_identifier(name):
+    '''
+    Returns name as is if it is a plain identifier, otherwise double quoted.
+    '''
+    if re.match('^[A-Za-z_][A-Za-z0-9_$]*$', name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+# Names the dispatcher engine's cron matcher knows, see sp_dispatch_warehouse_schedules.
+DISPATCHER_CRON_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'
+                        ,'sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+
+def check_dispatcher_cron(cron):
+    '''
+    Raises ValueError if the dispatcher engine can't match cron. It knows
+    numbers, names, ranges, steps, * and ?, but not L, W or #, which
+    would otherwise never fire.
+    '''
+    fields = str(cron).split()
+    if len(fields) != 5:
+        raise ValueError('Invalid CRON schedule: ' + str(cron))
+    for field in fields:
+        for token in re.split('[,/-]', field.lower()):
+            if not (token.isdigit() or token in ('*', '?') or token in DISPATCHER_CRON_NAMES):
+                raise ValueError('Unsupported CRON value ' + repr(token) + ' in ' + repr(str(cron)) + ': the dispatcher engine does not support L, W or #')
+
+def get_size_code(size):
+    '''
+    Returns the size code (e.g. 'xsmall') for a size name (e.g. 'X-Small') or code.
+    '''
+    if size in constants.WAREHOUSE_SIZES:
+        return constants.WAREHOUSE_SIZES[size]['code']
+    if str(size).lower() in constants.WAREHOUSE_CODE_INDEX:
+        return str(size).lower()
+    raise ValueError('Unknown warehouse size: ' + str(size))
+
+def format_property_value(property_name, value):
+    if property_name == 'warehouse_size':
+        return get_size_code(value)
+    elif property_name == 'comment':
+        return quote_literal(value)
+    elif property_name == 'scaling_policy':
+        return str(value).upper()
+    elif isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+def get_alter_warehouse_sql(warehouse_name, properties):
+    '''
+    Returns an alter warehouse statement setting the given properties
+    (see WAREHOUSE_PROPERTIES), or None if there is nothing to set.
+    '''
+    property_names = [property_name for property_name in WAREHOUSE_PROPERTIES if property_name in properties]
+    if not property_names:
+        return None
+    alter_sql = 'alter warehouse ' + quote_identifier(warehouse_name) + ' set\n'
+    for i, property_name in enumerate(property_names):
+        alter_sql += '     ' + (' ' if i == 0 else ',') + property_name + ' = ' + format_property_value(property_name, properties[property_name]) + '\n'
+    return alter_sql
+
+def get_set_tags_sql(warehouse_name, tag_values):
+    '''
+    Returns the statements that set (or, for a value of None, unset) the
+    given tags of the assistant's tag schema on a warehouse.
+    '''
+    statements = []
+    set_tags = [TAG_SCHEMA + '.' + tag_name + ' = ' + quote_literal(tag_values[tag_name]) for tag_name in tag_values.keys() if tag_values[tag_name] is not None]
+    unset_tags = [TAG_SCHEMA + '.' + tag_name for tag_name in tag_values.keys() if tag_values[tag_name] is None]
+    if set_tags:
+        statements.append('alter warehouse ' + quote_identifier(warehouse_name) + ' set tag ' + ', '.join(set_tags))
+    if unset_tags:
+        statements.append('alter warehouse ' + quote_identifier(warehouse_name) + ' unset tag ' + ', '.join(unset_tags))
+    return statements
+
+def get_set_tags_calls(tag_changes):
+    '''
+    Returns the calls of the bulk tagging procedure that set (or, for a
+    value of None, unset) tags on many warehouses. tag_changes is a dict
+    of warehouse name -> {tag name: value}. Each call covers at most
+    TAG_CALL_MAX_WAREHOUSES warehouses and is a (sql, result column,
+    warehouse names) tuple.
+    '''
+    calls = []
+    warehouse_names = list(tag_changes.keys())
+    for start in range(0, len(warehouse_names), TAG_CALL_MAX_WAREHOUSES):
+        call_names = warehouse_names[start:start + TAG_CALL_MAX_WAREHOUSES]
+        call_sql = get_call_sql('sp_set_warehouse_tags', dict((name, tag_changes[name]) for name in call_names))
+        calls.append((call_sql, 'SP_SET_WAREHOUSE_TAGS', call_names))
+    return calls
+
+def get_assistant_enabled_sql(warehouse_name, enabled):
+    return get_set_tags_sql(warehouse_name, {'tag_assistant_enabled': 'y' if enabled else 'n'})[0]
+
+def get_current_tag_value_sql(tag_name, warehouse_name):
+    return "select nvl(system$get_tag('" + TAG_SCHEMA + "." + tag_name + "', '" + warehouse_name + "', 'warehouse'), '<none set>') as tag_value"
+
+def get_query_intervals_sql(warehouse_name, days=constants.SUSPEND_SIMULATION_DAYS):
+    '''
+    Returns the query for the start and end times, in epoch milliseconds,
+    of the queries a warehouse ran in the last days. Queries that used
+    no compute (e.g. metadata only) have no warehouse size and are left out.
+    '''
+    intervals_sql = constants.QUERY_INTERVAL_SQL + " where warehouse_name = " + quote_literal(warehouse_name)
+    intervals_sql += " and warehouse_size is not null and end_time is not null"
+    intervals_sql += " and start_time >= dateadd(day, -" + str(int(days)) + ", current_timestamp())"
+    return intervals_sql
+
+def get_warehouse_load_sql(warehouse_name, days=constants.SIZING_ANALYSIS_DAYS):
+    '''
+    Returns the query for a warehouse's hourly query and load stats over
+    the last days: queries, execution and queued seconds and GB spilled
+    from query_history, average running and queued load from
+    warehouse_load_history, and the sum over queries of the index (into
+    constants.WAREHOUSE_CODE_LIST) of the size each query ran at. Hours
+    are returned as epoch seconds.
+    '''
+    size_index_sql = "case warehouse_size"
+    for size_index, size_code in enumerate(constants.WAREHOUSE_CODE_LIST):
+        size_index_sql += " when " + quote_literal(constants.WAREHOUSE_SIZE_BY_CODE[size_code]) + " then " + str(size_index)
+    size_index_sql += " end"
+    warehouse_filter = " where warehouse_name = " + quote_literal(warehouse_name)
+    warehouse_filter += " and start_time >= dateadd(day, -" + str(int(days)) + ", current_timestamp())"
+    load_sql = "-- Hourly query and load stats of one warehouse, for the right-sizing advisor\n"
+    load_sql += "select date_part(epoch_second, hour_start) as hour_start\n"
+    load_sql += "      ,sum(queries), sum(execution_seconds), sum(queued_seconds), sum(local_spill_gb), sum(remote_spill_gb)\n"
+    load_sql += "      ,max(avg_running), max(avg_queued_load), sum(size_index)\n"
+    load_sql += "  from (\n"
+    load_sql += "    select date_trunc(hour, start_time) as hour_start, count(*) as queries\n"
+    load_sql += "          ,sum(execution_time) / 1000.0 as execution_seconds, sum(queued_overload_time) / 1000.0 as queued_seconds\n"
+    load_sql += "          ,sum(bytes_spilled_to_local_storage) / 1073741824.0 as local_spill_gb, sum(bytes_spilled_to_remote_storage) / 1073741824.0 as remote_spill_gb\n"
+    load_sql += "          ,null as avg_running, null as avg_queued_load, sum(" + size_index_sql + ") as size_index\n"
+    load_sql += "      from snowflake.account_usage.query_history" + warehouse_filter + " and warehouse_size is not null\n"
+    load_sql += "     group by 1\n"
+    load_sql += "    union all\n"
+    load_sql += "    select date_trunc(hour, start_time), 0, 0, 0, 0, 0, avg(avg_running), avg(avg_queued_load), 0\n"
+    load_sql += "      from snowflake.account_usage.warehouse_load_history" + warehouse_filter + "\n"
+    load_sql += "     group by 1\n"
+    load_sql += "    )\n"
+    load_sql += " group by 1"
+    return load_sql
+
+def get_chargeback_sql(tag_name, days=constants.CHARGEBACK_DEFAULT_DAYS):
+    '''
+    Returns the query for the daily credits of each value of a tag over
+    the last days, from the hourly rollup tables (see
+    snowflake_pre_script.sql). Warehouses without the tag are grouped
+    under '<none set>'.
+    '''
+    chargeback_sql = constants.CHARGEBACK_SQL + "   and t.tag_name = " + quote_literal(tag_name.upper())
+    chargeback_sql += "\n where u.start_time >= dateadd(day, -" + str(int(days)) + ", current_timestamp())"
+    chargeback_sql += "\n group by 1, 2"
+    return chargeback_sql
+
+def get_call_sql(procedure_name, *args):
+    '''
+    Returns a call of a procedure in the utility schema. Strings are
+    quoted, lists and dicts are passed as variants. The result column
+    is the procedure name in upper case.
+    '''
+    arg_sql = []
+    for arg in args:
+        if isinstance(arg, (list, dict)):
+            arg_sql.append('parse_json(' + quote_literal(json.dumps(arg)) + ')')
+        else:
+            arg_sql.append(quote_literal(arg))
+    return 'call utility.' + procedure_name + '(' + ', '.join(arg_sql) + ')'
+
+def get_schedule_tasks_sql(warehouse_name=None):
+    '''
+    Returns the query for the schedules of a warehouse, or of every
+    warehouse if warehouse_name is None, for the configured scheduling
+    engine. Both return rows shaped like `show tasks`.
+    '''
+    if constants.SCHEDULING_ENGINE == 'dispatcher':
+        if warehouse_name is None:
+            return constants.SCHEDULE_TABLE_SQL + " order by warehouse_name, schedule_index"
+        return constants.SCHEDULE_TABLE_SQL + " where warehouse_name = '" + warehouse_name.lower() + "' order by schedule_index"
+    return "show tasks like 'resize_" + (warehouse_name or '').lower() + "%' in schema scheduling"
+
+def get_save_schedules_sql(warehouse_name, schedules):
+    '''
+    Returns (sql, result column) of the call that saves all schedules of
+    a warehouse in one go. schedules is a list of {index, size, cron, tz}
+    with size as a size code.
+    '''
+    procedure_name = 'sp_reconcile_warehouse_size_tasks'
+    if constants.SCHEDULING_ENGINE == 'dispatcher':
+        procedure_name = 'sp_save_warehouse_schedules'
+    return (get_call_sql(procedure_name, warehouse_name, schedules), procedure_name.upper())
+
+def get_save_schedules_calls(schedule_changes):
+    '''
+    Returns the calls of the bulk schedules procedure that save all
+    schedules of many warehouses, with the configured scheduling engine.
+    schedule_changes is a dict of warehouse name -> list of {index, size,
+    cron, tz}. Each call covers at most SCHEDULE_CALL_MAX_WAREHOUSES
+    warehouses and is a (sql, result column, warehouse names) tuple.
+    '''
+    calls = []
+    warehouse_names = list(schedule_changes.keys())
+    for start in range(0, len(warehouse_names), SCHEDULE_CALL_MAX_WAREHOUSES):
+        call_names = warehouse_names[start:start + SCHEDULE_CALL_MAX_WAREHOUSES]
+        call_sql = get_call_sql('sp_save_many_warehouse_schedules', constants.SCHEDULING_ENGINE, dict((name, schedule_changes[name]) for name in call_names))
+        calls.append((call_sql, 'SP_SAVE_MANY_WAREHOUSE_SCHEDULES', call_names))
+    return calls
+
+def get_schedule_upsert_sql(warehouse_name, schedule_index, size_code, cron, tz):
+    '''
+    Returns the merge that saves one schedule to the dispatcher engine's
+    table. The timezone is converted once so an unknown timezone fails
+    here instead of in the dispatcher. Raises ValueError for a cron the
+    dispatcher can't match, see check_dispatcher_cron.
+    '''
+    check_dispatcher_cron(cron)
+    upsert_sql = "merge into " + SCHEDULE_TABLE + " t using ("
+    upsert_sql += "select " + quote_literal(warehouse_name.lower()) + " as warehouse_name, " + str(int(schedule_index)) + " as schedule_index"
+    upsert_sql += ", " + quote_literal(size_code) + " as warehouse_size, " + quote_literal(cron) + " as cron, " + quote_literal(tz) + " as timezone"
+    upsert_sql += " where convert_timezone(" + quote_literal(tz) + ", current_timestamp()) is not null) s"
+    upsert_sql += " on t.warehouse_name = s.warehouse_name and t.schedule_index = s.schedule_index"
+    upsert_sql += " when matched then update set warehouse_size = s.warehouse_size, cron = s.cron, timezone = s.timezone, enabled = true, updated_at = current_timestamp()"
+    upsert_sql += " when not matched then insert (warehouse_name, schedule_index, warehouse_size, cron, timezone)"
+    upsert_sql += " values (s.warehouse_name, s.schedule_index, s.warehouse_size, s.cron, s.timezone)"
+    return upsert_sql
+
+def get_schedule_enabled_sql(warehouse_name, enabled, schedule_index=None):
+    '''
+    Returns the update that pauses or resumes dispatcher schedules of a
+    warehouse, all of them unless schedule_index is given. Rows already
+    in the target state are not touched.
+    '''
+    enabled_sql = "update " + SCHEDULE_TABLE + " set enabled = " + str(enabled).lower() + ", updated_at = current_timestamp()"
+    enabled_sql += " where warehouse_name = " + quote_literal(warehouse_name.lower()) + " and enabled = " + str(not enabled).lower()
+    if schedule_index is not None:
+        enabled_sql += " and schedule_index = " + str(int(schedule_index))
+    return enabled_sql
+
+def get_schedule_delete_sql(warehouse_name, schedule_index):
+    return "delete from " + SCHEDULE_TABLE + " where warehouse_name = " + quote_literal(warehouse_name.lower()) + " and schedule_index = " + str(int(schedule_index))
+
+def get_batch_sql(statements):
+    '''
+    Wraps statements into one Snowflake Scripting block, so they run in
+    a single round trip. Statements run in order and the block stops at
+    the first error. Statements containing '$$' can't be wrapped and are
+    returned on their own. Returns a list of batches of at most
+    BATCH_MAX_STATEMENTS statements, each a (sql, statements) pair.
+    '''
+    batches = []
+    pending = []
+    for statement in statements + [None]:
+        if statement is None or '$$' in statement or len(pending) == BATCH_MAX_STATEMENTS:
+            if len(pending) == 1:
+                batches.append((pending[0], pending))
+            elif pending:
+                batch_sql = 'execute immediate $$\nbegin\n'
+                for pending_statement in pending:
+                    batch_sql += '  ' + pending_statement.strip() + ';\n'
+                batch_sql += "  return 'Batch of " + str(len(pending)) + " statements executed successfully.';\nend;\n$$"
+                batches.append((batch_sql, pending))
+            pending = []
+        if statement is not None and '$$' in statement:
+            batches.append((statement, [statement]))
+        elif statement is not None:
+            pending.append(statement)
+    return batches
+
+if __name__ == '__main__':
+    pass
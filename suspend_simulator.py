@@ -0,0 +1,86 @@
+'''
+Auto suspend cost simulator. Replays a warehouse's query history
+against each candidate auto suspend setting to estimate the credits
+it would have used and how often it would have resumed.
+
+Query intervals are streamed in chunks and merged into busy intervals
+(periods with at least one query running) as they arrive, so memory
+holds busy periods rather than queries. All interval work is done
+with NumPy array operations, there is no loop over queries.
+'''
+import numpy as np
+import constants, result_stream
+
+# Snowflake bills at least this many seconds each time a warehouse resumes.
+MINIMUM_BILLED_SECONDS = 60
+
+def merge_intervals(intervals):
+    '''
+    Takes an (n, 2) array of start and end times and returns the union
+    of the intervals as a sorted (m, 2) array of non-overlapping
+    intervals.
+    '''
+    if len(intervals) == 0:
+        return np.empty((0, 2))
+    intervals = intervals[np.argsort(intervals[:, 0], kind='stable')]
+    starts = intervals[:, 0]
+    ends = np.maximum(intervals[:, 1], starts)
+    # An interval starts a new busy period if it begins after every earlier interval ended.
+    covered_until = np.maximum.accumulate(ends)
+    is_new_period = np.empty(len(starts), dtype=bool)
+    is_new_period[0] = True
+    is_new_period[1:] = starts[1:] > covered_until[:-1]
+    period_starts = np.flatnonzero(is_new_period)
+    return np.column_stack((starts[period_starts], np.maximum.reduceat(ends, period_starts)))
+
+def load_busy_intervals(dataframe, batch_rows=constants.STREAM_BATCH_ROWS):
+    '''
+    Takes the result of sql_builder.get_query_intervals_sql (start and
+    end in epoch milliseconds) and returns the merged busy intervals in
+    epoch seconds.
+    '''
+    busy_intervals = np.empty((0, 2))
+    for chunk in result_stream.iter_array_chunks(dataframe, 2, batch_rows):
+        chunk = chunk[~np.isnan(chunk).any(axis=1)] / 1000.0
+        busy_intervals = merge_intervals(np.concatenate((busy_intervals, merge_intervals(chunk))))
+    return busy_intervals
+
+def simulate(busy_intervals, suspend_steps, credit_rate, window_seconds):
+    '''
+    Returns one dict per auto suspend setting in suspend_steps (seconds,
+    0 for never) with the billed credits, the credits billed while idle
+    and the number of resumes over the window. After its last query a
+    warehouse stays up for the auto suspend time. Each resume is billed
+    at least MINIMUM_BILLED_SECONDS. A warehouse that never suspends is
+    billed for the whole window.
+    '''
+    busy_seconds = busy_intervals[:, 1] - busy_intervals[:, 0]
+    total_busy_seconds = busy_seconds.sum()
+    gaps = busy_intervals[1:, 0] - busy_intervals[:-1, 1]
+
+    results = []
+    for step in suspend_steps:
+        if len(busy_intervals) == 0:
+            billed_seconds = 0.0
+            resumes = 0
+        elif step == 0:
+            billed_seconds = max(float(window_seconds), busy_intervals[-1, 1] - busy_intervals[0, 0])
+            resumes = 1
+        else:
+            # Idle time after each busy interval, until the next query or the suspend.
+            idle_after = np.append(np.minimum(gaps, step), step)
+            # A gap longer than the step suspends the warehouse, starting a new run.
+            run_ids = np.concatenate(([0], np.cumsum(gaps > step)))
+            run_seconds = np.bincount(run_ids, weights=busy_seconds + idle_after)
+            billed_seconds = np.maximum(run_seconds, MINIMUM_BILLED_SECONDS).sum()
+            resumes = len(run_seconds)
+        results.append({
+            'auto_suspend': step,
+            'credits': round(float(billed_seconds) / 3600 * credit_rate, 2),
+            'idle_credits': round(float(billed_seconds - total_busy_seconds) / 3600 * credit_rate, 2),
+            'resumes': int(resumes)
+            })
+    return results
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,133 @@
+import json
+
+def get_tag_inventory(tag_rows):
+    '''
+    Takes the rows returned by constants.WAREHOUSE_TAG_INVENTORY_SQL
+    and returns a dict keyed by warehouse name, containing the
+    assistant enabled flag and all other assistant tag assignments.
+    Example:
+    {
+        'COMPUTE_WH': {
+            'assist_enabled': 'y',
+            'tag_assignments': {'DEPARTMENT': 'Accounting'}
+        }
+    }
+    '''
+    return_dict = {}
+    if not tag_rows:
+        return return_dict
+
+    for row in tag_rows:
+        tag_assignments = row['TAG_ASSIGNMENTS']
+        # Variant columns come back from Snowpark as JSON strings.
+        if isinstance(tag_assignments, str):
+            tag_assignments = json.loads(tag_assignments)
+        return_dict[row['WAREHOUSE_NAME']] = {
+            'assist_enabled': row['ASSISTANT_ENABLED'] or 'n',
+            'tag_assignments': tag_assignments or {}
+        }
+
+    return return_dict
+
+def build_tag_lookup(tag_rows):
+    '''
+    Takes the rows of `show tags` and returns a list of tag names,
+    starting with a blank entry for select boxes, and a dict of tag
+    details keyed by tag name.
+    '''
+    tag_list = ['']
+    tag_lookup = {}
+    for row in tag_rows or []:
+        tag_key = row[1]
+        tag_list.append(tag_key)
+        tag_lookup[tag_key] = {}
+        tag_lookup[tag_key]['name'] = row[1]
+        # Disabling this for now because I don't want to deal with a datetime object
+        # tag_lookup[tag_key]['created_on'] = row[0] 
+        tag_lookup[tag_key]['database_name'] = row[2]
+        tag_lookup[tag_key]['schema_name'] = row[3]
+        tag_lookup[tag_key]['owner'] = row[4]
+        tag_lookup[tag_key]['comment'] = row[5]
+        tag_lookup[tag_key]['allowed_values'] = []
+        if row[6]:
+            tag_lookup[tag_key]['allowed_values'] = json.loads(row[6])
+
+    return tag_list, tag_lookup
+
+def _row_to_dict(row):
+    if hasattr(row, 'asDict'):
+        return row.asDict()
+    return dict(row)
+
+def patch_many_warehouse_rows(warehouse_rows, changes_by_warehouse):
+    '''
+    Returns the rows of `show warehouses` with the columns in changes
+    updated for each warehouse in changes_by_warehouse (a dict of
+    warehouse name -> changes), e.g. after an alter warehouse. Changed
+    rows are returned as dicts, which read the same as rows.
+    '''
+    patched_rows = []
+    for row in warehouse_rows or []:
+        if row['name'] in changes_by_warehouse:
+            row = _row_to_dict(row)
+            row.update(changes_by_warehouse[row['name']])
+        patched_rows.append(row)
+    return patched_rows
+
+def _patch_tag_row(row, assistant_enabled, tag_name, tag_value):
+    row = _row_to_dict(row)
+    if assistant_enabled is not None:
+        row['ASSISTANT_ENABLED'] = assistant_enabled
+    if tag_name is not None:
+        tag_assignments = row['TAG_ASSIGNMENTS']
+        if isinstance(tag_assignments, str):
+            tag_assignments = json.loads(tag_assignments)
+        tag_assignments = dict(tag_assignments or {})
+        if tag_value is None:
+            tag_assignments.pop(tag_name.upper(), None)
+        else:
+            tag_assignments[tag_name.upper()] = tag_value
+        row['TAG_ASSIGNMENTS'] = json.dumps(tag_assignments)
+    return row
+
+def patch_tag_inventory_rows(tag_rows, warehouse_name, assistant_enabled=None, tag_name=None, tag_value=None):
+    '''
+    Returns the rows of constants.WAREHOUSE_TAG_INVENTORY_SQL with one
+    warehouse's assistant enabled flag and/or one tag assignment
+    changed. A tag_value of None removes the assignment. A row is added
+    if the warehouse had no assistant tags yet.
+    '''
+    patched_rows = []
+    found = False
+    for row in tag_rows or []:
+        if row['WAREHOUSE_NAME'] == warehouse_name:
+            row = _patch_tag_row(row, assistant_enabled, tag_name, tag_value)
+            found = True
+        patched_rows.append(row)
+    if not found:
+        new_row = {'WAREHOUSE_NAME': warehouse_name, 'ASSISTANT_ENABLED': None, 'TAG_ASSIGNMENTS': '{}'}
+        patched_rows.append(_patch_tag_row(new_row, assistant_enabled, tag_name, tag_value))
+    return patched_rows
+
+def patch_many_tag_inventory_rows(tag_rows, tag_changes):
+    '''
+    Same as patch_tag_inventory_rows for several tags of several
+    warehouses at once, in one pass over the rows. tag_changes is a dict
+    of warehouse name -> {tag name: value}.
+    '''
+    patched_rows = []
+    pending = dict(tag_changes)
+    for row in tag_rows or []:
+        if row['WAREHOUSE_NAME'] in pending:
+            for tag_name, tag_value in pending.pop(row['WAREHOUSE_NAME']).items():
+                row = _patch_tag_row(row, None, tag_name, tag_value)
+        patched_rows.append(row)
+    for warehouse_name, tag_values in pending.items():
+        row = {'WAREHOUSE_NAME': warehouse_name, 'ASSISTANT_ENABLED': None, 'TAG_ASSIGNMENTS': '{}'}
+        for tag_name, tag_value in tag_values.items():
+            row = _patch_tag_row(row, None, tag_name, tag_value)
+        patched_rows.append(row)
+    return patched_rows
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,123 @@
+'''
+Account-wide index of assistant tag values. The values of every tag in
+tagging_assist_db.tagging, with the number of warehouses set to each, are
+fetched with one grouped query over tag_references (see
+constants.TAG_VALUE_INDEX_SQL) instead of one scan per selected tag.
+
+Each tag's values are kept sorted by their lower case form, so a prefix
+search is two bisections, and the matches are ranked by how many
+objects use them. Tags set by the app are patched into the cached rows
+(see patch_tag_value_rows) so the suggestions don't wait for
+tag_references to catch up. tag_references has no modification time,
+so there is no high-water mark to fetch only the changed rows from, and
+the whole index is fetched again when it expires.
+'''
+import bisect, threading
+from collections import OrderedDict
+
+# Indexes kept for different row lists, e.g. before and after a patch.
+INDEX_CACHE_SIZE = 8
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def _row_to_dict(row):
+    if hasattr(row, 'asDict'):
+        return row.asDict()
+    return dict(row)
+
+class TagValueIndex():
+    '''
+    tag_value_rows: the rows of constants.TAG_VALUE_INDEX_SQL, with
+    TAG_NAME, TAG_VALUE and OBJECT_COUNT.
+    '''
+    def __init__(self, tag_value_rows):
+        # tag name -> {value: object count}
+        self.counts = {}
+        for row in tag_value_rows or []:
+            if row['TAG_VALUE'] is None or not row['OBJECT_COUNT']:
+                continue
+            tag_counts = self.counts.setdefault(row['TAG_NAME'], {})
+            tag_counts[row['TAG_VALUE']] = tag_counts.get(row['TAG_VALUE'], 0) + int(row['OBJECT_COUNT'])
+
+        # tag name -> ([lower case values], [values]), sorted for prefix search
+        self.sorted_values = {}
+        for tag_name, tag_counts in self.counts.items():
+            values = sorted(tag_counts.keys(), key=lambda value: (value.lower(), value))
+            self.sorted_values[tag_name] = ([value.lower() for value in values], values)
+
+    def get_count(self, tag_name, tag_value):
+        return self.counts.get(tag_name, {}).get(tag_value, 0)
+
+    def search(self, tag_name, prefix='', limit=None):
+        '''
+        Returns the values of a tag starting with prefix, ignoring case,
+        the most used first. A blank prefix returns all values.
+        '''
+        if tag_name not in self.sorted_values:
+            return []
+        lower_values, values = self.sorted_values[tag_name]
+        prefix = prefix.lower()
+        start = bisect.bisect_left(lower_values, prefix)
+        # Every string starting with prefix sorts before prefix followed by the highest character.
+        end = bisect.bisect_left(lower_values, prefix + '\U0010ffff', start)
+        tag_counts = self.counts[tag_name]
+        matches = sorted(values[start:end], key=lambda value: -tag_counts[value])
+        return matches[:limit] if limit else matches
+
+def get_index(tag_value_rows):
+    '''
+    Returns the index of a list of rows, building it only the first time
+    the list is seen. Cached indexes hold on to their rows so the id
+    used as the cache key can't be reused.
+    '''
+    key = id(tag_value_rows)
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]['index']
+
+    index = TagValueIndex(tag_value_rows)
+    with _indexes_lock:
+        _indexes[key] = {'index': index, 'rows': tag_value_rows}
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+def patch_tag_value_rows(tag_value_rows, tag_name, old_value=None, new_value=None):
+    '''
+    Returns the rows of constants.TAG_VALUE_INDEX_SQL after one object's
+    tag changed from old_value to new_value. None means not set.
+    '''
+    return patch_many_tag_value_rows(tag_value_rows, [(tag_name, old_value, new_value)])
+
+def patch_many_tag_value_rows(tag_value_rows, value_changes):
+    '''
+    Same as patch_tag_value_rows for many changes at once, in one pass
+    over the rows. value_changes is a list of (tag name, old value, new
+    value), one per object changed.
+    '''
+    # (tag name, value) -> change in object count
+    deltas = {}
+    for tag_name, old_value, new_value in value_changes:
+        if old_value == new_value:
+            continue
+        if old_value is not None:
+            deltas[(tag_name, old_value)] = deltas.get((tag_name, old_value), 0) - 1
+        if new_value is not None:
+            deltas[(tag_name, new_value)] = deltas.get((tag_name, new_value), 0) + 1
+
+    patched_rows = []
+    for row in tag_value_rows or []:
+        delta = deltas.pop((row['TAG_NAME'], row['TAG_VALUE']), 0)
+        if delta:
+            row = _row_to_dict(row)
+            row['OBJECT_COUNT'] = max(int(row['OBJECT_COUNT']) + delta, 0)
+        patched_rows.append(row)
+    for (tag_name, tag_value), delta in deltas.items():
+        if delta > 0:
+            patched_rows.append({'TAG_NAME': tag_name, 'TAG_VALUE': tag_value, 'OBJECT_COUNT': delta})
+    return patched_rows
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,126 @@
+'''
+Headless command line for the Tagging Assistant. Converges warehouse
+settings, assistant tags and resize schedules to a spec (see
+warehouse_plan.py) without Streamlit.
+
+Usage: python tagging_cli.py plan|apply spec.json|spec.yaml [--json] [--force]
+
+plan prints the changes, apply runs them. apply stops without changing
+anything if the plan has errors, unless --force is given. Connection details are read
+from TAGGING_ASSIST_ACCOUNT, TAGGING_ASSIST_USER, TAGGING_ASSIST_PASSWORD
+and optionally TAGGING_ASSIST_ROLE and TAGGING_ASSIST_WAREHOUSE. Set
+TAGGING_ASSIST_BACKEND=standin to try it against the local stand-in
+(see session_backend.py). Exits with 1 if anything failed.
+'''
+import os, sys, json, argparse
+import constants, session_backend, sql_builder, warehouse_plan
+
+def load_spec(path):
+    '''
+    Reads a JSON spec, or a YAML spec if PyYAML is installed.
+    '''
+    with open(path, 'r') as f:
+        spec_text = f.read()
+    if path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit('PyYAML is required for YAML specs: pip install pyyaml')
+        return yaml.safe_load(spec_text) or {}
+    return json.loads(spec_text)
+
+def get_connection_params():
+    '''
+    Returns the Snowpark connection dict, the same shape
+    warehouse_tagging_assistant.create_session() builds.
+    '''
+    return {
+        'account': os.environ.get('TAGGING_ASSIST_ACCOUNT', '').replace('https://', '').replace('.snowflakecomputing.com', ''),
+        'user': os.environ.get('TAGGING_ASSIST_USER', ''),
+        'password': os.environ.get('TAGGING_ASSIST_PASSWORD', ''),
+        'role': os.environ.get('TAGGING_ASSIST_ROLE', constants.DEFAULT_ROLE),
+        'warehouse': os.environ.get('TAGGING_ASSIST_WAREHOUSE', constants.DEFAULT_WAREHOUSE),
+        'database': constants.DEFAULT_DATABASE
+        }
+
+def apply_plan(run_sql, plan):
+    '''
+    Runs the plan's alter warehouse statements in batches, then saves
+    the schedules of the warehouses whose schedules changed with the
+    bulk schedules procedure, one call per
+    sql_builder.SCHEDULE_CALL_MAX_WAREHOUSES warehouses. Returns a list
+    of errors, one per failed statement or schedule.
+    '''
+    errors = []
+    statements, statement_names, schedule_calls = warehouse_plan.get_plan_statements(plan)
+    done, failed = warehouse_plan.run_statements(run_sql, statements)
+    for statement, error in failed:
+        errors.append(statement_names[statement] + ': ' + error + ' (in: ' + statement.strip().split('\n')[0] + ')')
+
+    for call_sql, result_column, call_names in schedule_calls:
+        try:
+            schedule_errors = warehouse_plan.get_many_schedule_errors(json.loads(run_sql(call_sql)[0][result_column]), call_names)
+        except Exception as err:
+            errors.extend(warehouse_name + ': ' + str(err) for warehouse_name in call_names)
+            continue
+        for warehouse_name, warehouse_errors in schedule_errors.items():
+            errors.extend(warehouse_name + ': ' + error for error in warehouse_errors)
+    return errors
+
+def format_plan(plan):
+    lines = []
+    for warehouse_name, changes in plan['warehouses'].items():
+        lines.append(warehouse_name)
+        for property_name, value in changes['settings'].items():
+            lines.append('  ~ ' + property_name + ' = ' + str(value))
+        for tag_name, value in changes['tags'].items():
+            if value is None:
+                lines.append('  - tag ' + tag_name)
+            else:
+                lines.append('  ~ tag ' + tag_name + ' = ' + value)
+        if changes['schedules'] is not None:
+            if not changes['schedules']:
+                lines.append('  - all schedules')
+            for schedule in changes['schedules']:
+                lines.append('  ~ schedule ' + str(schedule['index']) + ': ' + schedule['size'] + ' at ' + schedule['cron'] + ' ' + schedule['tz'])
+    for error in plan['errors']:
+        lines.append('ERROR ' + error)
+    for warning in plan.get('warnings', []):
+        lines.append('WARNING ' + warning)
+    lines.append(str(len(plan['warehouses'])) + ' warehouse(s) to change, ' + str(len(plan['errors'])) + ' error(s)')
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plan or apply a warehouse spec.')
+    parser.add_argument('command', choices=['plan', 'apply'])
+    parser.add_argument('spec', help='JSON or YAML spec, see warehouse_plan.py')
+    parser.add_argument('--json', action='store_true', help='Print the plan as JSON.')
+    parser.add_argument('--force', action='store_true', help='Apply the rest of the plan even if it has errors.')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    session = session_backend.create_backend_session(get_connection_params())
+    run_sql = lambda sql: session.sql(sql).collect()
+    try:
+        plan = warehouse_plan.build_plan(spec, *warehouse_plan.load_state(run_sql))
+        if args.json:
+            print(json.dumps(plan, indent=2))
+        else:
+            print(format_plan(plan))
+
+        errors = list(plan['errors'])
+        if args.command == 'apply' and errors and not args.force:
+            print('Not applied: the plan has errors. Fix the spec, or use --force to apply the rest.', file=sys.stderr)
+        elif args.command == 'apply' and plan['warehouses']:
+            apply_errors = apply_plan(run_sql, plan)
+            for error in apply_errors:
+                print('ERROR ' + error, file=sys.stderr)
+            errors.extend(apply_errors)
+            if not apply_errors:
+                print('Applied.')
+    finally:
+        session.close()
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
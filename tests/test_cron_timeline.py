@@ -0,0 +1,125 @@
+import random
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+import cron_timeline
+
+# Sunday 2026-01-04 00:00 UTC, in minutes since the epoch.
+UTC_WEEK_START = int(datetime(2026, 1, 4, tzinfo=timezone.utc).timestamp()) // 60
+
+def get_fire_times(cron, local_timezone='UTC', start_minute=UTC_WEEK_START, minutes=cron_timeline.WEEK_MINUTES):
+    fire_minutes = cron_timeline.get_fire_minutes(cron, local_timezone, start_minute, minutes)
+    return [cron_timeline.format_minute(start_minute + int(minute), local_timezone) for minute in fire_minutes]
+
+def test_compile_field_lists_ranges_steps_and_names():
+    assert list(np.flatnonzero(cron_timeline.compile_field('*/15', 0, 59))) == [0, 15, 30, 45]
+    assert list(np.flatnonzero(cron_timeline.compile_field('5/20', 0, 59))) == [5, 25, 45]
+    assert list(np.flatnonzero(cron_timeline.compile_field('1-3,10', 0, 23))) == [1, 2, 3, 10]
+    assert list(np.flatnonzero(cron_timeline.compile_field('mon-wed', 0, 7, cron_timeline.DAY_NAMES))) == [1, 2, 3]
+    assert list(np.flatnonzero(cron_timeline.compile_field('JAN,dec', 1, 12, cron_timeline.MONTH_NAMES))) == [1, 12]
+
+@pytest.mark.parametrize('cron', ['0 0 L * *', '0 0 * * 5L', '0 0 15W * *', '0 0 LW * *', '0 0 * * 1#2', '0 24 * * *', '0 0 * *', '*/0 * * * *'])
+def test_unsupported_or_invalid_crons_raise(cron):
+    with pytest.raises(ValueError):
+        cron_timeline.compile_cron(cron)
+
+def test_unsupported_crons_are_timeline_errors():
+    schedules = [{'index': 1, 'size': 'small', 'cron': '0 0 L * *', 'tz': 'UTC'}, {'index': 2, 'size': 'large', 'cron': '0 8 * * *', 'tz': 'UTC'}]
+    timeline = cron_timeline.ScheduleTimeline(schedules, UTC_WEEK_START)
+    assert list(timeline.errors.keys()) == [1]
+    assert [schedule['index'] for schedule in timeline.schedules] == [2]
+
+def test_weekday_schedule_fires_once_a_weekday():
+    assert get_fire_times('0 8 * * 1-5') == ['Mon 2026-01-05 08:00', 'Tue 2026-01-06 08:00', 'Wed 2026-01-07 08:00', 'Thu 2026-01-08 08:00', 'Fri 2026-01-09 08:00']
+    # 7 is Sunday too.
+    assert get_fire_times('0 0 * * 7') == get_fire_times('0 0 * * 0') == ['Sun 2026-01-04 00:00']
+
+def test_either_day_field_matches_when_both_are_restricted():
+    # The 9th of January 2026 is a Friday, the 6th a Tuesday.
+    assert get_fire_times('0 12 6 * fri') == ['Tue 2026-01-06 12:00', 'Fri 2026-01-09 12:00']
+    assert get_fire_times('0 12 6 * ?') == ['Tue 2026-01-06 12:00']
+
+def test_daylight_saving_gap_skips_missing_minutes():
+    # Clocks in New York jump from 02:00 to 03:00 on Sunday 2026-03-08.
+    week_start = cron_timeline.get_week_start('America/New_York', datetime(2026, 3, 10, tzinfo=timezone.utc))
+    assert cron_timeline.format_minute(week_start, 'America/New_York') == 'Sun 2026-03-08 00:00'
+    fire_times = get_fire_times('30 2 * * *', 'America/New_York', week_start)
+    assert len(fire_times) == 6
+    assert fire_times[0] == 'Mon 2026-03-09 02:30'
+
+def test_daylight_saving_overlap_fires_twice():
+    # Clocks in New York go back from 02:00 to 01:00 on Sunday 2026-11-01.
+    week_start = cron_timeline.get_week_start('America/New_York', datetime(2026, 11, 3, tzinfo=timezone.utc))
+    fire_minutes = cron_timeline.get_fire_minutes('30 1 * * *', 'America/New_York', week_start, cron_timeline.WEEK_MINUTES)
+    assert len(fire_minutes) == 8
+    assert list(fire_minutes[:2]) == [90, 150]
+
+def test_sizes_follow_the_last_schedule_to_fire():
+    schedules = [
+        {'index': 1, 'size': 'xsmall', 'cron': '0 0 * * *', 'tz': 'UTC'},
+        {'index': 2, 'size': 'X-Large', 'cron': '0 8 * * 1-5', 'tz': 'UTC'},
+        {'index': 3, 'size': 'small', 'cron': '0 18 * * 1-5', 'tz': 'UTC'}
+        ]
+    timeline = cron_timeline.ScheduleTimeline(schedules, UTC_WEEK_START, initial_size='Medium')
+    # Monday 08:00 to 18:00 is X-Large, the rest of Monday is X-Small until 18:00 and Small after.
+    monday = timeline.sizes[24 * 60:48 * 60]
+    assert set(monday[:8 * 60]) == {0}
+    assert set(monday[8 * 60:18 * 60]) == {4}
+    assert set(monday[18 * 60:]) == {1}
+    # The week starts at the size the previous week ended with, not the initial size.
+    assert timeline.sizes[0] == 0
+    assert timeline.get_size_minutes() == {'X-Small': 7 * 24 * 60 - 5 * 16 * 60, 'Small': 5 * 6 * 60, 'X-Large': 5 * 10 * 60}
+
+def test_higher_index_wins_and_conflicts_are_reported():
+    schedules = [
+        {'index': 1, 'size': 'large', 'cron': '0 8 * * 1-5', 'tz': 'UTC'},
+        {'index': 2, 'size': 'small', 'cron': '0 8 * * 1-5', 'tz': 'UTC'},
+        {'index': 3, 'size': 'small', 'cron': '0 8 * * 1', 'tz': 'UTC'}
+        ]
+    timeline = cron_timeline.ScheduleTimeline(schedules, UTC_WEEK_START)
+    assert set(timeline.sizes[timeline.sizes >= 0]) == {1}
+    conflicts = timeline.get_conflicts()
+    assert [(conflict['indexes'], conflict['minutes']) for conflict in conflicts] == [((1, 2), 5), ((1, 3), 1)]
+    assert conflicts[0]['first_minute'] == UTC_WEEK_START + 24 * 60 + 8 * 60
+    redundant = timeline.get_redundant()
+    assert redundant[1] == 'never changes the size'
+
+def test_redundant_schedules():
+    schedules = [
+        {'index': 1, 'size': 'large', 'cron': '0 8 * * *', 'tz': 'UTC'},
+        {'index': 2, 'size': 'small', 'cron': '0 0 30 2 *', 'tz': 'UTC'},
+        {'index': 3, 'size': 'large', 'cron': '0 9 * * *', 'tz': 'UTC'},
+        {'index': 4, 'size': 'small', 'cron': '0 20 * * *', 'tz': 'UTC'}
+        ]
+    timeline = cron_timeline.ScheduleTimeline(schedules, UTC_WEEK_START)
+    assert timeline.get_redundant() == {2: 'never runs in this period', 3: 'never changes the size'}
+
+def _brute_force_conflicts(schedules, start_minute, minutes):
+    # Every pair of schedules with different sizes, at every minute of the window both fire.
+    fires = {}
+    for order, schedule in enumerate(sorted(schedules, key=lambda schedule: schedule['index'])):
+        for minute in cron_timeline.get_fire_minutes(schedule['cron'], schedule['tz'], start_minute, minutes):
+            fires.setdefault(int(minute), []).append((schedule['index'], schedule['size']))
+    pairs = {}
+    for minute, fired in sorted(fires.items()):
+        for i, (first_index, first_size) in enumerate(fired):
+            for second_index, second_size in fired[i + 1:]:
+                if first_size != second_size:
+                    pairs.setdefault((first_index, second_index), []).append(minute)
+    return [{'indexes': pair, 'minutes': len(pair_minutes), 'first_minute': start_minute + pair_minutes[0]} for pair, pair_minutes in sorted(pairs.items())]
+
+def test_conflicts_match_brute_force():
+    rand = random.Random(0)
+    crons = ['* * * * *', '*/2 * * * *', '*/15 * * * *', '0 * * * *', '0 8 * * 1-5', '30 9 * * *', '0 */2 * * *', '*/5 8-18 * * mon-fri', '45 7 * * 0,6']
+    for trial in range(25):
+        schedules = [{'index': index, 'size': rand.choice(['xsmall', 'small', 'medium']), 'cron': rand.choice(crons), 'tz': rand.choice(['UTC', 'Europe/London'])}
+                     for index in range(1, rand.randint(1, 10) + 1)]
+        timeline = cron_timeline.ScheduleTimeline(schedules, UTC_WEEK_START)
+        assert timeline.get_conflicts() == _brute_force_conflicts(schedules, UTC_WEEK_START, cron_timeline.WEEK_MINUTES)
+
+def test_empty_timeline():
+    timeline = cron_timeline.ScheduleTimeline([], UTC_WEEK_START, initial_size='small')
+    assert set(timeline.sizes) == {1}
+    assert timeline.get_conflicts() == []
+    assert timeline.get_redundant() == {}
+    assert timeline.get_projected_credits() == pytest.approx(2 * 7 * 24)
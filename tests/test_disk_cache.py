@@ -0,0 +1,125 @@
+import itertools, os
+import numpy as np
+import pandas as pd
+import pytest
+import disk_cache
+
+class Clock():
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        # Every call moves a little, so last use times never tie.
+        self.now += 0.001
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(disk_cache, 'time', clock)
+    return clock
+
+def make_frame(rows=1000, seed=0):
+    rand = np.random.default_rng(seed)
+    return pd.DataFrame({'WAREHOUSE_NAME': ['WH_' + str(i % 7) for i in range(rows)], 'CREDITS': rand.random(rows), 'QUERIES': np.arange(rows)})
+
+def test_arrow_round_trip_keeps_values_and_attrs(tmp_path, clock):
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    frame = make_frame()
+    frame.attrs['truncated'] = True
+    key = ('account', 'usage', 'select 1')
+    cache.write(key, frame, 500.0)
+    assert os.listdir(tmp_path)[0].endswith(disk_cache.ARROW_EXTENSION)
+    value, fetched_at = cache.read(key, ttl=10 ** 6)
+    pd.testing.assert_frame_equal(value, frame)
+    assert value.attrs == {'truncated': True}
+    assert fetched_at == 500.0
+
+def test_results_arrow_cant_hold_are_pickled(tmp_path, clock):
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    rows = [{'name': 'WH_1', 'tags': {'COST_CENTER': 'finance'}}]
+    mixed = pd.DataFrame({'VALUE': [1, 'one', b'\x01']})
+    cache.write(('account', 'rows', 'show warehouses'), rows, clock.now)
+    cache.write(('account', 'mixed', 'select 2'), mixed, clock.now)
+    assert cache.read(('account', 'rows', 'show warehouses'), ttl=60)[0] == rows
+    assert list(cache.read(('account', 'mixed', 'select 2'), ttl=60)[0]['VALUE']) == [1, 'one', b'\x01']
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(tmp_path)) == [disk_cache.PICKLE_EXTENSION] * 2
+
+def test_rewrite_replaces_the_other_format(tmp_path, clock):
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    key = ('account', 'usage', 'select 1')
+    cache.write(key, [1, 2], clock.now)
+    cache.write(key, make_frame(10), clock.now)
+    assert [os.path.splitext(name)[1] for name in os.listdir(tmp_path)] == [disk_cache.ARROW_EXTENSION]
+    assert isinstance(cache.read(key, ttl=60)[0], pd.DataFrame)
+
+def test_expired_and_missing_results_are_misses(tmp_path, clock):
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    key = ('account', 'usage', 'select 1')
+    cache.write(key, make_frame(10), clock.now)
+    assert cache.read(key, ttl=60) is not None
+    clock.now += 60
+    assert cache.read(key, ttl=60) is None
+    assert os.listdir(tmp_path) == []
+    assert cache.read(('account', 'usage', 'select 2'), ttl=60) is None
+    assert cache.status()['stats'] == {'hits': 1, 'misses': 2, 'writes': 1, 'evictions': 0, 'expired': 1}
+
+def test_least_recently_used_files_are_evicted(tmp_path, clock):
+    frame = make_frame()
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    cache.write(('account', 'usage', 'probe'), frame, clock.now)
+    file_bytes = cache.status()['bytes']
+    cache.remove(('account', 'usage', 'probe'))
+
+    # Room for two files but not three.
+    cache.max_bytes = int(file_bytes * 2.5)
+    keys = [('account', 'usage', 'select ' + str(i)) for i in range(4)]
+    cache.write(keys[0], frame, clock.now)
+    cache.write(keys[1], frame, clock.now)
+    # Reading the first makes the second the least recently used.
+    assert cache.read(keys[0], ttl=60) is not None
+    cache.write(keys[2], frame, clock.now)
+    assert cache.read(keys[1], ttl=60) is None
+    assert cache.read(keys[0], ttl=60) is not None
+    cache.write(keys[3], frame, clock.now)
+    assert cache.read(keys[2], ttl=60) is None
+    assert [cache.read(key, ttl=60) is not None for key in keys] == [True, False, False, True]
+    status = cache.status()
+    assert status['files'] == 2 and status['bytes'] <= cache.max_bytes
+    assert status['stats']['evictions'] == 2
+
+def test_result_larger_than_the_budget_is_not_kept(tmp_path, clock):
+    cache = disk_cache.DiskCache(str(tmp_path), 100)
+    cache.write(('account', 'usage', 'select 1'), make_frame(), clock.now)
+    assert cache.read(('account', 'usage', 'select 1'), ttl=60) is None
+    assert os.listdir(tmp_path) == []
+
+def test_files_survive_a_restart_in_last_used_order(tmp_path, clock):
+    frame = make_frame()
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    keys = [('account', 'usage', 'select ' + str(i)) for i in range(3)]
+    for key, last_used in zip(keys, itertools.count(100, 100)):
+        cache.write(key, frame, clock.now)
+        # Last use is read back from the modification time.
+        path = cache._get_base_path(key) + disk_cache.ARROW_EXTENSION
+        os.utime(path, (last_used, last_used))
+    # A write that didn't finish is cleaned up.
+    open(os.path.join(str(tmp_path), 'partial.arrow.1.tmp'), 'wb').close()
+
+    # Room for three files but not four.
+    restarted = disk_cache.DiskCache(str(tmp_path), int(max(size for size, last_used in cache.files.values()) * 3.5))
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+    pd.testing.assert_frame_equal(restarted.read(keys[0], ttl=60)[0], frame)
+    restarted.write(('account', 'usage', 'select 3'), frame, clock.now)
+    assert restarted.read(keys[1], ttl=60) is None
+    assert restarted.read(keys[2], ttl=60) is not None
+
+def test_remove_matching_keeps_other_accounts_and_kept_keys(tmp_path, clock):
+    cache = disk_cache.DiskCache(str(tmp_path), 10 ** 8)
+    keys = [('first', 'usage', 'select 1'), ('first', 'usage', 'select 2'), ('first', 'schedules', 'show tasks'), ('second', 'usage', 'select 1')]
+    for key in keys:
+        cache.write(key, [key], clock.now)
+    cache.remove_matching('first', 'usage', keep_keys=[keys[1]])
+    assert [cache.read(key, ttl=60) is not None for key in keys] == [False, True, True, True]
+    cache.remove_matching('first')
+    assert [cache.read(key, ttl=60) is not None for key in keys] == [False, False, False, True]
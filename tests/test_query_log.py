@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+import query_log, result_stream, session_backend
+
+@pytest.fixture(autouse=True)
+def metric_totals(monkeypatch):
+    monkeypatch.setattr(query_log, '_metric_totals', {})
+
+def test_statements_differing_only_by_literals_share_a_fingerprint():
+    first = "-- Get usage\nselect * from t where warehouse_name = 'WH_1' and credits > 10"
+    second = "select *\n  from t where warehouse_name = 'it''s' and credits > 2.5"
+    assert query_log.normalize_sql(first) == 'select * from t where warehouse_name = ? and credits > ?'
+    assert query_log.fingerprint(first) == query_log.fingerprint(second)
+    assert query_log.fingerprint(first) != query_log.fingerprint('select 1 from t')
+    assert query_log.normalize_sql('create procedure p() as $$ return 1; $$') == 'create procedure p() as ?'
+
+def test_row_and_byte_counts_of_each_result_shape():
+    rows = [('WH_1', 'y'), ('WH_2', 'n')]
+    assert (query_log.count_rows(rows), query_log.estimate_bytes(rows)) == (2, 10)
+    frame = pd.DataFrame({'CREDITS': np.zeros(5)})
+    assert query_log.count_rows(frame) == 5
+    assert query_log.estimate_bytes(frame) == frame.memory_usage(deep=True).sum()
+    # Merged intervals and slot sums are not row lists.
+    intervals = np.zeros((2, 2))
+    assert query_log.count_rows(intervals) is None and query_log.estimate_bytes(intervals) == 32
+    assert query_log.count_rows((np.zeros((168, 8)), np.zeros(168))) is None
+    assert query_log.estimate_bytes((np.zeros((168, 8)), np.zeros(168))) is None
+    assert (query_log.count_rows(None), query_log.estimate_bytes(None), query_log.estimate_bytes([])) == (0, 0, 0)
+
+def test_byte_estimate_scales_a_sample():
+    rows = [('abcd',)] * (query_log.BYTE_ESTIMATE_SAMPLE_ROWS * 3)
+    assert query_log.estimate_bytes(rows) == 4 * len(rows)
+
+def test_execute_records_each_round_trip():
+    session = session_backend.StandInSession(warehouse_count=3)
+    log = query_log.QueryLog()
+    rows = log.execute(session, 'show warehouses')
+    assert len(rows) == 3 and session.round_trips == 1
+    record, = log.current['queries']
+    assert (record['rows'], record['cached'], record['source'], record['statement']) == (3, False, 'direct', 'show warehouses')
+    assert record['bytes'] > 0 and record['seconds'] >= 0
+
+def test_streamed_and_reduced_results():
+    session = session_backend.StandInSession(warehouse_count=3)
+    log = query_log.QueryLog()
+    frame = log.execute_stream(session, 'show warehouses', lambda dataframe: result_stream.fetch_frame(dataframe))
+    assert log.current['queries'][0]['rows'] == len(frame) == 3
+    log.record('select start_ms, end_ms from query_history', 0.5, np.zeros((7, 2)), False, 'stream')
+    assert log.current['queries'][1]['rows'] is None
+    log.record('select start_ms, end_ms from query_history', 0.5, np.zeros((7, 2)), False, 'stream', row_count=40)
+    assert log.current['queries'][2]['rows'] == 40
+
+def test_cache_hits_are_recorded_without_a_round_trip():
+    session = session_backend.StandInSession(warehouse_count=2)
+    log = query_log.QueryLog()
+    cache = {}
+    def cache_function(sql, account):
+        if (sql, account) not in cache:
+            cache[(sql, account)] = log.execute(session, sql, 'cache')
+        return cache[(sql, account)]
+    for _ in range(3):
+        log.cached(cache_function, 'show warehouses', 'acct', 'cache')
+    assert [query['cached'] for query in log.current['queries']] == [False, True, True]
+    assert log.summary()['statements'] == 3
+    assert log.summary()['round_trips'] == 1
+    assert log.summary()['cache_hit_rate'] == 0.667
+    assert log.slowest(1)[0] in log.current['queries']
+
+def test_reruns_are_kept_apart():
+    log = query_log.QueryLog()
+    log.record('select 1', 0.1, [(1,)], False, 'direct')
+    log.start_rerun()
+    assert log.summary() == {'statements': 0, 'round_trips': 0, 'query_seconds': 0.0, 'cache_hit_rate': 0.0}
+    assert len(log.reruns) == 2
+
+def test_openmetrics_totals(tmp_path):
+    log = query_log.QueryLog()
+    log.record("select * from t where name = 'a'", 0.25, [(1,), (2,)], False, 'direct')
+    log.record("select * from t where name = 'b'", 0.5, [(3,)], False, 'direct')
+    log.record('select start_ms from query_history', 1.0, np.zeros((4, 2)), False, 'stream')
+    text = query_log.render_openmetrics()
+    labels = '{fingerprint="' + query_log.fingerprint('select * from t where name = ?') + '",source="direct",cached="false"}'
+    assert 'tagging_assistant_queries_total' + labels + ' 2' in text
+    assert 'tagging_assistant_query_seconds_total' + labels + ' 0.75' in text
+    assert 'tagging_assistant_query_rows_total' + labels + ' 3' in text
+    stream_labels = '{fingerprint="' + query_log.fingerprint('select start_ms from query_history') + '",source="stream",cached="false"}'
+    assert 'tagging_assistant_query_rows_total' + stream_labels + ' 0' in text
+    assert text.endswith('# EOF\n')
+
+    path = str(tmp_path / 'metrics.txt')
+    query_log.write_openmetrics(path)
+    assert open(path).read() == text
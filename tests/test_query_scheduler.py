@@ -0,0 +1,50 @@
+import threading
+import pytest
+import query_scheduler
+
+def test_submitted_jobs_run_concurrently():
+    scheduler = query_scheduler.QueryScheduler()
+    barrier = threading.Barrier(3, timeout=5)
+    def load(name):
+        # Each job waits for the other two, so this only finishes if all three run at once.
+        barrier.wait()
+        return name
+    for name in ['warehouses', 'tags', 'schedules']:
+        scheduler.submit(name, 'args', load, name)
+    assert [scheduler.get(name, 'args', lambda: 'in place') for name in ['warehouses', 'tags', 'schedules']] == ['warehouses', 'tags', 'schedules']
+
+def test_changed_or_missing_jobs_run_in_place():
+    scheduler = query_scheduler.QueryScheduler()
+    calls = []
+    def load(warehouse_name):
+        calls.append((warehouse_name, threading.current_thread().name))
+        return warehouse_name
+    scheduler.submit('usage', 'WH_1', load, 'WH_1')
+    scheduler.wait()
+    # The selection changed since the job was submitted.
+    assert scheduler.get('usage', 'WH_2', load, 'WH_2') == 'WH_2'
+    assert scheduler.get('tags', None, load, 'WH_3') == 'WH_3'
+    assert scheduler.get('usage', 'WH_1', load, 'WH_1') == 'WH_1'
+    assert [warehouse_name for warehouse_name, thread_name in calls] == ['WH_1', 'WH_2', 'WH_3']
+    assert calls[0][1].startswith('query_scheduler') and calls[1][1] == threading.current_thread().name
+
+def test_each_job_is_initialized_and_finalized_even_if_it_raises():
+    events = []
+    lock = threading.Lock()
+    def record(event):
+        with lock:
+            events.append((event, threading.current_thread().name))
+    scheduler = query_scheduler.QueryScheduler(lambda: record('lease'), lambda: record('release'))
+    def fail():
+        raise ValueError('query failed')
+    scheduler.submit('good', None, lambda: 'rows')
+    scheduler.submit('bad', None, fail)
+    scheduler.wait()
+    assert sorted(event for event, thread_name in events) == ['lease', 'lease', 'release', 'release']
+    # Errors are left for whoever reads the result.
+    assert scheduler.get('good', None, lambda: None) == 'rows'
+    with pytest.raises(ValueError):
+        scheduler.get('bad', None, lambda: None)
+
+def test_schedulers_share_one_executor():
+    assert query_scheduler.get_executor() is query_scheduler.get_executor()
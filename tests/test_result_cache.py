@@ -0,0 +1,138 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import disk_cache, result_cache
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache, 'time', clock)
+    monkeypatch.setattr(disk_cache, 'time', clock)
+    return clock
+
+def make_cache(tmp_path, **kwargs):
+    return result_cache.ResultCache(str(tmp_path), 10 ** 8, **kwargs)
+
+class Loader():
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.rows
+
+def test_results_are_fetched_once_per_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    loader = Loader([('WH_1',)])
+    assert cache.get('acct', 'warehouses', 'show warehouses', loader, 60) == [('WH_1',)]
+    clock.now += 59
+    cache.get('acct', 'warehouses', 'show warehouses', loader, 60)
+    assert loader.calls == 1
+    clock.now += 1
+    cache.get('acct', 'warehouses', 'show warehouses', loader, 60)
+    assert loader.calls == 2
+    assert cache.status()['stats']['expired'] == 1
+
+def test_accounts_data_sets_and_statements_are_kept_apart(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    for account in ['first', 'second']:
+        for name, sql in [('warehouses', 'show warehouses'), ('tags', 'show tags'), ('tags', 'show tags like ?')]:
+            cache.get(account, name, sql, Loader([(account, sql)]), 60)
+    assert cache.invalidate('first', 'tags') == 2
+    assert cache.invalidate('first', 'warehouses', 'show tags') == 0
+    loader = Loader([])
+    cache.get('first', 'warehouses', 'show warehouses', loader, 60)
+    cache.get('second', 'tags', 'show tags', loader, 60)
+    assert loader.calls == 0
+    cache.get('first', 'tags', 'show tags', loader, 60)
+    assert loader.calls == 1
+
+def test_concurrent_misses_fetch_once(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    def slow_loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ['rows']
+    threads = [threading.Thread(target=cache.get, args=('acct', 'usage', 'select 1', slow_loader, 60)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+
+def test_persisted_results_survive_a_restart(tmp_path, clock):
+    frame = pd.DataFrame({'CREDITS': [1.5, 2.5]})
+    make_cache(tmp_path).get('acct', 'usage', 'select 1', Loader(frame), 600, persist=True)
+    restarted = make_cache(tmp_path)
+    loader = Loader(None)
+    pd.testing.assert_frame_equal(restarted.get('acct', 'usage', 'select 1', loader, 600, persist=True), frame)
+    assert loader.calls == 0 and restarted.status()['stats']['disk_hits'] == 1
+    # Invalidation also drops what is only on disk.
+    make_cache(tmp_path).invalidate('acct', 'usage')
+    make_cache(tmp_path).get('acct', 'usage', 'select 1', loader, 600, persist=True)
+    assert loader.calls == 1
+
+def test_patches_keep_the_original_expiry(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    loader = Loader([('WH_1', 'n')])
+    cache.get('acct', 'tag_inventory', 'select 1', loader, 60, persist=True)
+    clock.now += 50
+    assert cache.patch('acct', 'tag_inventory', lambda rows: [(rows[0][0], 'y')]) == 1
+    assert cache.get('acct', 'tag_inventory', 'select 1', loader, 60, persist=True) == [('WH_1', 'y')]
+    assert make_cache(tmp_path).get('acct', 'tag_inventory', 'select 1', loader, 60, persist=True) == [('WH_1', 'y')]
+    # The real data comes back when the first fetch would have expired.
+    clock.now += 10
+    assert cache.get('acct', 'tag_inventory', 'select 1', loader, 60, persist=True) == [('WH_1', 'n')]
+    assert loader.calls == 2
+
+def test_patch_skips_expired_entries_and_drops_disk_only_ones(tmp_path, clock):
+    make_cache(tmp_path).get('acct', 'tag_inventory', 'select 1', Loader(['old']), 600, persist=True)
+    cache = make_cache(tmp_path)
+    cache.get('acct', 'tag_inventory', 'select 2', Loader(['old']), 60)
+    clock.now += 60
+    assert cache.patch('acct', 'tag_inventory', lambda rows: ['new']) == 0
+    loader = Loader(['fetched'])
+    assert cache.get('acct', 'tag_inventory', 'select 1', loader, 600, persist=True) == ['fetched']
+
+def test_expired_entries_are_dropped_from_memory(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    for warehouse in range(50):
+        cache.get('acct', 'usage_detail', 'select ' + str(warehouse), Loader(np.zeros(1000)), 60)
+        clock.now += 10
+    # Only the last six are still fresh.
+    assert cache.status()['entries'] == 6
+    assert cache.status()['bytes'] == 6 * 8000
+    assert len(cache.key_locks) == 6
+
+def test_memory_tier_drops_the_least_recently_used(tmp_path, clock):
+    cache = make_cache(tmp_path, max_memory_bytes=3 * 8000)
+    loaders = [Loader(np.zeros(1000)) for _ in range(4)]
+    for warehouse in range(3):
+        cache.get('acct', 'busy_intervals', str(warehouse), loaders[warehouse], 600)
+    # Using the first makes the second the least recently used.
+    cache.get('acct', 'busy_intervals', '0', loaders[0], 600)
+    cache.get('acct', 'busy_intervals', '3', loaders[3], 600)
+    assert cache.status()['entries'] == 3 and cache.status()['stats']['evicted'] == 1
+    assert [key[2] for key in cache.entries.keys()] == ['2', '0', '3']
+    cache.get('acct', 'busy_intervals', '1', loaders[1], 600)
+    assert [loader.calls for loader in loaders] == [1, 2, 1, 1]
+    assert cache.status()['bytes'] == 3 * 8000
+
+def test_tuples_are_sized_by_their_parts():
+    assert result_cache.estimate_bytes((np.zeros((168, 8)), np.zeros(168))) == 168 * 9 * 8
+    assert result_cache.estimate_bytes(None) == 0
@@ -0,0 +1,171 @@
+import threading
+import pytest
+import session_pool
+
+class FakeSession():
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+        self.healthy = True
+        # Set to an Event to hold the health check until it is set.
+        self.check_gate = None
+        self.queries = 0
+
+    def sql(self, sql):
+        return self
+
+    def collect(self):
+        if self.check_gate is not None:
+            self.check_gate.wait(5)
+        self.queries += 1
+        if self.closed or not self.healthy:
+            raise RuntimeError('connection lost')
+        return [(1,)]
+
+    def close(self):
+        self.closed = True
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+PARAMS = {'account': 'acct', 'user': 'alice', 'role': 'sysadmin', 'password': 'secret'}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_pool, 'time', clock)
+    return clock
+
+def make_pool(**kwargs):
+    created = []
+    def create_session(connection_params):
+        created.append(FakeSession('session_' + str(len(created))))
+        return created[-1]
+    kwargs.setdefault('max_size', 4)
+    pool = session_pool.SessionPool(create_session, idle_seconds=1800, keepalive_seconds=300, lease_seconds=600, **kwargs)
+    return pool, created
+
+def test_pool_keys_depend_on_credentials_but_hide_the_password():
+    key = session_pool.get_pool_key(PARAMS)
+    assert key == session_pool.get_pool_key(dict(PARAMS, account='ACCT', user='Alice'))
+    assert key != session_pool.get_pool_key(dict(PARAMS, password='other'))
+    assert key != session_pool.get_pool_key(dict(PARAMS, role='accountadmin'))
+    assert 'secret' not in key
+
+def test_released_sessions_are_reused_by_the_same_credentials_only(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=0)
+    assert pool.checkout(key, 'first') is session
+    pool.release('first')
+    assert pool.checkout(key, 'second') is session
+    pool.release('second')
+    other_key, other_session = pool.connect(dict(PARAMS, password='other'), 'third', worker_sessions=0)
+    assert other_session is not session and len(created) == 2
+    assert pool.status()['stats']['reused'] == 1
+
+def test_a_held_session_is_not_shared(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=0)
+    with pytest.raises(session_pool.SessionPoolError):
+        pool.checkout(key, 'second', timeout=0)
+
+def test_pool_size_is_capped(clock):
+    pool, created = make_pool(max_size=2)
+    pool.connect(PARAMS, 'first', worker_sessions=0)
+    pool.connect(dict(PARAMS, user='bob'), 'second', worker_sessions=0)
+    with pytest.raises(session_pool.SessionPoolError):
+        pool.connect(dict(PARAMS, user='carol'), 'third', timeout=0, worker_sessions=0)
+    # An idle session of other credentials is closed to make room.
+    pool.release('second')
+    pool.connect(dict(PARAMS, user='carol'), 'third', timeout=0, worker_sessions=0)
+    assert created[1].closed and pool.status()['open'] == 2
+
+def test_busy_leases_are_never_handed_to_another_owner(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=0)
+    # Heartbeats keep a long rerun's lease, however long ago it was checked out.
+    for _ in range(5):
+        clock.now += 500
+        pool.heartbeat('first')
+        with pytest.raises(session_pool.SessionPoolError):
+            pool.checkout(key, 'second', timeout=0)
+    assert not session.closed
+
+def test_stale_leases_are_closed_not_reused(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=0)
+    clock.now += 601
+    # The stale session is closed, so the key has nothing left to check out.
+    with pytest.raises(session_pool.SessionPoolError, match='connect again'):
+        pool.checkout(key, 'second', timeout=0)
+    assert session.closed
+    assert pool.status()['stats']['reclaimed'] == 1
+    assert pool.status()['open'] == 0
+    # The first owner's late release doesn't put it back.
+    pool.release('first')
+    assert pool.status()['idle'] == 0
+
+def test_idle_sessions_are_health_checked_after_the_keepalive(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=1)
+    pool.release('first')
+    clock.now += 301
+    created[0].healthy = False
+    # The most recently used idle session fails its check and the next one is used.
+    assert pool.checkout(key, 'second', timeout=0) is created[1]
+    assert created[0].closed
+    assert pool.status()['stats']['health_check_failures'] == 1
+
+def test_health_checks_dont_hold_the_lock(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=1)
+    pool.release('first')
+    clock.now += 301
+    gate = threading.Event()
+    created[0].check_gate = gate
+    result = {}
+    checking = threading.Thread(target=lambda: result.setdefault('session', pool.checkout(key, 'second', timeout=5)))
+    checking.start()
+    while created[0].queries == 0 and not pool.status()['leased']:
+        pass
+    # Other callers carry on while the check is held up.
+    assert pool.try_checkout(key, 'third') is created[1]
+    assert pool.status()['leased'] == 2
+    gate.set()
+    checking.join(5)
+    assert result['session'] is created[0]
+
+def test_worker_sessions(clock):
+    pool, created = make_pool(max_size=3)
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=5)
+    # Only as many as fit next to the owner's session.
+    assert len(created) == 3 and pool.status()['idle'] == 2
+    first_worker = pool.try_checkout(key, 'first:worker_1')
+    second_worker = pool.try_checkout(key, 'first:worker_2')
+    assert {first_worker, second_worker} == {created[1], created[2]}
+    assert pool.try_checkout(key, 'first:worker_3') is None
+    assert pool.try_checkout(key, 'first:worker_1') is first_worker
+    pool.release('first:worker_1')
+    assert pool.try_checkout(key, 'first:worker_3') is first_worker
+
+def test_disconnect_closes_the_owners_and_idle_sessions(clock):
+    pool, created = make_pool()
+    key, session = pool.connect(PARAMS, 'first', worker_sessions=2)
+    worker = pool.try_checkout(key, 'first:worker')
+    pool.disconnect(key, 'first')
+    assert session.closed and not worker.closed
+    assert [created_session.closed for created_session in created if created_session not in (session, worker)] == [True]
+    pool.release('first:worker')
+    assert pool.status()['idle'] == 1
+
+def test_failed_connect_frees_the_slot(clock):
+    def create_session(connection_params):
+        raise RuntimeError('bad password')
+    pool = session_pool.SessionPool(create_session, max_size=1)
+    with pytest.raises(RuntimeError):
+        pool.connect(PARAMS, 'first', worker_sessions=0)
+    assert pool.status()['open'] == 0
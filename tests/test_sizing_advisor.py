@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import constants, cron_timeline, sizing_advisor
+
+LARGE = constants.WAREHOUSE_CODE_INDEX['large']
+
+def make_slot_sums(slot, hours=10, queries=10, size_index=LARGE, **averages):
+    # Sums for one slot seen over hours hours, with the given per hour averages.
+    slot_sums = np.zeros((sizing_advisor.HOURS_PER_WEEK, len(sizing_advisor.SLOT_COLUMNS)))
+    slot_hours = np.zeros(sizing_advisor.HOURS_PER_WEEK)
+    values = {'queries': queries, 'execution_seconds': 600, 'avg_running': 1.0, 'size_index': size_index * queries}
+    values.update(averages)
+    for column_name, value in values.items():
+        slot_sums[slot, sizing_advisor.SLOT_COLUMNS.index(column_name)] = value * (1 if column_name in ('queries', 'size_index') else hours)
+    slot_hours[slot] = hours
+    return slot_sums, slot_hours
+
+def test_busy_slot_keeps_the_size_its_queries_ran_at():
+    recommended = sizing_advisor.recommend_sizes(*make_slot_sums(30))
+    assert recommended[30] == LARGE
+    assert set(np.delete(recommended, 30)) == {-1}
+
+def test_baseline_is_the_average_size_of_the_queries():
+    slot_sums, slot_hours = make_slot_sums(30, queries=4, size_index=0)
+    # Three X-Small queries and one 2X-Large average out to Small.
+    slot_sums[30, sizing_advisor.SLOT_COLUMNS.index('size_index')] = 0 + 0 + 0 + 5
+    assert sizing_advisor.get_slot_sizes(slot_sums)[30] == 1
+
+def test_queueing_and_spilling_size_up():
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, queued_seconds=200))[30] == LARGE + 1
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, avg_queued_load=0.1))[30] == LARGE + 1
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, local_spill_gb=2.0))[30] == LARGE + 1
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, remote_spill_gb=0.5, queued_seconds=200))[30] == LARGE + 2
+
+def test_light_load_sizes_down_within_the_size_list():
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, avg_running=0.1))[30] == LARGE - 1
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, size_index=0, avg_running=0.1))[30] == 0
+    largest = len(constants.WAREHOUSE_CODE_LIST) - 1
+    assert sizing_advisor.recommend_sizes(*make_slot_sums(30, size_index=largest, remote_spill_gb=1.0))[30] == largest
+
+def test_aggregate_slots_uses_the_local_hour_of_week():
+    # Monday 2026-01-05 17:00 UTC is Monday 09:00 in Los Angeles.
+    hour_start = pd.Timestamp('2026-01-05 17:00', tz='UTC').timestamp()
+    rows = pd.DataFrame([[hour_start, 10, 600, 0, 0, 0, 1.0, 0, 30], [hour_start + 7 * 86400, 20, 600, 0, 0, 0, 1.0, 0, None]],
+                        columns=['hour_start'] + sizing_advisor.SLOT_COLUMNS)
+
+    class BatchedResult():
+        def to_pandas_batches(self):
+            return iter([rows.iloc[:1], rows.iloc[1:]])
+
+    slot_sums, slot_hours = sizing_advisor.aggregate_slots(BatchedResult(), 'America/Los_Angeles')
+    slot = 24 + 9
+    assert slot_hours[slot] == 2 and slot_hours.sum() == 2
+    assert slot_sums[slot, sizing_advisor.SLOT_COLUMNS.index('queries')] == 30
+    assert slot_sums[slot, sizing_advisor.SLOT_COLUMNS.index('size_index')] == 30
+    assert sizing_advisor.get_hour_of_week(np.array([hour_start]), 'UTC')[0] == 24 + 17
+
+def test_constant_size_is_one_weekly_schedule():
+    recommended = np.full(sizing_advisor.HOURS_PER_WEEK, -1)
+    recommended[50] = 2
+    assert sizing_advisor.build_schedules(recommended, 'UTC') == [{'index': 1, 'size': 'medium', 'cron': '0 0 * * 0', 'tz': 'UTC'}]
+    assert sizing_advisor.build_schedules(np.full(sizing_advisor.HOURS_PER_WEEK, -1), 'UTC') == []
+
+def get_timeline_sizes(schedules):
+    # Sizes the schedules set at the top of each hour of a week, Sunday first.
+    week_start = cron_timeline.get_week_start('UTC', pd.Timestamp('2026-01-07', tz='UTC').to_pydatetime())
+    timeline = cron_timeline.ScheduleTimeline(schedules, week_start)
+    return timeline.sizes[::60]
+
+def test_schedules_reproduce_the_recommendations():
+    recommended = np.full(sizing_advisor.HOURS_PER_WEEK, -1)
+    for day in range(1, 6):
+        recommended[day * 24 + 8:day * 24 + 18] = 3
+        recommended[day * 24 + 18:day * 24 + 20] = 1
+    recommended[6 * 24 + 10] = 0
+    schedules = sizing_advisor.build_schedules(recommended, 'UTC')
+    assert len(schedules) <= constants.MAX_SCHEDULE_COUNT
+    # Idle hours keep the size before them.
+    expected = recommended.copy()
+    for slot in range(2 * sizing_advisor.HOURS_PER_WEEK):
+        if expected[slot % sizing_advisor.HOURS_PER_WEEK] < 0:
+            expected[slot % sizing_advisor.HOURS_PER_WEEK] = expected[slot % sizing_advisor.HOURS_PER_WEEK - 1]
+    assert np.array_equal(get_timeline_sizes(schedules), expected)
+
+def test_too_many_runs_are_merged_into_the_larger_size():
+    recommended = np.full(sizing_advisor.HOURS_PER_WEEK, LARGE)
+    recommended[30] = 1
+    recommended[100:103] = 0
+    assert len(sizing_advisor.build_schedules(recommended, 'UTC')) == 3
+    # The one hour Small run goes first, then the X-Small run.
+    schedules = sizing_advisor.build_schedules(recommended, 'UTC', max_count=2)
+    expected = recommended.copy()
+    expected[30] = LARGE
+    assert np.array_equal(get_timeline_sizes(schedules), expected)
+    schedules = sizing_advisor.build_schedules(recommended, 'UTC', max_count=1)
+    assert schedules == [{'index': 1, 'size': 'large', 'cron': '0 0 * * 0', 'tz': 'UTC'}]
+
+def test_random_recommendations_fit_the_schedule_limit():
+    rand = np.random.default_rng(0)
+    recommended = rand.integers(-1, 4, sizing_advisor.HOURS_PER_WEEK)
+    schedules = sizing_advisor.build_schedules(recommended, 'UTC')
+    assert 0 < len(schedules) <= constants.MAX_SCHEDULE_COUNT
+    sizes = get_timeline_sizes(schedules)
+    assert set(sizes) <= set(recommended[recommended >= 0])
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+import suspend_simulator
+
+def random_intervals(rand, count, horizon=5000):
+    starts = rand.integers(0, horizon, count)
+    return np.column_stack((starts, starts + rand.integers(1, 200, count))).astype(float)
+
+def brute_force_busy(intervals, horizon):
+    busy = np.zeros(horizon, dtype=bool)
+    for start, end in intervals.astype(int):
+        busy[start:end] = True
+    return busy
+
+def brute_force_simulate(busy, step):
+    # Walk second by second: the warehouse is up while busy and for step seconds after.
+    runs = []
+    up = False
+    last_busy = None
+    for second, is_busy in enumerate(busy):
+        was_up = up
+        up = is_busy or (was_up and second - last_busy <= step)
+        if is_busy:
+            last_busy = second
+        if up and not was_up:
+            runs.append(0)
+        if up:
+            runs[-1] += 1
+    return sum(max(run, suspend_simulator.MINIMUM_BILLED_SECONDS) for run in runs), len(runs)
+
+def test_merge_matches_brute_force():
+    rand = np.random.default_rng(0)
+    for trial in range(50):
+        intervals = random_intervals(rand, rand.integers(1, 60))
+        merged = suspend_simulator.merge_intervals(intervals)
+        assert np.all(merged[1:, 0] > merged[:-1, 1])
+        horizon = int(intervals[:, 1].max()) + 1
+        assert np.array_equal(brute_force_busy(merged, horizon), brute_force_busy(intervals, horizon))
+
+def test_merge_edge_cases():
+    assert suspend_simulator.merge_intervals(np.empty((0, 2))).shape == (0, 2)
+    # Touching intervals merge, an end before its start counts as a point.
+    merged = suspend_simulator.merge_intervals(np.array([[5.0, 8.0], [0.0, 2.0], [2.0, 3.0], [20.0, 10.0]]))
+    assert merged.tolist() == [[0.0, 3.0], [5.0, 8.0], [20.0, 20.0]]
+
+@pytest.mark.parametrize('step', [1, 30, 60, 300, 600])
+def test_simulate_matches_brute_force(step):
+    rand = np.random.default_rng(step)
+    for trial in range(20):
+        intervals = random_intervals(rand, rand.integers(1, 40))
+        busy_intervals = suspend_simulator.merge_intervals(intervals)
+        # One credit per second, so credits are billed seconds.
+        result, = suspend_simulator.simulate(busy_intervals, [step], 3600, 86400)
+        busy = brute_force_busy(intervals, int(intervals[:, 1].max()) + step + 1)
+        billed_seconds, resumes = brute_force_simulate(busy, step)
+        assert result['credits'] == billed_seconds
+        assert result['idle_credits'] == billed_seconds - busy.sum()
+        assert result['resumes'] == resumes
+
+def test_never_suspending_bills_the_window():
+    busy_intervals = np.array([[100.0, 200.0], [5000.0, 5300.0]])
+    results = suspend_simulator.simulate(busy_intervals, [0], 3600, 3600)
+    assert results == [{'auto_suspend': 0, 'credits': 5200.0, 'idle_credits': 4800.0, 'resumes': 1}]
+    results = suspend_simulator.simulate(busy_intervals, [0], 1, 86400)
+    assert results[0]['credits'] == 24.0
+
+def test_no_queries_bill_nothing():
+    results = suspend_simulator.simulate(np.empty((0, 2)), [60, 0], 8, 86400)
+    assert [(result['credits'], result['resumes']) for result in results] == [(0.0, 0), (0.0, 0)]
+
+def test_credits_fall_as_auto_suspend_shortens():
+    rand = np.random.default_rng(1)
+    busy_intervals = suspend_simulator.merge_intervals(random_intervals(rand, 200, horizon=86400))
+    steps = [step for step in reversed(suspend_simulator.constants.WAREHOUSE_AUTO_SUSPEND_STEPS) if step]
+    credits = [result['credits'] for result in suspend_simulator.simulate(busy_intervals, steps, 4, 86400)]
+    assert credits == sorted(credits, reverse=True)
+
+class BatchedResult():
+    def __init__(self, batches):
+        self.batches = batches
+
+    def to_pandas_batches(self):
+        return iter(self.batches)
+
+def test_load_busy_intervals_merges_across_batches():
+    batches = [
+        pd.DataFrame({'START_MS': [0, 5000, None], 'END_MS': [2000, 7000, 9000]}),
+        pd.DataFrame({'START_MS': [1000, 6500], 'END_MS': [3000, 12000]}),
+        pd.DataFrame({'START_MS': [20000], 'END_MS': [None]})
+        ]
+    busy_intervals = suspend_simulator.load_busy_intervals(BatchedResult(batches))
+    assert busy_intervals.tolist() == [[0.0, 3.0], [5.0, 12.0]]
@@ -0,0 +1,63 @@
+import json
+import constants, session_backend, tag_inventory
+
+def test_inventory_of_every_warehouse_in_one_query():
+    session = session_backend.StandInSession(warehouse_count=12)
+    inventory = tag_inventory.get_tag_inventory(session.sql(constants.WAREHOUSE_TAG_INVENTORY_SQL).collect())
+    assert session.round_trips == 1
+    assert sorted(inventory.keys()) == session.warehouse_names
+    assert inventory['WH_00'] == {'assist_enabled': 'y', 'tag_assignments': {'DEPARTMENT': 'Accounting'}}
+    assert inventory['WH_01'] == {'assist_enabled': 'n', 'tag_assignments': {}}
+    # The stand-in's tag references agree with the inventory.
+    for warehouse_name, tags in inventory.items():
+        assert session._get_tag('tagging_assist_db.tagging.tag_assistant_enabled', warehouse_name, 'warehouse') == tags['assist_enabled']
+
+def test_inventory_reads_json_strings_and_nulls():
+    rows = [
+        {'WAREHOUSE_NAME': 'A', 'ASSISTANT_ENABLED': 'y', 'TAG_ASSIGNMENTS': '{"DEPARTMENT": "Sales"}'},
+        {'WAREHOUSE_NAME': 'B', 'ASSISTANT_ENABLED': None, 'TAG_ASSIGNMENTS': None},
+        {'WAREHOUSE_NAME': 'C', 'ASSISTANT_ENABLED': 'n', 'TAG_ASSIGNMENTS': {'OWNER': 'ops'}}
+        ]
+    assert tag_inventory.get_tag_inventory(rows) == {
+        'A': {'assist_enabled': 'y', 'tag_assignments': {'DEPARTMENT': 'Sales'}},
+        'B': {'assist_enabled': 'n', 'tag_assignments': {}},
+        'C': {'assist_enabled': 'n', 'tag_assignments': {'OWNER': 'ops'}}
+        }
+    assert tag_inventory.get_tag_inventory(None) == {}
+
+def test_tag_lookup_from_show_tags():
+    session = session_backend.StandInSession(warehouse_count=2)
+    tag_list, tag_lookup = tag_inventory.build_tag_lookup(session.sql('show tags in tagging_assist_db.tagging').collect())
+    assert tag_list == ['', 'DEPARTMENT', 'TAG_ASSISTANT_ENABLED']
+    assert tag_lookup['TAG_ASSISTANT_ENABLED']['allowed_values'] == ['n', 'y']
+    assert tag_lookup['DEPARTMENT']['allowed_values'] == []
+
+def test_patching_one_warehouse_leaves_the_rest():
+    rows = session_backend.StandInSession(warehouse_count=4).sql(constants.WAREHOUSE_TAG_INVENTORY_SQL).collect()
+    patched_rows = tag_inventory.patch_tag_inventory_rows(rows, 'WH_1', assistant_enabled='y', tag_name='department', tag_value='Finance')
+    inventory = tag_inventory.get_tag_inventory(patched_rows)
+    assert inventory['WH_1'] == {'assist_enabled': 'y', 'tag_assignments': {'DEPARTMENT': 'Finance'}}
+    assert inventory['WH_0'] == tag_inventory.get_tag_inventory(rows)['WH_0']
+    # The cached rows are left alone.
+    assert tag_inventory.get_tag_inventory(rows)['WH_1']['assist_enabled'] == 'n'
+
+    patched_rows = tag_inventory.patch_tag_inventory_rows(patched_rows, 'WH_1', tag_name='DEPARTMENT', tag_value=None)
+    assert tag_inventory.get_tag_inventory(patched_rows)['WH_1']['tag_assignments'] == {}
+
+def test_patching_adds_rows_for_untagged_warehouses():
+    patched_rows = tag_inventory.patch_tag_inventory_rows([], 'NEW_WH', assistant_enabled='y')
+    assert tag_inventory.get_tag_inventory(patched_rows) == {'NEW_WH': {'assist_enabled': 'y', 'tag_assignments': {}}}
+
+def test_patching_many_warehouses_in_one_pass():
+    rows = [{'WAREHOUSE_NAME': 'A', 'ASSISTANT_ENABLED': 'y', 'TAG_ASSIGNMENTS': json.dumps({'DEPARTMENT': 'Sales', 'OWNER': 'ops'})}]
+    patched_rows = tag_inventory.patch_many_tag_inventory_rows(rows, {'A': {'department': None, 'owner': 'dba'}, 'B': {'DEPARTMENT': 'Finance'}})
+    assert tag_inventory.get_tag_inventory(patched_rows) == {
+        'A': {'assist_enabled': 'y', 'tag_assignments': {'OWNER': 'dba'}},
+        'B': {'assist_enabled': 'n', 'tag_assignments': {'DEPARTMENT': 'Finance'}}
+        }
+
+def test_patching_warehouse_rows():
+    rows = session_backend.StandInSession(warehouse_count=3).sql('show warehouses').collect()
+    patched_rows = tag_inventory.patch_many_warehouse_rows(rows, {'WH_2': {'size': 'Large', 'auto_suspend': 60}})
+    assert [(row['name'], row['auto_suspend']) for row in patched_rows] == [('WH_0', 600), ('WH_1', 600), ('WH_2', 60)]
+    assert patched_rows[2]['size'] == 'Large' and patched_rows[0] is rows[0]
@@ -0,0 +1,71 @@
+import constants, session_backend, tag_value_index
+
+ROWS = [
+    {'TAG_NAME': 'COST_CENTER', 'TAG_VALUE': 'Finance', 'OBJECT_COUNT': 3},
+    {'TAG_NAME': 'COST_CENTER', 'TAG_VALUE': 'finops', 'OBJECT_COUNT': 7},
+    {'TAG_NAME': 'COST_CENTER', 'TAG_VALUE': 'Field', 'OBJECT_COUNT': 1},
+    {'TAG_NAME': 'COST_CENTER', 'TAG_VALUE': 'marketing', 'OBJECT_COUNT': 5},
+    {'TAG_NAME': 'COST_CENTER', 'TAG_VALUE': 'retired', 'OBJECT_COUNT': 0},
+    {'TAG_NAME': 'COST_CENTER', 'TAG_VALUE': None, 'OBJECT_COUNT': 2},
+    {'TAG_NAME': 'OWNER', 'TAG_VALUE': 'fin', 'OBJECT_COUNT': 1}
+    ]
+
+def test_prefix_search_ignores_case_and_ranks_by_count():
+    index = tag_value_index.TagValueIndex(ROWS)
+    assert index.search('COST_CENTER', 'fin') == ['finops', 'Finance']
+    assert index.search('COST_CENTER', 'FI') == ['finops', 'Finance', 'Field']
+    assert index.search('COST_CENTER', 'fi', limit=2) == ['finops', 'Finance']
+    assert index.search('COST_CENTER', 'finances') == []
+    assert index.search('OWNER', 'fin') == ['fin']
+
+def test_blank_prefix_returns_every_used_value():
+    index = tag_value_index.TagValueIndex(ROWS)
+    assert index.search('COST_CENTER') == ['finops', 'marketing', 'Finance', 'Field']
+    assert index.get_count('COST_CENTER', 'retired') == 0
+    assert index.search('UNKNOWN', 'a') == []
+    assert tag_value_index.TagValueIndex(None).search('COST_CENTER') == []
+
+def test_prefix_search_matches_a_linear_scan():
+    values = ['a', 'A', 'ab', 'aB', 'abc', 'b', 'ba', 'Ä', 'äb', 'z~', 'zz', '']
+    rows = [{'TAG_NAME': 'T', 'TAG_VALUE': value, 'OBJECT_COUNT': count + 1} for count, value in enumerate(values)]
+    index = tag_value_index.TagValueIndex(rows)
+    for prefix in ['', 'a', 'A', 'ab', 'abcd', 'ä', 'z', 'z~', '~']:
+        expected = sorted([value for value in values if value.lower().startswith(prefix.lower())], key=lambda value: -(values.index(value) + 1))
+        assert index.search('T', prefix) == expected
+
+def test_patches_add_remove_and_move_values():
+    patched_rows = tag_value_index.patch_many_tag_value_rows(ROWS, [
+        ('COST_CENTER', 'Field', 'marketing'),
+        ('COST_CENTER', None, 'sales'),
+        ('COST_CENTER', None, 'sales'),
+        ('OWNER', 'fin', None),
+        ('OWNER', 'same', 'same')
+        ])
+    index = tag_value_index.TagValueIndex(patched_rows)
+    assert index.get_count('COST_CENTER', 'Field') == 0
+    assert index.get_count('COST_CENTER', 'marketing') == 6
+    assert index.get_count('COST_CENTER', 'sales') == 2
+    assert index.search('OWNER') == []
+    assert index.search('COST_CENTER', 'f') == ['finops', 'Finance']
+    # The cached rows are left alone.
+    assert ROWS[2]['OBJECT_COUNT'] == 1
+
+def test_patch_one_value():
+    patched_rows = tag_value_index.patch_tag_value_rows(ROWS, 'OWNER', 'fin', 'ops')
+    index = tag_value_index.TagValueIndex(patched_rows)
+    assert index.search('OWNER') == ['ops']
+
+def test_index_is_built_once_per_row_list():
+    rows = list(ROWS)
+    index = tag_value_index.get_index(rows)
+    assert tag_value_index.get_index(rows) is index
+    assert tag_value_index.get_index(list(ROWS)) is not index
+    for _ in range(tag_value_index.INDEX_CACHE_SIZE):
+        tag_value_index.get_index(list(ROWS))
+    assert tag_value_index.get_index(rows) is not index
+
+def test_index_query_counts_only_warehouses():
+    session = session_backend.StandInSession(warehouse_count=3)
+    session.connection.execute("insert into tag_references (object_name, domain, tag_database, tag_schema, tag_name, tag_value) values ('SALES_DB', 'DATABASE', 'TAGGING_ASSIST_DB', 'TAGGING', 'ONLY_ON_DATABASES', 'x')")
+    rows = session.sql(constants.TAG_VALUE_INDEX_SQL).collect()
+    assert rows and 'ONLY_ON_DATABASES' not in [row['TAG_NAME'] for row in rows]
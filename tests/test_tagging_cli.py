@@ -0,0 +1,35 @@
+import session_backend, tagging_cli
+
+def make_plan(warehouse_names, schedules=None):
+    return {'warehouses': dict((name, {'settings': {'auto_suspend': 60}, 'tags': {'DEPARTMENT': 'Finance'}, 'schedules': schedules}) for name in warehouse_names), 'errors': []}
+
+def test_apply_uses_one_batch_and_one_schedules_call():
+    session = session_backend.StandInSession(warehouse_count=20)
+    run_sql = lambda sql: session.sql(sql).collect()
+    names = [row['name'] for row in run_sql('show warehouses')]
+    schedules = [{'index': 1, 'size': 'large', 'cron': '0 8 * * *', 'tz': 'UTC'}]
+    assert tagging_cli.apply_plan(run_sql, make_plan(names, schedules)) == []
+    assert session.round_trips == 1 + 2
+    assert session.statements[1].startswith('execute immediate') and session.statements[2].startswith('call utility.sp_save_many_warehouse_schedules(')
+
+def test_apply_reports_each_failed_statement():
+    ran = []
+    def run_sql(sql):
+        ran.append(sql)
+        if sql.startswith('execute immediate') or 'WH_02' in sql:
+            raise Exception('Object does not exist')
+        return [('ok',)]
+    errors = tagging_cli.apply_plan(run_sql, make_plan(['WH_01', 'WH_02', 'WH_03']))
+    assert len(ran) == 1 + 6
+    assert len(errors) == 2 and all(error.startswith('WH_02: Object does not exist (in: alter warehouse WH_02 ') for error in errors)
+
+def test_apply_reports_failed_schedules():
+    session = session_backend.StandInSession(warehouse_count=2)
+    run_sql = lambda sql: session.sql(sql).collect()
+    plan = {'warehouses': {
+        'WH_0': {'settings': {}, 'tags': {}, 'schedules': []},
+        'NO_SUCH_WH': {'settings': {}, 'tags': {}, 'schedules': []}
+        }, 'errors': []}
+    errors = tagging_cli.apply_plan(run_sql, plan)
+    assert errors == ["NO_SUCH_WH: Warehouse 'NO_SUCH_WH' does not exist or not authorized."]
+    assert session.round_trips == 1
@@ -0,0 +1,80 @@
+import constants, session_backend, tag_inventory, warehouse_catalog
+
+def load_rows(warehouse_count=12):
+    session = session_backend.StandInSession(warehouse_count=warehouse_count)
+    run_sql = lambda sql: session.sql(sql).collect()
+    return run_sql('show warehouses'), run_sql(constants.WAREHOUSE_TAG_INVENTORY_SQL)
+
+def test_catalog_is_loaded_with_two_statements():
+    session = session_backend.StandInSession(warehouse_count=30)
+    catalog = warehouse_catalog.load_catalog(lambda sql: session.sql(sql).collect())
+    assert session.round_trips == 2
+    assert len(catalog) == 30 and 'WH_07' in catalog and 'WH_99' not in catalog
+
+def test_records_combine_warehouse_rows_and_tags():
+    warehouse_rows, tag_rows = load_rows()
+    catalog = warehouse_catalog.get_catalog(warehouse_rows, tag_rows)
+    record = catalog.get('WH_03')
+    assert (record.name, record.assist_enabled, record.tag_assignments) == ('WH_03', 'n', {'DEPARTMENT': 'Marketing'})
+    assert record.auto_suspend == 600 and record.owner == 'SYSADMIN'
+    assert record.get_properties()['warehouse_size'] == record.size
+    assert record.as_dict()['clustering']['scaling_policy'] == 'STANDARD'
+    assert catalog.get('WH_99') is None
+
+def test_lookups_match_a_scan_of_the_records():
+    warehouse_rows, tag_rows = load_rows(40)
+    catalog = warehouse_catalog.get_catalog(warehouse_rows, tag_rows)
+    records = [catalog.get(name) for name in catalog.names]
+    for size in catalog.get_values('size'):
+        assert catalog.find(size=size) == [record.name for record in records if record.size == size]
+        assert catalog.find(size=size, assist_enabled='y') == [record.name for record in records if record.size == size and record.assist_enabled == 'y']
+    assert catalog.find(comment='Synthetic warehouse') == catalog.names
+    assert catalog.find(size='Huge') == []
+    assert catalog.get_warehouse_list('All') == [''] + catalog.names
+    assert catalog.get_warehouse_list('Yes') == [''] + [record.name for record in records if record.assist_enabled == 'y']
+    assert catalog.get_warehouse_list('No') == [''] + [record.name for record in records if record.assist_enabled == 'n']
+
+def test_long_comments_are_truncated():
+    warehouse_rows, tag_rows = load_rows(1)
+    row = dict(warehouse_rows[0].asDict(), comment='x' * (constants.COMMENT_MAX_LENGTH + 10))
+    catalog = warehouse_catalog.WarehouseCatalog([row], tag_inventory.get_tag_inventory(tag_rows))
+    assert len(catalog.get('WH_0').comment) == constants.COMMENT_MAX_LENGTH
+
+def test_catalog_is_rebuilt_only_for_new_rows():
+    warehouse_rows, tag_rows = load_rows()
+    catalog = warehouse_catalog.get_catalog(warehouse_rows, tag_rows)
+    assert warehouse_catalog.get_catalog(warehouse_rows, tag_rows) is catalog
+    # A patched tag inventory is a new row list, so the change shows up.
+    patched_rows = tag_inventory.patch_tag_inventory_rows(tag_rows, 'WH_01', assistant_enabled='y')
+    patched_catalog = warehouse_catalog.get_catalog(warehouse_rows, patched_rows)
+    assert patched_catalog is not catalog
+    assert patched_catalog.get('WH_01').assist_enabled == 'y'
+    assert 'WH_01' in patched_catalog.get_warehouse_list('Yes')
+    assert catalog.get('WH_01').assist_enabled == 'n'
+
+def test_search_matches_a_scan_of_the_names():
+    warehouse_rows, tag_rows = load_rows(120)
+    catalog = warehouse_catalog.get_catalog(warehouse_rows, tag_rows)
+    for text in ['', 'w', 'h_1', 'WH_10', ' wh_11 ', 'wh_1199', 'xyz']:
+        names, total = catalog.search(text)
+        assert names == [name for name in catalog.names if text.strip().lower() in name.lower()]
+        assert total == len(names)
+
+def test_search_combines_text_and_criteria():
+    warehouse_rows, tag_rows = load_rows(120)
+    catalog = warehouse_catalog.get_catalog(warehouse_rows, tag_rows)
+    size = catalog.get_values('size')[0]
+    names, total = catalog.search('wh_1', size=size, assist_enabled='y')
+    assert names == [name for name in catalog.find(size=size, assist_enabled='y') if 'wh_1' in name.lower()]
+    assert total == len(names)
+    assert catalog.search('', size=size) == (catalog.find(size=size), len(catalog.find(size=size)))
+
+def test_search_pages_keep_the_total():
+    warehouse_rows, tag_rows = load_rows(120)
+    catalog = warehouse_catalog.get_catalog(warehouse_rows, tag_rows)
+    matches = catalog.search('wh_')[0]
+    assert catalog.search('wh_', 0, 0) == ([], len(matches))
+    pages = [catalog.search('wh_', offset, 50) for offset in range(0, len(matches), 50)]
+    assert [name for page in pages for name in page[0]] == matches
+    assert all(total == len(matches) for names, total in pages)
+    assert catalog.search('wh_', len(matches), 50) == ([], len(matches))
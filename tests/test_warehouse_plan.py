@@ -0,0 +1,163 @@
+import pytest
+import constants, sql_builder, warehouse_plan
+
+def make_warehouse_row(name, **columns):
+    row = {'name': name, 'size': 'X-Small', 'auto_suspend': 600, 'auto_resume': 'true', 'comment': '', 'scaling_policy': 'STANDARD',
+           'min_cluster_count': 1, 'max_cluster_count': 1, 'enable_query_acceleration': 'false', 'query_acceleration_max_scale_factor': 8}
+    row.update(columns)
+    return row
+
+def make_schedule_row(warehouse_name, index, size, cron, tz='UTC', state='started'):
+    # Shaped like a row of `show tasks`.
+    return {
+        'name': 'RESIZE_' + warehouse_name + '_SCHEDULE_' + str(index),
+        'definition': 'alter warehouse ' + warehouse_name + ' set warehouse_size = ' + size.upper(),
+        'schedule': 'USING CRON ' + cron + ' ' + tz,
+        'state': state
+        }
+
+WAREHOUSE_ROWS = [make_warehouse_row('COMPUTE_WH'), make_warehouse_row('etl_wh', size='Large', auto_suspend=None)]
+
+SCHEDULE_ROWS = [
+    make_schedule_row('COMPUTE_WH', 2, 'xsmall', '0 18 * * 1-5'),
+    make_schedule_row('COMPUTE_WH', 1, 'large', '0 8 * * 1-5'),
+    {'name': 'SOME_OTHER_TASK', 'definition': 'select 1', 'schedule': '60 MINUTE', 'state': 'started'}
+    ]
+
+def test_settings_diff_ignores_equivalent_values():
+    current = warehouse_plan.get_row_properties(WAREHOUSE_ROWS[1])
+    assert warehouse_plan.diff_settings(current, {'warehouse_size': 'large', 'auto_suspend': 0, 'auto_resume': 'TRUE', 'scaling_policy': 'standard'}) == {}
+    assert warehouse_plan.diff_settings(current, {'warehouse_size': 'X-Small', 'auto_suspend': 60, 'comment': 'etl'}) == {'warehouse_size': 'xsmall', 'auto_suspend': 60, 'comment': 'etl'}
+
+def test_settings_diff_rejects_unknown_properties_and_sizes():
+    current = warehouse_plan.get_row_properties(WAREHOUSE_ROWS[0])
+    with pytest.raises(ValueError):
+        warehouse_plan.diff_settings(current, {'max_concurrency_level': 8})
+    with pytest.raises(ValueError):
+        warehouse_plan.diff_settings(current, {'warehouse_size': 'Huge'})
+
+def test_row_changes_use_show_warehouses_values():
+    changes = {'warehouse_size': 'xlarge', 'auto_resume': False, 'auto_suspend': 60}
+    assert warehouse_plan.get_row_changes(changes) == {'size': 'X-Large', 'auto_resume': 'false', 'auto_suspend': 60}
+
+def test_every_spec_tag_is_set():
+    assert warehouse_plan.get_tag_changes(True, {'DEPARTMENT': 'Accounting', 'COST': 12, 'OLD_TAG': None}) == {
+        'tag_assistant_enabled': 'y', 'DEPARTMENT': 'Accounting', 'COST': '12', 'OLD_TAG': None}
+    assert warehouse_plan.get_tag_changes('n', None) == {'tag_assistant_enabled': 'n'}
+    assert warehouse_plan.get_tag_changes(None, {}) == {}
+    with pytest.raises(ValueError):
+        warehouse_plan.get_tag_changes(None, {'bad name; drop': 'x'})
+
+def test_current_schedules_are_parsed_from_tasks():
+    assert warehouse_plan.get_current_schedules(SCHEDULE_ROWS) == {'compute_wh': [
+        {'index': 1, 'size': 'large', 'cron': '0 8 * * 1-5', 'tz': 'UTC', 'state': 'started'},
+        {'index': 2, 'size': 'xsmall', 'cron': '0 18 * * 1-5', 'tz': 'UTC', 'state': 'started'}
+        ]}
+
+def test_schedules_are_normalized_and_checked():
+    normalized = warehouse_plan.normalize_schedules([{'size': 'Large', 'cron': ' 0  8 * *  1-5'}, {'size': 'xsmall', 'cron': '0 18 * * 1-5', 'tz': 'Europe/London'}], 'UTC')
+    assert normalized == [{'index': 1, 'size': 'large', 'cron': '0 8 * * 1-5', 'tz': 'UTC'}, {'index': 2, 'size': 'xsmall', 'cron': '0 18 * * 1-5', 'tz': 'Europe/London'}]
+    with pytest.raises(ValueError):
+        warehouse_plan.normalize_schedules([{'size': 'small', 'cron': '0 8 * *'}], 'UTC')
+    with pytest.raises(ValueError):
+        warehouse_plan.normalize_schedules([{'size': 'small', 'cron': '0 8 * * *'}] * (constants.MAX_SCHEDULE_COUNT + 1), 'UTC')
+
+def test_dispatcher_rejects_tokens_it_cant_run(monkeypatch):
+    schedules = [{'size': 'small', 'cron': '0 8 L * *'}]
+    assert warehouse_plan.normalize_schedules(schedules, 'UTC')[0]['cron'] == '0 8 L * *'
+    monkeypatch.setattr(constants, 'SCHEDULING_ENGINE', 'dispatcher')
+    with pytest.raises(ValueError):
+        warehouse_plan.normalize_schedules(schedules, 'UTC')
+
+def test_plan_only_lists_changes():
+    spec = {'timezone': 'UTC', 'warehouses': {
+        'compute_wh': {
+            'settings': {'warehouse_size': 'X-Small', 'auto_suspend': 600},
+            'schedules': [{'size': 'large', 'cron': '0 8 * * 1-5'}, {'size': 'xsmall', 'cron': '0 18 * * 1-5'}]
+            },
+        'etl_wh': {'settings': {'auto_suspend': 60}, 'tags': {'DEPARTMENT': 'Data'}, 'schedules': []}
+        }}
+    plan = warehouse_plan.build_plan(spec, WAREHOUSE_ROWS, SCHEDULE_ROWS)
+    assert plan['errors'] == [] and plan['warnings'] == []
+    # etl_wh has no schedules to remove.
+    assert plan['warehouses'] == {'etl_wh': {'settings': {'auto_suspend': 60}, 'tags': {'DEPARTMENT': 'Data'}, 'schedules': None}}
+    plan = warehouse_plan.build_plan({'warehouses': {'COMPUTE_WH': {'schedules': []}}}, WAREHOUSE_ROWS, SCHEDULE_ROWS)
+    assert plan['warehouses'] == {'COMPUTE_WH': {'settings': {}, 'tags': {}, 'schedules': []}}
+
+def test_changed_or_suspended_schedules_are_saved_again():
+    schedule_rows = [make_schedule_row('COMPUTE_WH', 1, 'large', '0 8 * * 1-5', state='suspended'), SCHEDULE_ROWS[0]]
+    spec = {'timezone': 'UTC', 'warehouses': {'COMPUTE_WH': {'schedules': [{'size': 'large', 'cron': '0 8 * * 1-5'}, {'size': 'xsmall', 'cron': '0 18 * * 1-5'}]}}}
+    plan = warehouse_plan.build_plan(spec, WAREHOUSE_ROWS, schedule_rows)
+    assert [schedule['cron'] for schedule in plan['warehouses']['COMPUTE_WH']['schedules']] == ['0 8 * * 1-5', '0 18 * * 1-5']
+    spec['warehouses']['COMPUTE_WH']['schedules'][1]['size'] = 'small'
+    plan = warehouse_plan.build_plan(spec, WAREHOUSE_ROWS, SCHEDULE_ROWS)
+    assert plan['warehouses']['COMPUTE_WH']['schedules'][1]['size'] == 'small'
+
+def test_plan_errors_and_warnings():
+    spec = {'timezone': 'UTC', 'warehouses': {
+        'MISSING_WH': {'settings': {'auto_suspend': 60}},
+        'COMPUTE_WH': {'settings': {'auto_suspend': 60}, 'schedule': []},
+        'etl_wh': {'settings': {'warehouse_size': 'huge'}},
+        'ETL_WH': {'schedules': [{'size': 'small', 'cron': '0 8 * * *'}, {'size': 'large', 'cron': '0 8 * * 1'}]}
+        }}
+    plan = warehouse_plan.build_plan(spec, WAREHOUSE_ROWS, SCHEDULE_ROWS)
+    assert plan['errors'] == [
+        'MISSING_WH: warehouse does not exist or is not visible to this role',
+        'COMPUTE_WH: unknown keys schedule',
+        'etl_wh: Unknown warehouse size: huge',
+        'ETL_WH: warehouse does not exist or is not visible to this role'
+        ]
+    assert plan['warehouses'] == {}
+
+def test_conflicting_schedules_are_warnings():
+    spec = {'timezone': 'UTC', 'warehouses': {'COMPUTE_WH': {'schedules': [{'size': 'small', 'cron': '0 8 * * *'}, {'size': 'large', 'cron': '0 8 * * 1'}]}}}
+    plan = warehouse_plan.build_plan(spec, WAREHOUSE_ROWS, SCHEDULE_ROWS)
+    assert plan['errors'] == []
+    assert plan['warnings'] and all(warning.startswith('COMPUTE_WH: ') for warning in plan['warnings'])
+    assert len(plan['warehouses']['COMPUTE_WH']['schedules']) == 2
+
+def test_plan_statements():
+    plan = {'warehouses': {
+        'COMPUTE_WH': {'settings': {'auto_suspend': 60}, 'tags': {'DEPARTMENT': None}, 'schedules': None},
+        'etl_wh': {'settings': {}, 'tags': {}, 'schedules': [{'index': 1, 'size': 'large', 'cron': '0 8 * * *', 'tz': 'UTC'}]}
+        }}
+    statements, statement_names, schedule_calls = warehouse_plan.get_plan_statements(plan)
+    assert len(statements) == 2
+    assert statements[0].startswith('alter warehouse COMPUTE_WH set') and 'auto_suspend = 60' in statements[0]
+    assert statements[1] == 'alter warehouse COMPUTE_WH unset tag tagging_assist_db.tagging.DEPARTMENT'
+    assert [statement_names[statement] for statement in statements] == ['COMPUTE_WH', 'COMPUTE_WH']
+    assert [call[2] for call in schedule_calls] == [['etl_wh']]
+    assert schedule_calls[0][0].startswith('call utility.sp_save_many_warehouse_schedules(')
+    assert '"cron": "0 8 * * *"' in schedule_calls[0][0]
+
+def test_schedules_are_saved_in_chunks():
+    schedules = [{'index': 1, 'size': 'large', 'cron': '0 8 * * *', 'tz': 'UTC'}]
+    plan = {'warehouses': dict(('WH_' + str(i), {'settings': {}, 'tags': {}, 'schedules': schedules}) for i in range(sql_builder.SCHEDULE_CALL_MAX_WAREHOUSES + 1))}
+    schedule_calls = warehouse_plan.get_plan_statements(plan)[2]
+    assert [len(call[2]) for call in schedule_calls] == [sql_builder.SCHEDULE_CALL_MAX_WAREHOUSES, 1]
+    assert [name for call in schedule_calls for name in call[2]] == list(plan['warehouses'].keys())
+
+def test_many_schedule_errors():
+    result = {'warehouses': {
+        'A': {'schedules': {'1': {'action': 'saved', 'result': 'success'}}, 'dropped': {}},
+        'B': {'schedules': {'1': {'action': 'invalid', 'result': 'ERROR'}}, 'dropped': {}},
+        'C': {'error': 'Invalid warehouse name: C!', 'schedules': {}, 'dropped': {}}
+        }}
+    errors = warehouse_plan.get_many_schedule_errors(result, ['A', 'B', 'C', 'D'])
+    assert sorted(errors.keys()) == ['B', 'C', 'D']
+    assert errors['B'][0].startswith('schedule 1: ') and errors['C'] == ['Invalid warehouse name: C!'] and errors['D'] == ['no result']
+    assert warehouse_plan.get_many_schedule_errors({'error': 'Invalid scheduling engine: x'}, ['A']) == {'A': ['Invalid scheduling engine: x']}
+
+def test_failed_batches_are_run_one_statement_at_a_time():
+    ran = []
+    def run_sql(sql):
+        ran.append(sql)
+        if 'BAD' in sql:
+            raise Exception('Object does not exist')
+        return [('ok',)]
+    statements = ['alter warehouse A set auto_suspend = 60', 'alter warehouse BAD set auto_suspend = 60', 'alter warehouse C set auto_suspend = 60']
+    done, failed = warehouse_plan.run_statements(run_sql, statements)
+    assert done == [statements[0], statements[2]]
+    assert failed == [(statements[1], 'Object does not exist')]
+    assert ran[0].startswith('execute immediate') and ran[1:] == statements
+    assert warehouse_plan.run_statements(run_sql, statements[:1]) == ([statements[0]], [])
@@ -0,0 +1,141 @@
+'''
+Warehouse by day of week by hour of day usage cube. The hourly credits
+of every warehouse in the usage store (see usage_store.py) are summed
+and counted into NumPy arrays once per version of the store and
+timezone. The usage charts, the day by hour grid and the totals are
+then slices of the cube, so selecting another warehouse doesn't
+filter or group the store again.
+'''
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import constants
+
+# Cubes kept for different store versions and timezones.
+CUBE_CACHE_SIZE = 8
+
+# Labels in the format of the warehouse_usage_last_month view ('0 Sun', '13').
+DAY_LABELS = [str(day) + ' ' + day_name for day, day_name in enumerate(['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'])]
+
+HOUR_LABELS = [str(hour).zfill(2) for hour in range(24)]
+
+_cubes = OrderedDict()
+_cubes_lock = threading.Lock()
+
+class UsageCube():
+    '''
+    usage_df: the usage store, with STORE_COLUMNS and START_TIME in UTC.
+    local_timezone: the timezone days and hours are counted in.
+    '''
+    def __init__(self, usage_df, local_timezone=constants.DEFAULT_TIMEZONE):
+        self.usage_df = usage_df
+        warehouse_codes, warehouse_names = pd.factorize(usage_df['WAREHOUSE_NAME'], sort=True)
+        self.warehouse_index = dict((name, index) for index, name in enumerate(warehouse_names))
+
+        local_start = pd.DatetimeIndex(pd.to_datetime(usage_df['START_TIME'], utc=True)).tz_convert(local_timezone)
+        days = (np.asarray(local_start.dayofweek) + 1) % 7
+        hours = np.asarray(local_start.hour)
+        # Rounded per hour, as the charts have always shown them.
+        credits = usage_df['CREDITS_USED'].to_numpy(dtype='float64').round(2)
+
+        cell_count = len(warehouse_names) * 7 * 24
+        cells = (warehouse_codes * 7 + days) * 24 + hours
+        self.sums = np.bincount(cells, weights=credits, minlength=cell_count).reshape(-1, 7, 24)
+        self.counts = np.bincount(cells, minlength=cell_count).reshape(-1, 7, 24).astype('int32')
+        self.total_sums = self.sums.sum(axis=0)
+        self.total_counts = self.counts.sum(axis=0)
+
+        # The store is sorted by warehouse, so each warehouse's rows are one slice of it.
+        if np.all(np.diff(warehouse_codes) >= 0):
+            self.row_starts = np.searchsorted(warehouse_codes, np.arange(len(warehouse_names) + 1))
+        else:
+            self.row_starts = None
+
+    def _get_cells(self, warehouse_name):
+        # Blank is the whole account, a warehouse without usage is all zeros.
+        if warehouse_name == '':
+            return self.total_sums, self.total_counts
+        index = self.warehouse_index.get(warehouse_name)
+        if index is None:
+            return np.zeros((7, 24)), np.zeros((7, 24), dtype='int32')
+        return self.sums[index], self.counts[index]
+
+    def get_aggregates(self, warehouse_name=''):
+        '''
+        Returns average credits by day of week (START_DAY_NAME,
+        CREDITS_USED) and by hour of day (START_HOUR, CREDITS_USED), the
+        same output as usage_stats.get_usage_aggregates. If
+        warehouse_name is blank, account-wide averages are returned.
+        '''
+        sums, counts = self._get_cells(warehouse_name)
+        day_sums, day_counts = sums.sum(axis=1), counts.sum(axis=1)
+        hour_sums, hour_counts = sums.sum(axis=0), counts.sum(axis=0)
+        has_day, has_hour = day_counts > 0, hour_counts > 0
+
+        by_day_df = pd.DataFrame({
+            'START_DAY_NAME': np.array(DAY_LABELS)[has_day],
+            'CREDITS_USED': day_sums[has_day] / day_counts[has_day]
+            })
+        by_hour_df = pd.DataFrame({
+            'START_HOUR': np.array(HOUR_LABELS)[has_hour],
+            'CREDITS_USED': hour_sums[has_hour] / hour_counts[has_hour]
+            })
+        return by_day_df, by_hour_df
+
+    def get_grid(self, warehouse_name=''):
+        '''
+        Returns the average credits of each day and hour as a DataFrame
+        of days by hours, blank where there was no usage.
+        '''
+        sums, counts = self._get_cells(warehouse_name)
+        averages = np.divide(sums, counts, out=np.full((7, 24), np.nan), where=counts > 0)
+        return pd.DataFrame(averages.round(3), index=DAY_LABELS, columns=HOUR_LABELS)
+
+    def get_active_fractions(self, warehouse_name, credit_rate):
+        '''
+        Returns the share of each day and hour the warehouse ran, as a
+        (7, 24) array, estimated from its average credits at credit_rate
+        credits per hour. Hours without usage are 0.
+        '''
+        sums, counts = self._get_cells(warehouse_name)
+        averages = np.divide(sums, counts, out=np.zeros((7, 24)), where=counts > 0)
+        return np.clip(averages / credit_rate, 0, 1)
+
+    def get_total_credits(self, warehouse_name=''):
+        return float(self._get_cells(warehouse_name)[0].sum())
+
+    def get_rows(self, warehouse_name):
+        '''
+        Returns the store rows of one warehouse.
+        '''
+        index = self.warehouse_index.get(warehouse_name)
+        if index is None:
+            return self.usage_df.iloc[0:0]
+        if self.row_starts is None:
+            return self.usage_df[self.usage_df['WAREHOUSE_NAME'] == warehouse_name]
+        return self.usage_df.iloc[self.row_starts[index]:self.row_starts[index + 1]]
+
+def get_cube(usage_df, local_timezone=constants.DEFAULT_TIMEZONE):
+    '''
+    Returns the cube of a usage store DataFrame, building it only the
+    first time this DataFrame is seen in the timezone. usage_store keeps
+    returning the same DataFrame until the store changes, so every
+    session shares one cube per version. Cached cubes hold on to their
+    DataFrame so the id used as the cache key can't be reused.
+    '''
+    key = (id(usage_df), local_timezone)
+    with _cubes_lock:
+        if key in _cubes:
+            _cubes.move_to_end(key)
+            return _cubes[key]
+
+    cube = UsageCube(usage_df, local_timezone)
+    with _cubes_lock:
+        _cubes[key] = cube
+        while len(_cubes) > CUBE_CACHE_SIZE:
+            _cubes.popitem(last=False)
+    return cube
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,38 @@
+import pandas as pd
+import constants
+
+def get_usage_aggregates(aggregate_df, warehouse_name=''):
+    '''
+    Takes the result of constants.USAGE_AGGREGATE_SQL as a DataFrame and
+    returns two DataFrames for the usage charts: average credits by day
+    of week (START_DAY_NAME, CREDITS_USED) and by hour of day
+    (START_HOUR, CREDITS_USED). If warehouse_name is blank, account-wide
+    averages are returned.
+    '''
+    if warehouse_name == '':
+        warehouse_name = constants.ACCOUNT_USAGE_KEY
+    if aggregate_df is None or aggregate_df.empty:
+        return pd.DataFrame(columns=['START_DAY_NAME', 'CREDITS_USED']), pd.DataFrame(columns=['START_HOUR', 'CREDITS_USED'])
+
+    aggregate_df = aggregate_df[aggregate_df['WAREHOUSE_NAME'] == warehouse_name]
+    is_by_day = aggregate_df['AGGREGATE_BY'] == 'day'
+    by_day_df = aggregate_df.loc[is_by_day, ['AGGREGATE_KEY', 'CREDITS_USED']].rename(columns={'AGGREGATE_KEY': 'START_DAY_NAME'})
+    by_hour_df = aggregate_df.loc[~is_by_day, ['AGGREGATE_KEY', 'CREDITS_USED']].rename(columns={'AGGREGATE_KEY': 'START_HOUR'})
+    return by_day_df.sort_values('START_DAY_NAME').reset_index(drop=True), by_hour_df.sort_values('START_HOUR').reset_index(drop=True)
+
+def get_chargeback_summary(chargeback_df):
+    '''
+    Takes the result of sql_builder.get_chargeback_sql as a DataFrame and
+    returns the total credits and share of each tag value (TAG_VALUE,
+    CREDITS_USED, SHARE), largest first, and the daily credits as a
+    DataFrame of days by tag values for charting.
+    '''
+    by_value_df = chargeback_df.groupby('TAG_VALUE', as_index=False)['CREDITS_USED'].sum()
+    by_value_df = by_value_df.sort_values('CREDITS_USED', ascending=False).reset_index(drop=True)
+    total_credits = by_value_df['CREDITS_USED'].sum()
+    by_value_df['SHARE'] = (by_value_df['CREDITS_USED'] / total_credits if total_credits else 0.0)
+    by_day_df = chargeback_df.pivot_table(index='USAGE_DATE', columns='TAG_VALUE', values='CREDITS_USED', aggfunc='sum', fill_value=0.0)
+    return by_value_df, by_day_df.sort_index()
+
+if __name__ == '__main__':
+    pass
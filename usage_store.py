@@ -0,0 +1,116 @@
+'''
+Local, incremental store of hourly warehouse metering history. Each
+account gets one Parquet file holding the trailing usage window. On
+refresh only rows at or after the high-water mark (the latest
+start_time already stored, minus a late-arrival overlap) are fetched
+from Snowflake, merged in, and rows older than the window are pruned.
+'''
+import os, re, threading
+from datetime import datetime, timedelta, timezone
+from time import time
+import pandas as pd
+import constants
+
+STORE_COLUMNS = ['WAREHOUSE_NAME', 'START_TIME', 'CREDITS_USED']
+
+_store_locks = {}
+_store_locks_lock = threading.Lock()
+_loaded_stores = {}
+
+def get_store_path(account, store_dir=constants.USAGE_STORE_DIR):
+    safe_account = re.sub('[^A-Za-z0-9_.-]', '_', account.lower())
+    return os.path.join(store_dir, safe_account + '.parquet')
+
+def _get_lock(path):
+    with _store_locks_lock:
+        if path not in _store_locks:
+            _store_locks[path] = threading.Lock()
+        return _store_locks[path]
+
+def load_usage(account, store_dir=constants.USAGE_STORE_DIR):
+    '''
+    Returns the stored usage for an account as a DataFrame with
+    STORE_COLUMNS, START_TIME in UTC. Reads from disk only when the
+    file has changed since it was last loaded in this process.
+    '''
+    path = get_store_path(account, store_dir)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=STORE_COLUMNS)
+
+    modified = os.path.getmtime(path)
+    loaded = _loaded_stores.get(path)
+    if loaded and loaded[0] == modified:
+        return loaded[1]
+
+    usage_df = pd.read_parquet(path)
+    _loaded_stores[path] = (modified, usage_df)
+    return usage_df
+
+def get_high_water_mark(usage_df):
+    if usage_df.empty:
+        return None
+    return usage_df['START_TIME'].max().to_pydatetime()
+
+def build_refresh_sql(high_water_mark, now=None):
+    '''
+    Returns the metering history query for rows that are new since the
+    high-water mark. Recent hours are re-read because account_usage
+    can revise them after they first appear.
+    '''
+    now = now or datetime.now(timezone.utc)
+    window_start = now - timedelta(days=constants.USAGE_STORE_WINDOW_DAYS)
+    fetch_from = window_start
+    if high_water_mark and high_water_mark - timedelta(hours=constants.USAGE_STORE_LATE_ARRIVAL_HOURS) > window_start:
+        fetch_from = high_water_mark - timedelta(hours=constants.USAGE_STORE_LATE_ARRIVAL_HOURS)
+
+    fetch_from_str = fetch_from.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S +00:00')
+    return constants.USAGE_INCREMENTAL_SQL + " where start_time >= to_timestamp_tz('" + fetch_from_str + "', 'YYYY-MM-DD HH24:MI:SS TZH:TZM')"
+
+def merge_usage(usage_df, new_df, now=None):
+    '''
+    Merges newly fetched usage (a DataFrame with the columns of
+    USAGE_INCREMENTAL_SQL, in order) into the stored usage, keeping the
+    latest value for each warehouse and hour, and prunes rows that have
+    aged out of the window.
+    '''
+    now = now or datetime.now(timezone.utc)
+    if new_df is None or new_df.empty:
+        new_df = pd.DataFrame(columns=STORE_COLUMNS)
+    new_df = new_df.set_axis(STORE_COLUMNS, axis=1)
+    new_df['START_TIME'] = pd.to_datetime(new_df['START_TIME'], utc=True)
+    new_df['CREDITS_USED'] = new_df['CREDITS_USED'].astype(float)
+
+    if usage_df.empty:
+        usage_df = new_df
+    elif not new_df.empty:
+        usage_df = pd.concat([usage_df, new_df], ignore_index=True)
+    usage_df = usage_df.drop_duplicates(subset=['WAREHOUSE_NAME', 'START_TIME'], keep='last')
+    usage_df = usage_df[usage_df['START_TIME'] >= pd.Timestamp(now - timedelta(days=constants.USAGE_STORE_WINDOW_DAYS))]
+    return usage_df.sort_values(['WAREHOUSE_NAME', 'START_TIME']).reset_index(drop=True)
+
+def refresh_usage(account, fetch_sql, store_dir=constants.USAGE_STORE_DIR, max_age_seconds=constants.DISK_CACHE_MAX_AGE_SECONDS):
+    '''
+    Brings the account's store up to date and returns it. fetch_sql is
+    any callable that takes a sql string and returns the result as a
+    DataFrame, e.g. streamed with result_stream.fetch_frame.
+    Nothing is fetched if the store was refreshed within max_age_seconds.
+    '''
+    path = get_store_path(account, store_dir)
+    with _get_lock(path):
+        if os.path.exists(path) and time() - os.path.getmtime(path) < max_age_seconds:
+            return load_usage(account, store_dir)
+
+        usage_df = load_usage(account, store_dir)
+        new_df = fetch_sql(build_refresh_sql(get_high_water_mark(usage_df)))
+        usage_df = merge_usage(usage_df, new_df)
+
+        # Write to a temp file first so readers never see a partial file.
+        os.makedirs(store_dir, exist_ok=True)
+        temp_path = path + '.tmp'
+        usage_df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+        _loaded_stores[path] = (os.path.getmtime(path), usage_df)
+        return usage_df
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,249 @@
+'''
+Compact, indexed catalog of the warehouses in an account. Each
+warehouse is a slotted WarehouseRecord, and the catalog keeps indexes
+by name, assistant enabled flag, size, owner and state, plus the
+warehouse select lists for each "Assistant Enabled" filter, so lookups
+and filtering don't walk every warehouse. Name searches use a trigram
+index, built the first time the catalog is searched.
+
+Catalogs are built once per data version: the warehouse and tag rows
+come from the result cache, where a re-fetch or a patch produces new
+row lists, so the identity of those lists tells when to rebuild.
+'''
+import threading
+from collections import OrderedDict
+import constants, tag_inventory
+
+# Catalogs kept for reuse, e.g. for a few accounts at once.
+CATALOG_CACHE_SIZE = 8
+
+# "Assistant Enabled" filter settings and the flag they select.
+ASSISTANT_ENABLED_SETTINGS = {'All': None, 'Yes': 'y', 'No': 'n'}
+
+INDEXED_FIELDS = ['assist_enabled', 'size', 'owner', 'state']
+
+# Searches shorter than this scan the names instead of using the trigram index.
+TRIGRAM_LENGTH = 3
+
+_catalogs = OrderedDict()
+_catalogs_lock = threading.Lock()
+
+class WarehouseRecord():
+    '''
+    One warehouse, built from a row of `show warehouses` and its entry
+    in the tag inventory (see tag_inventory.get_tag_inventory).
+    '''
+    __slots__ = ('name', 'assist_enabled', 'tag_assignments', 'state', 'type', 'size', 'auto_suspend'
+                ,'auto_resume', 'owner', 'comment', 'scaling_policy', 'min_cluster_count', 'max_cluster_count'
+                ,'started_clusters', 'running', 'query_acceleration_enabled', 'query_acceleration_max_scale_factor')
+
+    def __init__(self, row, wh_tags):
+        self.name = row['name']
+        self.assist_enabled = wh_tags.get('assist_enabled', 'n')
+        self.tag_assignments = wh_tags.get('tag_assignments', {})
+        self.state = row['state']
+        self.type = row['type']
+        self.size = row['size']
+        self.auto_suspend = row['auto_suspend']
+        self.auto_resume = row['auto_resume']
+        self.owner = row['owner']
+        self.comment = row['comment'][:constants.COMMENT_MAX_LENGTH]
+        self.scaling_policy = row['scaling_policy']
+        self.min_cluster_count = row['min_cluster_count']
+        self.max_cluster_count = row['max_cluster_count']
+        self.started_clusters = row['started_clusters']
+        self.running = row['running']
+        self.query_acceleration_enabled = row['enable_query_acceleration']
+        self.query_acceleration_max_scale_factor = row['query_acceleration_max_scale_factor']
+
+    def get_properties(self):
+        '''
+        Current values of the properties that can be altered, keyed like
+        sql_builder.WAREHOUSE_PROPERTIES, see warehouse_plan.diff_settings.
+        '''
+        return {
+            'warehouse_size': self.size,
+            'auto_suspend': self.auto_suspend,
+            'auto_resume': self.auto_resume,
+            'comment': self.comment,
+            'scaling_policy': self.scaling_policy,
+            'min_cluster_count': self.min_cluster_count,
+            'max_cluster_count': self.max_cluster_count,
+            'enable_query_acceleration': self.query_acceleration_enabled,
+            'query_acceleration_max_scale_factor': self.query_acceleration_max_scale_factor
+            }
+
+    def as_dict(self):
+        '''
+        Nested dict of the record, for display.
+        '''
+        return {
+            'name': self.name,
+            'assist_enabled': self.assist_enabled,
+            'tag_assignments': self.tag_assignments,
+            'state': self.state,
+            'type': self.type,
+            'size': self.size,
+            'auto_suspend': self.auto_suspend,
+            'auto_resume': self.auto_resume,
+            'owner': self.owner,
+            'comment': self.comment,
+            'clustering': {
+                'scaling_policy': self.scaling_policy,
+                'min': self.min_cluster_count,
+                'max': self.max_cluster_count,
+                'started': self.started_clusters,
+                'running': self.running
+                },
+            'query_acceleration': {
+                'enabled': self.query_acceleration_enabled,
+                'max_scale_factor': self.query_acceleration_max_scale_factor
+                }
+            }
+
+class WarehouseCatalog():
+    '''
+    wh_tag_inventory is the tag inventory of every warehouse, see
+    tag_inventory.get_tag_inventory. Tag changes made in the app are
+    patched into the cached inventory rows, so they show up here.
+    '''
+    def __init__(self, warehouse_rows, wh_tag_inventory):
+        # name -> record, in the order of `show warehouses`
+        self.records = {}
+        # name -> position in records, to keep search results in order
+        self.positions = {}
+        # trigram of the lower case name -> set of names, see search()
+        self.trigrams = None
+        self.trigrams_lock = threading.Lock()
+        # field -> value -> list of names
+        self.indexes = dict((field, {}) for field in INDEXED_FIELDS)
+        for row in warehouse_rows or []:
+            record = WarehouseRecord(row, wh_tag_inventory.get(row['name'], {}))
+            self.positions[record.name] = len(self.records)
+            self.records[record.name] = record
+            for field in INDEXED_FIELDS:
+                self.indexes[field].setdefault(getattr(record, field), []).append(record.name)
+
+        self.names = list(self.records.keys())
+
+        # Select box options for each "Assistant Enabled" setting, starting with a blank entry.
+        self.warehouse_lists = {}
+        for setting, assist_enabled in ASSISTANT_ENABLED_SETTINGS.items():
+            if assist_enabled is None:
+                self.warehouse_lists[setting] = [''] + self.names
+            else:
+                self.warehouse_lists[setting] = [''] + self.indexes['assist_enabled'].get(assist_enabled, [])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def get(self, name):
+        return self.records.get(name)
+
+    def find(self, **criteria):
+        '''
+        Returns the names of warehouses matching every field = value in
+        criteria, e.g. find(size='Large', state='STARTED'). Indexed fields
+        are looked up, starting from the smallest match.
+        '''
+        indexed_fields = [field for field in criteria.keys() if field in self.indexes]
+        if indexed_fields:
+            start_field = min(indexed_fields, key=lambda field: len(self.indexes[field].get(criteria[field], [])))
+            names = self.indexes[start_field].get(criteria[start_field], [])
+        else:
+            names = self.records.keys()
+        return [name for name in names if all(getattr(self.records[name], field) == value for field, value in criteria.items())]
+
+    def get_values(self, field):
+        '''
+        Returns the distinct values of an indexed field, e.g. for a filter.
+        '''
+        return sorted(value for value in self.indexes[field].keys() if value is not None)
+
+    def _get_trigrams(self):
+        with self.trigrams_lock:
+            if self.trigrams is None:
+                trigrams = {}
+                for name in self.records.keys():
+                    name_lower = name.lower()
+                    for i in range(len(name_lower) - TRIGRAM_LENGTH + 1):
+                        trigrams.setdefault(name_lower[i:i + TRIGRAM_LENGTH], set()).add(name)
+                self.trigrams = trigrams
+            return self.trigrams
+
+    def _match_text(self, text):
+        if len(text) < TRIGRAM_LENGTH:
+            return [name for name in self.records.keys() if text in name.lower()]
+
+        # Names containing every trigram of the text, then checked for the text itself.
+        trigrams = self._get_trigrams()
+        candidates = None
+        for i in range(len(text) - TRIGRAM_LENGTH + 1):
+            names = trigrams.get(text[i:i + TRIGRAM_LENGTH], set())
+            candidates = names if candidates is None else candidates & names
+            if not candidates:
+                return []
+        return sorted((name for name in candidates if text in name.lower()), key=self.positions.get)
+
+    def search(self, text='', offset=0, limit=None, **criteria):
+        '''
+        Returns (names, total): one page of the warehouses whose name
+        contains text (case insensitive) and that match every field =
+        value in criteria (see find), and the number of matches in total.
+        '''
+        text = text.strip().lower()
+        if text:
+            names = self._match_text(text)
+            if criteria:
+                names = [name for name in names if all(getattr(self.records[name], field) == value for field, value in criteria.items())]
+        elif criteria:
+            names = self.find(**criteria)
+        else:
+            names = self.names
+        end = offset + limit if limit is not None else None
+        return names[offset:end], len(names)
+
+    def get_warehouse_list(self, assistant_enabled_setting):
+        '''
+        Returns the warehouse names for select boxes, filtered by the
+        "Assistant Enabled" setting ('All', 'Yes' or 'No'). The list is
+        shared, so don't modify it.
+        '''
+        return self.warehouse_lists[assistant_enabled_setting]
+
+def get_catalog(warehouse_rows, tag_rows):
+    '''
+    Returns the catalog for the rows of `show warehouses` and of
+    constants.WAREHOUSE_TAG_INVENTORY_SQL, building it only the first
+    time these row lists are seen. Cached catalogs hold on to their rows
+    so the ids used as the cache key can't be reused.
+    '''
+    key = (id(warehouse_rows), id(tag_rows))
+    with _catalogs_lock:
+        if key in _catalogs:
+            _catalogs.move_to_end(key)
+            return _catalogs[key]['catalog']
+
+    catalog = WarehouseCatalog(warehouse_rows, tag_inventory.get_tag_inventory(tag_rows))
+    with _catalogs_lock:
+        _catalogs[key] = {'catalog': catalog, 'rows': (warehouse_rows, tag_rows)}
+        while len(_catalogs) > CATALOG_CACHE_SIZE:
+            _catalogs.popitem(last=False)
+    return catalog
+
+def load_catalog(run_sql):
+    '''
+    Fetches the warehouse list and the tag inventory for every
+    warehouse in two statements, regardless of how many warehouses
+    exist, and returns the catalog. run_sql is any callable that takes
+    a sql string and returns a list of rows.
+    '''
+    warehouse_rows = run_sql('show warehouses')
+    tag_rows = run_sql(constants.WAREHOUSE_TAG_INVENTORY_SQL)
+    return WarehouseCatalog(warehouse_rows, tag_inventory.get_tag_inventory(tag_rows))
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,351 @@
+'''
+Declarative plans for the headless CLI (tagging_cli.py). A spec lists
+the desired settings, assistant tags and resize schedules of any
+number of warehouses:
+
+{
+    "timezone": "America/Los_Angeles",
+    "warehouses": {
+        "COMPUTE_WH": {
+            "settings": {"warehouse_size": "Small", "auto_suspend": 60},
+            "assistant_enabled": true,
+            "tags": {"DEPARTMENT": "Accounting", "OLD_TAG": null},
+            "schedules": [{"size": "Large", "cron": "0 8 * * 1-5"}]
+        }
+    }
+}
+
+Only what a warehouse entry lists is managed: a missing "schedules"
+key leaves the schedules alone, an empty list removes them all. A tag
+value of null unsets the tag.
+
+The current state of every warehouse is fetched with two statements
+(see load_state), whatever the number of warehouses, and the plan only
+holds the properties and schedules that differ from it. Every tag the
+spec lists is set: the tag inventory lags behind the account, and
+setting a tag to the value it already has changes nothing.
+'''
+import re, json
+import constants, sql_builder, cron_timeline
+
+WAREHOUSE_SPEC_KEYS = ['settings', 'assistant_enabled', 'tags', 'schedules']
+
+# Column of `show warehouses` holding the current value of each property.
+WAREHOUSE_PROPERTY_COLUMNS = {
+    'warehouse_size': 'size',
+    'auto_suspend': 'auto_suspend',
+    'auto_resume': 'auto_resume',
+    'comment': 'comment',
+    'scaling_policy': 'scaling_policy',
+    'min_cluster_count': 'min_cluster_count',
+    'max_cluster_count': 'max_cluster_count',
+    'enable_query_acceleration': 'enable_query_acceleration',
+    'query_acceleration_max_scale_factor': 'query_acceleration_max_scale_factor'
+    }
+
+BOOLEAN_PROPERTIES = ['auto_resume', 'enable_query_acceleration']
+
+INTEGER_PROPERTIES = ['auto_suspend', 'min_cluster_count', 'max_cluster_count', 'query_acceleration_max_scale_factor']
+
+TASK_NAME_PATTERN = '^resize_(.+)_schedule_(\\d+)$'
+
+def is_true(value):
+    return str(value).lower() in ('true', 'y', 'yes', '1')
+
+def is_size(value):
+    return value in constants.WAREHOUSE_SIZES or str(value).lower() in constants.WAREHOUSE_CODE_INDEX
+
+def normalize_property(property_name, value):
+    '''
+    Returns a property value in a form that compares equal whether it
+    comes from a spec or from `show warehouses`, e.g. 'X-Small' and
+    'xsmall', or True and 'true'.
+    '''
+    if property_name == 'warehouse_size':
+        return sql_builder.get_size_code(value)
+    elif property_name in BOOLEAN_PROPERTIES:
+        return is_true(value)
+    elif property_name in INTEGER_PROPERTIES:
+        # An auto_suspend of null means never, the same as 0.
+        return int(value or 0)
+    elif property_name == 'scaling_policy':
+        return str(value).upper()
+    return '' if value is None else str(value)
+
+def get_row_properties(warehouse_row):
+    '''
+    Returns the current properties of a warehouse from its row of
+    `show warehouses`, keyed like sql_builder.WAREHOUSE_PROPERTIES.
+    '''
+    return dict((property_name, warehouse_row[column]) for property_name, column in WAREHOUSE_PROPERTY_COLUMNS.items())
+
+def diff_settings(current_properties, settings):
+    '''
+    Returns the properties in settings whose value differs from
+    current_properties (see get_row_properties), normalized. Only
+    these need to be altered: setting a property to its current value
+    can still resize or restart a busy warehouse.
+    '''
+    changes = {}
+    for property_name, value in settings.items():
+        if property_name not in WAREHOUSE_PROPERTY_COLUMNS:
+            raise ValueError('Unknown warehouse property: ' + property_name)
+        desired = normalize_property(property_name, value)
+        if desired != normalize_property(property_name, current_properties.get(property_name)):
+            changes[property_name] = desired
+    return changes
+
+def get_row_changes(changes):
+    '''
+    Returns changes from diff_settings as `show warehouses` column
+    values, e.g. for tag_inventory.patch_many_warehouse_rows.
+    '''
+    row_changes = {}
+    for property_name, value in changes.items():
+        if property_name == 'warehouse_size':
+            value = constants.WAREHOUSE_SIZE_BY_CODE[value]
+        elif property_name in BOOLEAN_PROPERTIES:
+            value = str(value).lower()
+        row_changes[WAREHOUSE_PROPERTY_COLUMNS[property_name]] = value
+    return row_changes
+
+def get_tag_changes(assistant_enabled, tags):
+    '''
+    Returns the tag values to set, or None to unset, for every tag in
+    the spec, including the assistant enabled tag if given.
+    '''
+    changes = {}
+    if assistant_enabled is not None:
+        changes['tag_assistant_enabled'] = 'y' if is_true(assistant_enabled) else 'n'
+    for tag_name, value in (tags or {}).items():
+        if not re.match('^[A-Za-z_][A-Za-z0-9_$]*$', tag_name):
+            raise ValueError('Invalid tag name: ' + tag_name)
+        changes[tag_name] = None if value is None else str(value)
+    return changes
+
+def get_current_schedules(schedule_rows):
+    '''
+    Takes rows shaped like `show tasks` (see
+    sql_builder.get_schedule_tasks_sql) and returns a dict of lower case
+    warehouse name -> list of {index, size, cron, tz, state}, by index.
+    '''
+    current_schedules = {}
+    for row in schedule_rows or []:
+        name_match = re.match(TASK_NAME_PATTERN, row['name'].lower())
+        if not name_match:
+            continue
+        current_schedules.setdefault(name_match.group(1), []).append({
+            'index': int(name_match.group(2)),
+            'size': re.sub('.*= ', '', row['definition']).strip().lower(),
+            'cron': re.sub(' \\S*$', '', row['schedule']).replace('USING CRON ', ''),
+            'tz': re.sub('.* ', '', row['schedule']),
+            'state': row['state']
+            })
+    for schedules in current_schedules.values():
+        schedules.sort(key=lambda schedule: schedule['index'])
+    return current_schedules
+
+def normalize_schedules(schedules, default_tz):
+    '''
+    Returns the spec's schedules as the list the save procedures take,
+    numbered from 1 in the order given.
+    '''
+    if len(schedules) > constants.MAX_SCHEDULE_COUNT:
+        raise ValueError('At most ' + str(constants.MAX_SCHEDULE_COUNT) + ' schedules are allowed per warehouse')
+    normalized = []
+    for i, schedule in enumerate(schedules):
+        cron = ' '.join(str(schedule['cron']).split())
+        if len(cron.split(' ')) != 5:
+            raise ValueError('Invalid CRON schedule: ' + str(schedule['cron']))
+        if constants.SCHEDULING_ENGINE == 'dispatcher':
+            sql_builder.check_dispatcher_cron(cron)
+        normalized.append({
+            'index': i + 1,
+            'size': sql_builder.get_size_code(schedule['size']),
+            'cron': cron,
+            'tz': schedule.get('tz') or default_tz
+            })
+    return normalized
+
+def schedules_match(current, desired):
+    '''
+    True if the current schedules are the desired ones and all started,
+    so saving them again would change nothing.
+    '''
+    if len(current) != len(desired):
+        return False
+    for current_schedule, desired_schedule in zip(current, desired):
+        if current_schedule['state'] != 'started':
+            return False
+        for key in ['index', 'size', 'cron', 'tz']:
+            if current_schedule[key] != desired_schedule[key]:
+                return False
+    return True
+
+def load_state(run_sql):
+    '''
+    Fetches the warehouses and every warehouse's schedules in two
+    statements. run_sql is any callable that takes a sql string and
+    returns a list of rows.
+    '''
+    warehouse_rows = run_sql('show warehouses')
+    schedule_rows = run_sql(sql_builder.get_schedule_tasks_sql())
+    return warehouse_rows, schedule_rows
+
+def build_plan(spec, warehouse_rows, schedule_rows):
+    '''
+    Returns the plan for a spec against the current state, as
+    {'warehouses': {name: {'settings', 'tags', 'schedules'}}, 'errors': [...],
+    'warnings': [...]}. Only warehouses with changes are listed. 'schedules'
+    is None unless the warehouse's schedules are to be saved. Warnings list
+    desired schedules that conflict or never change the size over the next
+    week (see cron_timeline.py), they don't stop the plan being applied.
+    '''
+    default_tz = spec.get('timezone', constants.DEFAULT_TIMEZONE)
+    rows_by_name = dict((row['name'], row) for row in warehouse_rows or [])
+    current_schedules = get_current_schedules(schedule_rows)
+
+    plan = {'warehouses': {}, 'errors': [], 'warnings': []}
+    # Only worked out if a warehouse has schedules, which loads pandas for the timezone conversions.
+    week_start = None
+    for warehouse_name, wh_spec in (spec.get('warehouses') or {}).items():
+        # Unquoted identifiers are stored in upper case.
+        if warehouse_name not in rows_by_name and warehouse_name.upper() in rows_by_name:
+            warehouse_name = warehouse_name.upper()
+        if warehouse_name not in rows_by_name:
+            plan['errors'].append(warehouse_name + ': warehouse does not exist or is not visible to this role')
+            continue
+        unknown_keys = [key for key in (wh_spec or {}).keys() if key not in WAREHOUSE_SPEC_KEYS]
+        if unknown_keys:
+            plan['errors'].append(warehouse_name + ': unknown keys ' + ', '.join(unknown_keys))
+            continue
+
+        wh_spec = wh_spec or {}
+        try:
+            changes = {
+                'settings': diff_settings(get_row_properties(rows_by_name[warehouse_name]), wh_spec.get('settings') or {}),
+                'tags': get_tag_changes(wh_spec.get('assistant_enabled'), wh_spec.get('tags')),
+                'schedules': None
+                }
+            if 'schedules' in wh_spec:
+                desired = normalize_schedules(wh_spec['schedules'] or [], default_tz)
+                if week_start is None:
+                    week_start = cron_timeline.get_week_start(default_tz)
+                initial_size = (wh_spec.get('settings') or {}).get('warehouse_size') or rows_by_name[warehouse_name]['size']
+                schedule_timeline = cron_timeline.ScheduleTimeline(desired, week_start, cron_timeline.WEEK_MINUTES, initial_size if is_size(initial_size) else None)
+                plan['warnings'].extend(warehouse_name + ': ' + warning for warning in schedule_timeline.get_warnings(default_tz))
+                if not schedules_match(current_schedules.get(warehouse_name.lower(), []), desired):
+                    changes['schedules'] = desired
+        except (ValueError, KeyError) as err:
+            plan['errors'].append(warehouse_name + ': ' + str(err))
+            continue
+
+        if changes['settings'] or changes['tags'] or changes['schedules'] is not None:
+            plan['warehouses'][warehouse_name] = changes
+    return plan
+
+def get_schedule_errors(result):
+    '''
+    Returns the errors reported by a save schedules procedure (see
+    sql_builder.get_save_schedules_sql), one per failed schedule.
+    '''
+    errors = []
+    if 'error' in result:
+        errors.append(result['error'])
+    for idx, schedule_result in result.get('schedules', {}).items():
+        for step in ['create', 'grant', 'resume']:
+            if schedule_result.get('result') == 'ERROR' or (step in schedule_result and 'success' not in str(schedule_result[step]['result']).lower()):
+                errors.append('schedule ' + str(idx) + ': ' + json.dumps(schedule_result))
+                break
+    for task_name, drop_result in result.get('dropped', {}).items():
+        if 'success' not in str(drop_result['result']).lower():
+            errors.append(task_name + ': ' + json.dumps(drop_result))
+    return errors
+
+def get_tag_errors(result, warehouse_names):
+    '''
+    Returns {warehouse name: error} for the warehouses the bulk tagging
+    procedure (see sql_builder.get_set_tags_calls) failed to tag.
+    Warehouses of the call missing from the result are reported too.
+    '''
+    errors = {}
+    warehouse_results = result.get('warehouses', {})
+    for warehouse_name in warehouse_names:
+        warehouse_result = warehouse_results.get(warehouse_name)
+        if warehouse_result is None:
+            errors[warehouse_name] = 'no result'
+        elif 'success' not in str(warehouse_result.get('result')).lower():
+            errors[warehouse_name] = str(warehouse_result.get('message', json.dumps(warehouse_result)))
+    return errors
+
+def get_many_schedule_errors(result, warehouse_names):
+    '''
+    Returns {warehouse name: [errors]} for the warehouses the bulk
+    schedules procedure (see sql_builder.get_save_schedules_calls) failed
+    to save, see get_schedule_errors. Warehouses of the call missing from
+    the result are reported too.
+    '''
+    errors = {}
+    if 'error' in result:
+        return dict((warehouse_name, [result['error']]) for warehouse_name in warehouse_names)
+    warehouse_results = result.get('warehouses', {})
+    for warehouse_name in warehouse_names:
+        if warehouse_name not in warehouse_results:
+            errors[warehouse_name] = ['no result']
+            continue
+        warehouse_errors = get_schedule_errors(warehouse_results[warehouse_name])
+        if warehouse_errors:
+            errors[warehouse_name] = warehouse_errors
+    return errors
+
+def run_statements(run_sql, statements):
+    '''
+    Runs statements in execute immediate batches (see
+    sql_builder.get_batch_sql). Returns (done, failed): the statements
+    that ran, and a (statement, error) pair for each one that failed.
+    '''
+    done = []
+    failed = []
+    for batch_sql, batch_statements in sql_builder.get_batch_sql(statements):
+        try:
+            run_sql(batch_sql)
+            done.extend(batch_statements)
+        except Exception as err:
+            if len(batch_statements) == 1:
+                failed.append((batch_statements[0], str(err)))
+                continue
+            # A block stops at its first error without saying which statement failed, so 
+            # run the batch one statement at a time. Setting a property or tag to its value again changes nothing.
+            for statement in batch_statements:
+                try:
+                    run_sql(statement)
+                    done.append(statement)
+                except Exception as err:
+                    failed.append((statement, str(err)))
+    return done, failed
+
+def get_plan_statements(plan):
+    '''
+    Returns (statements, statement_names, schedule_calls): the alter
+    warehouse statements of the plan, settings before tags, the
+    warehouse name of each statement, and the bulk calls (see
+    sql_builder.get_save_schedules_calls) that save the schedules of the
+    warehouses whose schedules changed.
+    '''
+    statements = []
+    statement_names = {}
+    schedule_changes = {}
+    for warehouse_name, changes in plan['warehouses'].items():
+        warehouse_statements = sql_builder.get_set_tags_sql(warehouse_name, changes['tags'])
+        alter_sql = sql_builder.get_alter_warehouse_sql(warehouse_name, changes['settings'])
+        if alter_sql:
+            warehouse_statements.insert(0, alter_sql)
+        for statement in warehouse_statements:
+            statements.append(statement)
+            statement_names[statement] = warehouse_name
+        if changes['schedules'] is not None:
+            schedule_changes[warehouse_name] = changes['schedules']
+    return statements, statement_names, sql_builder.get_save_schedules_calls(schedule_changes)
+
+if __name__ == '__main__':
+    pass
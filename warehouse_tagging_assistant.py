@@ -1,9 +1,14 @@
 import streamlit as st
-import snowflake.snowpark as sp
 import pandas as pd
 import cron_descriptor as cd
-import constants, utility, re, json
-from time import sleep
+import constants, utility, tag_inventory, session_backend, query_log, query_scheduler, usage_stats, usage_store, usage_cube, cron_timeline, tag_value_index, session_pool, result_cache, warehouse_catalog, warehouse_plan, sql_builder, suspend_simulator, sizing_advisor, result_stream, re, json, os, uuid, threading
+from time import sleep, time
+from contextlib import contextmanager
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    # Streamlit versions before 1.12
+    from streamlit.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 change_log = '''
 1.1.0 - 2022-09-19 
@@ -31,7 +36,8 @@ def create_session(creds):
         'warehouse': 'wh_name',
     }
     'role' and 'warehouse' are optional. Defaults will be 
-    provided in the constants.py file.
+    provided in the constants.py file. The session backend is 
+    chosen in session_backend.py.
     '''
     if 'url' in creds and 'user' in creds and ('pass' in creds or 'password' in creds):
         # Create a session and return it.
@@ -56,26 +62,435 @@ def create_session(creds):
             connection_params['warehouse'] = constants.DEFAULT_WAREHOUSE
 
         with st.spinner('Connecting...'):
-            use_session = sp.Session.builder.configs(connection_params).create()
+            # Reuses an idle pooled session for the same credentials if there is one. Only the session is kept.
+            st.session_state['pool_key'], pooled_session = get_session_pool().connect(connection_params, get_pool_owner())
             st.success('Connected!')
-        return use_session
+        return pooled_session
     return False
 
-@st.experimental_memo(persist='disk', ttl=constants.DISK_CACHE_MAX_AGE_SECONDS)
-def cache_large_sql(sql, account):
-    # Adding account as an input so that it is cached separately for each account.
+@st.experimental_singleton
+def get_session_pool():
+    '''
+    Returns the session pool shared by every browser session in this process.
+    '''
+    return session_pool.SessionPool(session_backend.create_backend_session)
+
+def get_pool_owner():
+    '''
+    Returns the id under which this browser session leases pooled sessions.
+    '''
+    if 'pool_owner' not in st.session_state:
+        st.session_state['pool_owner'] = str(uuid.uuid4())
+    return st.session_state['pool_owner']
+
+def release_session():
+    '''
+    Returns this browser session's Snowflake session to the pool.
+    '''
+    get_session_pool().release(get_pool_owner())
     if 'main_session' in st.session_state:
-        return st.session_state['main_session'].sql(sql).collect()
-    else:
-        return None
+        del st.session_state['main_session']
 
-@st.experimental_memo(persist=None, ttl=constants.MEMORY_CACHE_MAX_AGE_SECONDS, show_spinner=False)
-def cache_small_sql(sql, account):
-    # Adding account as an input so that it is cached separately for each account.
+def disconnect_session():
+    '''
+    Closes this browser session's Snowflake session and the idle pooled 
+    sessions of the same credentials, which must then be given again.
+    '''
+    if 'pool_key' in st.session_state:
+        get_session_pool().disconnect(st.session_state.pop('pool_key'), get_pool_owner())
     if 'main_session' in st.session_state:
-        return st.session_state['main_session'].sql(sql).collect()
-    else:
+        del st.session_state['main_session']
+
+def get_query_log():
+    '''
+    Returns the query log for this browser session, creating it if needed.
+    '''
+    if 'query_log' not in st.session_state:
+        st.session_state['query_log'] = query_log.QueryLog()
+    return st.session_state['query_log']
+
+# The pooled session leased by a query scheduler worker for its current job.
+_worker_state = threading.local()
+_session_lock_guard = threading.Lock()
+
+def get_session_lock():
+    '''
+    Returns the lock that keeps this browser session's main session to 
+    one query at a time, as Snowpark sessions are not thread safe.
+    '''
+    with _session_lock_guard:
+        if 'session_lock' not in st.session_state:
+            st.session_state['session_lock'] = threading.RLock()
+        return st.session_state['session_lock']
+
+@contextmanager
+def use_session():
+    ''' 
+    Yields the session to query with: the worker's own pooled session in 
+    a query scheduler job that got one, otherwise the main session, held 
+    under the session lock.
+    '''
+    worker_session = getattr(_worker_state, 'session', None)
+    if worker_session is not None:
+        get_session_pool().heartbeat(get_worker_owner())
+        yield worker_session
+        return
+    with get_session_lock():
+        # Keeps a long rerun's lease from being taken for abandoned.
+        get_session_pool().heartbeat(get_pool_owner())
+        yield st.session_state['main_session']
+
+def get_worker_owner():
+    return get_pool_owner() + ':' + threading.current_thread().name
+
+def lease_worker_session():
+    # Runs before each query scheduler job. Without an idle session the job falls back to the main session.
+    _worker_state.session = None
+    if 'pool_key' in st.session_state:
+        _worker_state.session = get_session_pool().try_checkout(st.session_state['pool_key'], get_worker_owner())
+
+def release_worker_session():
+    if getattr(_worker_state, 'session', None) is not None:
+        get_session_pool().release(get_worker_owner())
+    _worker_state.session = None
+
+def run_sql(sql):
+    '''
+    Runs sql on the current session through the query log and returns the rows.
+    '''
+    with use_session() as session:
+        return get_query_log().execute(session, sql)
+
+@st.experimental_singleton
+def get_result_cache():
+    '''
+    Returns the query result cache shared by every browser session in this process.
+    '''
+    return result_cache.ResultCache()
+
+def _cache_sql(sql, account, name, source, ttl, persist):
+    # Results are cached separately for each account, under a name that can be invalidated on its own.
+    if 'main_session' not in st.session_state:
+        return None
+    def load_rows():
+        with use_session() as session:
+            return get_query_log().execute(session, sql, source)
+    return get_result_cache().get(account, name, sql, load_rows, ttl, persist)
+
+def cache_large_sql(sql, account, name='sql'):
+    cache_function = lambda sql, account: _cache_sql(sql, account, name, 'cache_large_sql', constants.DISK_CACHE_MAX_AGE_SECONDS, True)
+    return get_query_log().cached(cache_function, sql, account, 'cache_large_sql')
+
+def cache_small_sql(sql, account, name='sql'):
+    cache_function = lambda sql, account: _cache_sql(sql, account, name, 'cache_small_sql', constants.MEMORY_CACHE_MAX_AGE_SECONDS, False)
+    return get_query_log().cached(cache_function, sql, account, 'cache_small_sql')
+
+def stream_sql(sql, max_rows=None, max_bytes=constants.STREAM_MAX_BYTES, truncate=False):
+    '''
+    Runs sql on the current session through the query log and returns the
+    result as a DataFrame fetched in batches, see result_stream.fetch_frame
+    '''
+    fetch = lambda dataframe: result_stream.fetch_frame(dataframe, max_rows, max_bytes, truncate)
+    with use_session() as session:
+        return get_query_log().execute_stream(session, sql, fetch)
+
+def _cache_frame(sql, account, name, source, ttl, persist, max_rows, truncate):
+    # Like _cache_sql, but the result is streamed into a DataFrame instead of collected into rows.
+    if 'main_session' not in st.session_state:
         return None
+    fetch = lambda dataframe: result_stream.fetch_frame(dataframe, max_rows, constants.STREAM_MAX_BYTES, truncate)
+    def load_frame():
+        with use_session() as session:
+            return get_query_log().execute_stream(session, sql, fetch, source)
+    return get_result_cache().get(account, name, sql, load_frame, ttl, persist)
+
+def cache_large_frame(sql, account, name='sql'):
+    ''' 
+    Disk cached DataFrame of a large result. Raises 
+    result_stream.ResultBudgetExceeded if it is over the stream budget.
+    '''
+    cache_function = lambda sql, account: _cache_frame(sql, account, name, 'cache_large_frame', constants.DISK_CACHE_MAX_AGE_SECONDS, True, constants.STREAM_MAX_ROWS, False)
+    return get_query_log().cached(cache_function, sql, account, 'cache_large_frame')
+
+def cache_small_frame(sql, account, name='sql', max_rows=constants.STREAM_MAX_ROWS):
+    ''' 
+    Memory cached DataFrame of the first max_rows rows of a result, 
+    attrs['truncated'] is set if there were more.
+    '''
+    cache_function = lambda sql, account: _cache_frame(sql, account, name, 'cache_small_frame', constants.MEMORY_CACHE_MAX_AGE_SECONDS, False, max_rows, True)
+    return get_query_log().cached(cache_function, sql, account, 'cache_small_frame')
+
+def run_schedule_change(sql):
+    ''' 
+    Runs a change to the dispatcher engine's schedule table. Returns 
+    None if it succeeded, otherwise the error message.
+    '''
+    try:
+        run_sql(sql)
+    except Exception as err:
+        return str(err)
+    return None
+
+def get_busy_intervals(account, warehouse_name):
+    ''' 
+    Returns the busy intervals of a warehouse for the auto suspend 
+    simulator. Query history is streamed and merged as it arrives, and 
+    only the merged intervals are cached.
+    '''
+    intervals_sql = sql_builder.get_query_intervals_sql(warehouse_name)
+    def load_busy_intervals():
+        started = time()
+        with use_session() as session:
+            busy_intervals = suspend_simulator.load_busy_intervals(session.sql(intervals_sql))
+        get_query_log().record(intervals_sql, time() - started, busy_intervals, False, 'stream')
+        return busy_intervals
+    return get_result_cache().get(account, 'busy_intervals', intervals_sql, load_busy_intervals, constants.MEMORY_CACHE_MAX_AGE_SECONDS)
+
+def get_sizing_slots(account, warehouse_name, local_timezone):
+    ''' 
+    Returns the hour of week sums for the right-sizing advisor. Hourly 
+    stats are streamed and folded into the slots as they arrive, and 
+    only the slots are cached.
+    '''
+    load_sql = sql_builder.get_warehouse_load_sql(warehouse_name)
+    def load_sizing_slots():
+        started = time()
+        with use_session() as session:
+            slot_sums, slot_hours = sizing_advisor.aggregate_slots(session.sql(load_sql), local_timezone)
+        get_query_log().record(load_sql, time() - started, slot_sums, False, 'stream')
+        return slot_sums, slot_hours
+    # Slots are hours of the week in local_timezone, so each timezone is cached apart.
+    return get_result_cache().get(account, 'sizing_slots', load_sql + '\n-- ' + local_timezone, load_sizing_slots, constants.MEMORY_CACHE_MAX_AGE_SECONDS)
+
+def get_tag_values(account):
+    ''' 
+    Returns the rows of the tag value index (see tag_value_index.py), the 
+    values of every assistant tag from one query. Kept on disk for 
+    constants.TAG_VALUE_INDEX_MAX_AGE_SECONDS and patched when a tag is set. 
+    '''
+    cache_function = lambda sql, account: _cache_sql(sql, account, 'tag_values', 'cache_large_sql', constants.TAG_VALUE_INDEX_MAX_AGE_SECONDS, True)
+    return get_query_log().cached(cache_function, constants.TAG_VALUE_INDEX_SQL, account, 'cache_large_sql')
+
+def use_suggested_tag_value():
+    # Runs before the rerun, so the Tag Value input is created with the chosen value.
+    if st.session_state.get('suggested_tag_value'):
+        st.session_state['apply_tag_value'] = st.session_state['suggested_tag_value']
+
+def get_usage(account):
+    ''' 
+    Returns the usage source for the charts: the refreshed local usage 
+    store, or the Snowflake-side aggregates. See constants.USAGE_SOURCE
+    '''
+    if constants.USAGE_SOURCE == 'store':
+        # Only hours newer than the store's high-water mark are fetched, streamed in batches.
+        return usage_store.refresh_usage(account, stream_sql)
+    try:
+        return cache_large_frame(constants.USAGE_AGGREGATE_SQL, account, 'usage')
+    except result_stream.ResultBudgetExceeded:
+        # Keep the rows that fit the stream budget, attrs['truncated'] tells the charts the usage is incomplete.
+        return cache_small_frame(constants.USAGE_AGGREGATE_SQL, account, 'usage')
+
+def create_query_scheduler():
+    ''' 
+    Returns a QueryScheduler whose worker threads share this script run's 
+    context, so jobs can use st.session_state and the memoized functions. 
+    Each job leases a pooled session of its own while it runs.
+    '''
+    ctx = get_script_run_ctx()
+    def initialize_thread():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        lease_worker_session()
+    return query_scheduler.QueryScheduler(initialize_thread, release_worker_session)
+
+def get_view_result(name, args_key, function, *args):
+    ''' 
+    Memoizes the result of an otherwise uncached query for this browser 
+    session, so switching back to a view doesn't run it again. Results 
+    expire after constants.MEMORY_CACHE_MAX_AGE_SECONDS or when 
+    invalidate_view_results() is called after a change.
+    '''
+    if 'view_results' not in st.session_state:
+        st.session_state['view_results'] = {}
+    cached = st.session_state['view_results'].get(name)
+    if cached and cached['args_key'] == args_key and time() - cached['fetched_at'] < constants.MEMORY_CACHE_MAX_AGE_SECONDS:
+        return cached['result']
+    return set_view_result(name, args_key, function(*args))
+
+def set_view_result(name, args_key, result):
+    '''
+    Stores a view result, e.g. one patched after a change so it doesn't 
+    need to be fetched again.
+    '''
+    if 'view_results' not in st.session_state:
+        st.session_state['view_results'] = {}
+    st.session_state['view_results'][name] = {'args_key': args_key, 'result': result, 'fetched_at': time()}
+    return result
+
+def invalidate_view_results(*names):
+    if 'view_results' in st.session_state:
+        for name in names:
+            st.session_state['view_results'].pop(name, None)
+
+def get_page_query(name, account, args_key=None):
+    ''' 
+    Returns the (args_key, function, args) of a named page query. The 
+    selections used by the query are read from state saved on the previous 
+    rerun, or passed in with args_key. Returns None if the query doesn't 
+    apply to the current selection.
+    '''
+    if name == 'warehouses':
+        return (None, cache_large_sql, ('show warehouses', account, 'warehouses'))
+    elif name == 'tag_inventory':
+        return (None, cache_large_sql, (constants.WAREHOUSE_TAG_INVENTORY_SQL, account, 'tag_inventory'))
+    elif name == 'timezone':
+        return (None, cache_small_sql, (constants.TIMEZONE_PARAMETER_SQL, account, 'timezone'))
+    elif name == 'usage':
+        return (None, get_usage, (account,))
+    elif name == 'tags':
+        return (None, get_view_result, ('tags', None, run_sql, constants.TAG_LIST_SQL))
+    elif name == 'schedule_tasks':
+        selected_wh = args_key or st.session_state.get('last_selected_wh', '')
+        if selected_wh:
+            return (selected_wh, get_view_result, ('schedule_tasks', selected_wh, run_sql, sql_builder.get_schedule_tasks_sql(selected_wh)))
+    elif name == 'current_tag_value':
+        apply_tag_name, apply_tag_wh = args_key or (st.session_state.get('last_apply_tag_name', ''), st.session_state.get('last_apply_tag_wh', ''))
+        if apply_tag_wh and apply_tag_name:
+            return ((apply_tag_name, apply_tag_wh), get_view_result, ('current_tag_value', (apply_tag_name, apply_tag_wh), run_sql, sql_builder.get_current_tag_value_sql(apply_tag_name, apply_tag_wh)))
+    elif name == 'tag_values':
+        return (None, get_tag_values, (account,))
+    elif name == 'chargeback':
+        chargeback_tag, chargeback_days = args_key or (st.session_state.get('last_chargeback_tag', ''), st.session_state.get('last_chargeback_days', constants.CHARGEBACK_DEFAULT_DAYS))
+        if chargeback_tag:
+            return ((chargeback_tag, chargeback_days), cache_small_frame, (sql_builder.get_chargeback_sql(chargeback_tag, chargeback_days), account, 'chargeback'))
+    return None
+
+def schedule_page_queries(scheduler, account, active_view):
+    ''' 
+    Submits the queries the active view depends on (see 
+    constants.VIEW_DEPENDENCIES) so they run at the same time. Each view 
+    picks up its results with get_page_result().
+    '''
+    for name in constants.VIEW_DEPENDENCIES[active_view]:
+        page_query = get_page_query(name, account)
+        if page_query:
+            scheduler.submit(name, page_query[0], page_query[1], *page_query[2])
+
+def get_page_result(scheduler, name, account, args_key=None):
+    ''' 
+    Returns the result of a named page query, from the scheduler if it 
+    was prefetched for the same selection, otherwise by running it now.
+    '''
+    page_query = get_page_query(name, account, args_key)
+    return scheduler.get(name, page_query[0], page_query[1], *page_query[2])
+
+def get_warehouse_catalog(scheduler, account):
+    ''' 
+    Returns the warehouse catalog, fetched with two statements total: 
+    the warehouse list and the tag inventory for all warehouses. The 
+    catalog is only rebuilt when either result changes, e.g. when a tag 
+    change is patched into the cached tag inventory.
+    '''
+    return warehouse_catalog.get_catalog(
+        get_page_result(scheduler, 'warehouses', account),
+        get_page_result(scheduler, 'tag_inventory', account)
+        )
+
+def get_saved_index(options, state_key):
+    ''' 
+    Widget state is dropped while its view is hidden, so selections are 
+    saved under separate keys. Returns the index of the saved selection.
+    '''
+    saved_value = st.session_state.get(state_key)
+    if saved_value in options:
+        return list(options).index(saved_value)
+    return 0
+
+def search_warehouse_pages(wh_catalog, key, search_col, page_col, **criteria):
+    ''' 
+    Renders the search box in search_col and the page selector in page_col 
+    for the warehouse pickers. Returns (page_names, total): one page 
+    (constants.WAREHOUSE_PICKER_PAGE_SIZE) of the warehouses whose name 
+    contains the search text and that match criteria (see 
+    WarehouseCatalog.search), and the number of matches. The search and 
+    page are saved under 'last_' + key + '_search' and '_page', and the 
+    page goes back to the first whenever the search or criteria change.
+    '''
+    with search_col:
+        search_text = st.text_input('Search Warehouses', value=st.session_state.get('last_' + key + '_search', ''), key=key + '_search', help='Shows warehouses whose name contains this text.')
+        st.session_state['last_' + key + '_search'] = search_text
+
+    # Start from the first page whenever the search or the filters change.
+    filter_state = (search_text, tuple(sorted(criteria.items())))
+    if st.session_state.get('last_' + key + '_filters') != filter_state:
+        st.session_state['last_' + key + '_filters'] = filter_state
+        st.session_state.pop('last_' + key + '_page', None)
+        st.session_state.pop(key + '_page', None)
+
+    page_size = constants.WAREHOUSE_PICKER_PAGE_SIZE
+    total = wh_catalog.search(search_text, 0, 0, **criteria)[1]
+    page_options = list(range(1, max(1, -(-total // page_size)) + 1))
+    with page_col:
+        page = st.selectbox('Page', page_options, index=get_saved_index(page_options, 'last_' + key + '_page'), key=key + '_page')
+        st.session_state['last_' + key + '_page'] = page
+
+    return wh_catalog.search(search_text, (page - 1) * page_size, page_size, **criteria)[0], total
+
+def warehouse_picker(wh_catalog, key, assistant_enabled_setting, label='Select', help=None):
+    ''' 
+    Search-as-you-type warehouse picker with size and owner filters. Only 
+    one page of matches is sent to the browser, see search_warehouse_pages. 
+    The selection is saved under 'last_' + key, and stays selectable while 
+    it is outside the current page. Returns the selected warehouse name, 
+    or ''.
+    '''
+    search_col, size_col, owner_col = st.columns([3, 1, 1])
+    with size_col:
+        size_options = ['Any'] + [size for size in constants.WAREHOUSE_SIZES.keys() if size in wh_catalog.indexes['size']]
+        size_filter = st.selectbox('Size', size_options, index=get_saved_index(size_options, 'last_' + key + '_size'), key=key + '_size')
+        st.session_state['last_' + key + '_size'] = size_filter
+
+    with owner_col:
+        owner_options = ['Any'] + wh_catalog.get_values('owner')
+        owner_filter = st.selectbox('Owner', owner_options, index=get_saved_index(owner_options, 'last_' + key + '_owner'), key=key + '_owner')
+        st.session_state['last_' + key + '_owner'] = owner_filter
+
+    criteria = {}
+    if warehouse_catalog.ASSISTANT_ENABLED_SETTINGS[assistant_enabled_setting]:
+        criteria['assist_enabled'] = warehouse_catalog.ASSISTANT_ENABLED_SETTINGS[assistant_enabled_setting]
+    if size_filter != 'Any':
+        criteria['size'] = size_filter
+    if owner_filter != 'Any':
+        criteria['owner'] = owner_filter
+
+    pick_col, page_col = st.columns([4, 1])
+    page_names, total = search_warehouse_pages(wh_catalog, key, search_col, page_col, **criteria)
+    options = [''] + page_names
+    saved_selection = st.session_state.get('last_' + key, '')
+    if saved_selection and saved_selection not in page_names and saved_selection in wh_catalog:
+        options.insert(1, saved_selection)
+
+    with pick_col:
+        selection = st.selectbox(label, options, index=get_saved_index(options, 'last_' + key), key=key, help=help)
+        st.session_state['last_' + key] = selection
+        st.caption('Showing ' + str(len(page_names)) + ' of ' + str(total) + ' matching warehouses')
+    return selection
+
+def warehouse_multi_picker(wh_catalog, key, label, help=None, exclude=(), **criteria):
+    ''' 
+    Multiple selection version of warehouse_picker. The warehouses 
+    matching criteria (see WarehouseCatalog.find) are searched and paged 
+    the same way, and picks from every page are kept. The picks are saved 
+    under 'last_' + key. Returns the picked warehouse names.
+    '''
+    search_col, page_col = st.columns([4, 1])
+    page_names, total = search_warehouse_pages(wh_catalog, key, search_col, page_col, **criteria)
+    # Picks stay options while they are off the current page, so they aren't dropped.
+    picked = [name for name in st.session_state.get('last_' + key, []) if name in wh_catalog and name not in exclude]
+    options = picked + [name for name in page_names if name not in picked and name not in exclude]
+    picked = st.multiselect(label, options, default=picked, key=key, help=help)
+    st.session_state['last_' + key] = picked
+    st.caption('Showing ' + str(len(page_names)) + ' of ' + str(total) + ' matching warehouses, ' + str(len(picked)) + ' picked')
+    return picked
 
 def wait_and_rerun(wait_time=constants.DEFAULT_RERUN_WAIT_TIME_SECONDS):
     '''
@@ -86,13 +501,15 @@ def wait_and_rerun(wait_time=constants.DEFAULT_RERUN_WAIT_TIME_SECONDS):
     st.experimental_rerun()
     return True
 
-def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz=constants.DEFAULT_TIMEZONE):
+def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz=constants.DEFAULT_TIMEZONE, current_size=None, active_fractions=None):
     ''' 
     Display a large section for scheduling. Specific to input warehouse_name, 
     up to n schedules can be enabled for each. See constants.MAX_SCHEDULE_COUNT 
     for maximum allowed schedules per warehouse. Schedules use the CRON engine 
     for recurrence management. The default timezone will be overwritten with 
     the timezone set on the host Snowflake account, if one exists. 
+    The schedules are previewed as a week of sizes, starting from current_size, 
+    with their projected credits weighted by active_fractions if given. 
     '''
     st.markdown('Default timezone: **`' + schedule_tz + '`**')
 
@@ -114,7 +531,7 @@ def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz
             wh_sch_tz = re.sub('.* ', '', row_data['schedule'])
             # Capture the task affected warehouse info
             sch_wh = re.sub('.*= ', '', row_data['definition'])
-            sch_size_setting = constants.GET_WAREHOUSE_CODE_LIST().index(sch_wh)
+            sch_size_setting = constants.WAREHOUSE_CODE_INDEX[sch_wh]
             sch_state = row_data['state']
         
         st.markdown('##### Schedule ' + str(idx))
@@ -122,13 +539,19 @@ def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz
 
         with settings_sch_col1:
             schedule_cron = st.text_input('CRON', sch_cron_setting, key='cron_' + str(idx), help=constants.CRON_HELP_TEXT)
+            schedule_info[idx]['cron'] = schedule_cron
 
         try:
             st.caption(cd.get_description(schedule_cron))
+            if constants.SCHEDULING_ENGINE == 'dispatcher':
+                sql_builder.check_dispatcher_cron(schedule_cron)
             schedule_info[idx]['is_ok'] = True
         except cd.FormatException:
             st.error('Invalid Format')
             schedule_info[idx]['is_ok'] = False
+        except ValueError as err:
+            st.error(str(err))
+            schedule_info[idx]['is_ok'] = False
 
         with settings_sch_col2:
             schedule_info[idx]['tz'] = st.text_input('Timezone', value=wh_sch_tz, key='schedule_tz_' + str(idx), help=constants.TIMEZONE_INPUT_HELP)
@@ -148,7 +571,7 @@ def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz
                     st.warning('Paused')
                 st.code('CRON Str: ' + sch_cron_setting + '\n'
                       + 'Timezone: ' + wh_sch_tz + '\n'
-                      + ' WH Size: ' + constants.REVERSE_WAREHOUSE_SIZES()[sch_wh]
+                      + ' WH Size: ' + constants.WAREHOUSE_SIZE_BY_CODE[sch_wh]
                       )
 
             else:
@@ -156,29 +579,33 @@ def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz
 
         # Show available actions on this schedule
         with create_sch_col2:
-            create_schedule_sql = "call utility.sp_create_warehouse_size_task"
-            create_schedule_sql += "('" + warehouse_name + "' "
-            create_schedule_sql += ",'" + constants.WAREHOUSE_SIZES[schedule_info[idx]['size']]['code'] + "' "
-            create_schedule_sql += ",'" + schedule_cron + "' "
-            create_schedule_sql += ",'" + str(idx) + "' "
-            create_schedule_sql += ",'" + schedule_info[idx]['tz'] + "' "
-            create_schedule_sql += ")"
+            create_schedule_sql = sql_builder.get_call_sql('sp_create_warehouse_size_task', warehouse_name, constants.WAREHOUSE_SIZES[schedule_info[idx]['size']]['code'], schedule_cron, str(idx), schedule_info[idx]['tz'])
 
             create_button_text = 'Create Schedule'
             if schedule_exists:
                 create_button_text = 'Update Schedule'
             if st.button(create_button_text, key='create_schedule_' + str(idx)):
-                result = json.loads(st.session_state['main_session'].sql(create_schedule_sql).collect()[0]['SP_CREATE_WAREHOUSE_SIZE_TASK'])
                 result_status = 'Success'
-                for key in result.keys():
-                    if 'success' not in result[key]['result']:
+                if not schedule_info[idx]['is_ok']:
+                    result_status = 'Error'
+                    st.error('Fix the CRON schedule before saving.')
+                elif constants.SCHEDULING_ENGINE == 'dispatcher':
+                    upsert_error = run_schedule_change(sql_builder.get_schedule_upsert_sql(warehouse_name, idx, constants.WAREHOUSE_SIZES[schedule_info[idx]['size']]['code'], schedule_cron, schedule_info[idx]['tz']))
+                    if upsert_error:
                         result_status = 'Error'
-                        st.error(json.dumps(result[key]))
-                        break
+                        st.error(upsert_error)
+                else:
+                    result = json.loads(run_sql(create_schedule_sql)[0]['SP_CREATE_WAREHOUSE_SIZE_TASK'])
+                    for key in result.keys():
+                        if 'success' not in result[key]['result']:
+                            result_status = 'Error'
+                            st.error(json.dumps(result[key]))
+                            break
 
                 if result_status == 'Success':
                     st.success(result_status)
                 
+                invalidate_view_results('schedule_tasks')
                 wait_and_rerun()
 
             if schedule_exists:
@@ -186,33 +613,123 @@ def display_schedules(warehouse_name, schedule_count, schedule_data, schedule_tz
                 if sch_state == 'suspended':
                     pause_button_text = 'Resume Schedule'
                 if st.button(pause_button_text, key='pause_schedule_' + str(idx)):
-                    alter_schedule_sql = "call utility.sp_pause_resume_warehouse_size_task('" + row_data['name'] + "', '"
-                    if sch_state == 'started':
-                        alter_schedule_sql += 'suspend'
-                    elif sch_state == 'suspended':
-                        alter_schedule_sql += 'resume'
+                    if constants.SCHEDULING_ENGINE == 'dispatcher':
+                        pause_error = run_schedule_change(sql_builder.get_schedule_enabled_sql(warehouse_name, sch_state == 'suspended', int(re.sub('.*_', '', row_data['name']))))
+                        alter_result = {'alter': pause_error or 'success'}
                     else:
-                        alter_schedule_sql += 'pass'
-                    alter_schedule_sql += "')"
-
-                    alter_result = json.loads(st.session_state['main_session'].sql(alter_schedule_sql).collect()[0]['SP_PAUSE_RESUME_WAREHOUSE_SIZE_TASK'])
+                        alter_action = 'pass'
+                        if sch_state == 'started':
+                            alter_action = 'suspend'
+                        elif sch_state == 'suspended':
+                            alter_action = 'resume'
+                        alter_schedule_sql = sql_builder.get_call_sql('sp_pause_resume_warehouse_size_task', row_data['name'], alter_action)
+                        alter_result = json.loads(run_sql(alter_schedule_sql)[0]['SP_PAUSE_RESUME_WAREHOUSE_SIZE_TASK'])
                     if 'success' in alter_result['alter']:
                         st.success('Success')
                     else:
                         st.error(alter_result['alter'])
+                    invalidate_view_results('schedule_tasks')
                     wait_and_rerun()
 
                 if st.button('Delete Schedule', key='delete_schedule_' + str(idx)):
-                    drop_schedule_sql = "call utility.sp_drop_warehouse_size_task ('" + row_data['name'] + "')"
-                    drop_result = json.loads(st.session_state['main_session'].sql(drop_schedule_sql).collect()[0]['SP_DROP_WAREHOUSE_SIZE_TASK'])
+                    if constants.SCHEDULING_ENGINE == 'dispatcher':
+                        drop_error = run_schedule_change(sql_builder.get_schedule_delete_sql(warehouse_name, int(re.sub('.*_', '', row_data['name']))))
+                        drop_result = {'drop': drop_error or 'success'}
+                    else:
+                        drop_schedule_sql = sql_builder.get_call_sql('sp_drop_warehouse_size_task', row_data['name'])
+                        drop_result = json.loads(run_sql(drop_schedule_sql)[0]['SP_DROP_WAREHOUSE_SIZE_TASK'])
                     if 'success' in drop_result['drop']:
                         st.success('Success')
                     else:
                         st.error(drop_result['drop'])
+                    invalidate_view_results('schedule_tasks')
                     wait_and_rerun()
 
         st.markdown('---')
 
+    schedules = []
+    for idx in schedule_info.keys():
+        schedules.append({
+            'index': idx,
+            'size': constants.WAREHOUSE_SIZES[schedule_info[idx]['size']]['code'],
+            'cron': schedule_info[idx]['cron'],
+            'tz': schedule_info[idx]['tz']
+            })
+
+    # Preview the week the schedules above would give, before any of them is saved.
+    st.markdown('##### Schedule Timeline')
+    week_start = cron_timeline.get_week_start(schedule_tz)
+    schedule_timeline = cron_timeline.ScheduleTimeline([schedule for schedule in schedules if schedule_info[schedule['index']]['is_ok']], week_start, cron_timeline.WEEK_MINUTES, current_size)
+    for timeline_warning in schedule_timeline.get_warnings(schedule_tz):
+        st.warning(timeline_warning)
+    st.dataframe(schedule_timeline.get_calendar(schedule_tz))
+    if current_size:
+        projected_credits = schedule_timeline.get_projected_credits(active_fractions, schedule_tz)
+        unscheduled_credits = cron_timeline.ScheduleTimeline([], week_start, cron_timeline.WEEK_MINUTES, current_size).get_projected_credits(active_fractions, schedule_tz)
+        st.caption('Projected credits this week: ' + str(round(projected_credits, 2)) + ', ' + str(round(unscheduled_credits, 2)) + ' at ' + current_size + ' without schedules. '
+                   + ('Weighted by the hours the warehouse ran over the usage period.' if active_fractions is not None else 'Assumes the warehouse runs all week.'))
+
+    # Save every schedule above in one call. Tasks beyond schedule_count are dropped.
+    if st.button('Save All Schedules', key='save_all_schedules'):
+        if not all(schedule_info[idx]['is_ok'] for idx in schedule_info.keys()):
+            st.error('Fix the invalid CRON schedules before saving.')
+        else:
+            save_schedules(warehouse_name, schedules)
+
+def save_schedules(warehouse_name, schedules):
+    ''' 
+    Saves all schedules of a warehouse in one call, replacing the 
+    existing ones, then reruns to show them. 
+    '''
+    save_schedules_sql, save_result_column = sql_builder.get_save_schedules_sql(warehouse_name, schedules)
+    result = json.loads(run_sql(save_schedules_sql)[0][save_result_column])
+    schedule_errors = warehouse_plan.get_schedule_errors(result)
+    for schedule_error in schedule_errors:
+        st.error(schedule_error)
+    if not schedule_errors:
+        st.success('Success')
+
+    # The schedule widgets default to the saved schedules again after the rerun.
+    for key in ['schedule_count'] + [prefix + str(idx) for prefix in ['cron_', 'schedule_tz_', 'sch_size_'] for idx in range(1, constants.MAX_SCHEDULE_COUNT + 1)]:
+        st.session_state.pop(key, None)
+    invalidate_view_results('schedule_tasks')
+    wait_and_rerun()
+
+def mark_schedules_toggled(warehouse_name):
+    '''
+    on_change callback of the "Enable Scheduling" radio. Task states are
+    only changed on the rerun right after the user flips it.
+    '''
+    st.session_state['schedules_toggled'] = warehouse_name
+
+def set_schedules_state(warehouse_name, schedule_data, enabled):
+    '''
+    Suspends or resumes all schedules of a warehouse with one call. Tasks 
+    already in the target state are left alone, here and in the procedure. 
+    Returns True if anything was changed.
+    '''
+    action = 'resume' if enabled else 'suspend'
+    target_state = 'started' if enabled else 'suspended'
+    if all(row['state'] == target_state for row in schedule_data):
+        return False
+
+    if constants.SCHEDULING_ENGINE == 'dispatcher':
+        state_error = run_schedule_change(sql_builder.get_schedule_enabled_sql(warehouse_name, enabled))
+        if state_error:
+            st.error(state_error)
+        invalidate_view_results('schedule_tasks')
+        return True
+
+    state_sql = sql_builder.get_call_sql('sp_set_warehouse_size_tasks_state', warehouse_name, action)
+    result = json.loads(run_sql(state_sql)[0]['SP_SET_WAREHOUSE_SIZE_TASKS_STATE'])
+    if 'error' in result:
+        st.error(result['error'])
+    for task_name, alter_result in result.get('altered', {}).items():
+        if 'success' not in str(alter_result['result']).lower():
+            st.error(task_name + ': ' + json.dumps(alter_result))
+    invalidate_view_results('schedule_tasks')
+    return True
+
 def go():
     ''' 
     A main container function which contains the body of the app. 
@@ -228,424 +745,659 @@ def go():
         if key not in st.session_state:
             st.session_state[key] = default_state[key]
 
-    page_title = 'Warehouse Tagging Assistant'
-    st.set_page_config(
-        page_title=page_title,
-        layout='centered',
-        initial_sidebar_state='collapsed',
-        menu_items={
-            'About': constants.APP_ABOUT_TEXT
-        }
-    )
-
-    st.header(page_title)
-
-    with st.sidebar:
-        with st.expander('New to the Assistant?', False):
-            st.markdown(constants.APP_INFO_TEXT)
-
-        with st.expander('Additional Options', False):
-            if st.button('Disconnect', help='Disconnect current Snowflake session'):
-                if st.session_state['authenticated']:
-                    st.session_state['main_session'].close()
-                    st.session_state['authenticated'] = False
-                    st.experimental_rerun()
-
-            if st.button('Reset Session', help='Reset all session variables to default values.'):
-                if st.session_state['authenticated']:
-                    st.session_state['main_session'].close()
-                    del st.session_state['main_session']
-                    st.session_state['authenticated'] = False
+    get_query_log().start_rerun()
+
+    # Set once the page has submitted its queries.
+    page_queries = None
+    try:
+        page_title = 'Warehouse Tagging Assistant'
+        st.set_page_config(
+            page_title=page_title,
+            layout='centered',
+            initial_sidebar_state='collapsed',
+            menu_items={
+                'About': constants.APP_ABOUT_TEXT
+            }
+        )
+
+        st.header(page_title)
+
+        with st.sidebar:
+            with st.expander('New to the Assistant?', False):
+                st.markdown(constants.APP_INFO_TEXT)
+
+            with st.expander('Additional Options', False):
+                if st.button('Disconnect', help='Disconnect current Snowflake session'):
+                    if st.session_state['authenticated']:
+                        disconnect_session()
+                        st.session_state['authenticated'] = False
+                        st.experimental_rerun()
+
+                if st.button('Reset Session', help='Reset all session variables to default values.'):
+                    if st.session_state['authenticated']:
+                        disconnect_session()
+                        st.session_state['authenticated'] = False
                     
-                for key in st.session_state.keys():
-                    if key in default_state.keys():
-                        st.session_state[key] = default_state[key]
+                    for key in st.session_state.keys():
+                        if key in default_state.keys():
+                            st.session_state[key] = default_state[key]
+                        else:
+                            del st.session_state[key]
+                if st.button('Toggle DEBUG', help='Displays additional detail at the bottom of the page.'):
+                    if st.session_state.debug:
+                        st.session_state.debug = False 
                     else:
-                        del st.session_state[key]
-            if st.button('Toggle DEBUG', help='Displays additional detail at the bottom of the page.'):
-                if st.session_state.debug:
-                    st.session_state.debug = False 
-                else:
-                    st.session_state.debug = True
+                        st.session_state.debug = True
+
+            with st.expander('Change Log', False):
+                st.caption(change_log)
 
-        with st.expander('Change Log', False):
-            st.caption(change_log)
+        # Only the active view is rendered, so only its queries run.
+        view_names = list(constants.VIEW_DEPENDENCIES.keys())
+        active_view = st.radio('View', view_names, index=get_saved_index(view_names, 'last_active_view'), key='active_view', horizontal=True)
+        st.session_state['last_active_view'] = active_view
 
-    tab1, tab2, tab3, tab4 = st.tabs(['Authentication', 'Warehouses', 'Tags', 'Apply Tags'])
+        wh_record = None
+        selected_wh = ''
+        tag_lookup = {}
+        auto_suspend_breakdown = {}
 
-    with tab1:
-        st.subheader('Authentication', 'auth')
+        if active_view == 'Authentication':
+            st.subheader('Authentication', 'auth')
 
-        with st.expander('Pre-installation Scripts'):
-            st.markdown(constants.PRE_INSTALL_PROMISE_TEXT)
-            with open('snowflake_pre_script.sql', 'r') as f:
-                pre_install_sql = f.read()
+            with st.expander('Pre-installation Scripts'):
+                st.markdown(constants.PRE_INSTALL_PROMISE_TEXT)
+                with open('snowflake_pre_script.sql', 'r') as f:
+                    pre_install_sql = f.read()
 
-            st.code(pre_install_sql, language='sql')
+                st.code(pre_install_sql, language='sql')
 
-        creds = {}
-        creds['main'] = {}
-        with st.form('main_creds'):
-            main_url = st.text_input('Account', '', help='The qualified account locator or URL for the account.')
+            creds = {}
+            creds['main'] = {}
+            with st.form('main_creds'):
+                main_url = st.text_input('Account', '', help='The qualified account locator or URL for the account.')
             
-            col1, col2 = st.columns(2)
-            with col1:
-                main_user = st.text_input('User', '', help='User with `sysadmin` or `accountadmin` role assigned.')
-            with col2:
-                main_pass = st.text_input('Password', '', type='password', help='Password for this user. This will not be stored at any time, ever.')
-
-            if st.form_submit_button('Connect'):
-                creds['main'] = {
-                    'url': main_url,
-                    'user': main_user,
-                    'password': main_pass
-                    }
-
-                st.session_state['main_session'] = create_session(creds['main'])
-                st.session_state['authenticated'] = True
+                col1, col2 = st.columns(2)
+                with col1:
+                    main_user = st.text_input('User', '', help='User with `sysadmin` or `accountadmin` role assigned.')
+                with col2:
+                    main_pass = st.text_input('Password', '', type='password', help='Password for this user. This will not be stored at any time, ever.')
+
+                if st.form_submit_button('Connect'):
+                    creds['main'] = {
+                        'url': main_url,
+                        'user': main_user,
+                        'password': main_pass
+                        }
+
+                    st.session_state['main_session'] = create_session(creds['main'])
+                    st.session_state['authenticated'] = True
+                    st.session_state['account'] = main_url
+
+        main_url = st.session_state.get('account', '')
                     
+        if st.session_state['authenticated']:
+            # Lease a pooled session for this rerun. Released at the bottom of the page.
+            try:
+                st.session_state['main_session'] = get_session_pool().checkout(st.session_state['pool_key'], get_pool_owner())
+            except session_pool.SessionPoolError as e:
+                st.error(str(e))
+                st.session_state['authenticated'] = False
+
+        page_queries = create_query_scheduler()
+        if st.session_state['authenticated']:
+            schedule_page_queries(page_queries, main_url, active_view)
+
+        if st.session_state['authenticated']:
+            if active_view == 'Warehouses':
+                st.subheader('Warehouses', 'wh')
+
+                wh_col1, wh_col2 = st.columns(2, gap='medium')
+
+                with wh_col1: 
+                    assistant_enabled_setting = st.radio('Assistant Enabled', ('All', 'Yes', 'No'), index=get_saved_index(('All', 'Yes', 'No'), 'last_assistant_enabled_setting'), key='assistant_enabled_setting', help='Filter warehouse list based on whether Assistant is enabled on that warehouse already.')
+                    st.session_state['last_assistant_enabled_setting'] = assistant_enabled_setting
+
+                    if st.button('Refresh Warehouse List', key='refresh_wh_button', help='Fetches the warehouse list and their tags again. Usage stats stay cached.'):
+                        get_result_cache().invalidate(main_url, 'warehouses')
+                        get_result_cache().invalidate(main_url, 'tag_inventory')
+                        st.experimental_rerun()
+
+                    with st.spinner('Getting Warehouse Information...'):
+                        wh_catalog = get_warehouse_catalog(page_queries, main_url)
+                    
+                selected_wh = warehouse_picker(wh_catalog, 'selected_wh', assistant_enabled_setting, help='Warehouses found in the account which are available to `sysadmin`')
+                wh_record = wh_catalog.get(selected_wh)
+                # Records are shared between sessions, so changes made below are tracked here.
+                assist_enabled = wh_record.assist_enabled if wh_record else 'n'
+                
+                with wh_col2:
+                    if selected_wh != '':
+                        st.markdown('Name: **' + selected_wh + '**')
+                        st.markdown('Current Size: **' + wh_record.size + '**')
+                        auto_suspend_breakdown = utility.format_seconds_interval(wh_record.auto_suspend)
+                        st.markdown('Auto Suspend: **' + str(auto_suspend_breakdown['total_seconds']) + ' seconds** (' + auto_suspend_breakdown['description'] + ')')
+
+                        with st.expander('Additional Detail'):
+                            st.json(wh_record.as_dict())
+
+                        if assist_enabled == 'n':
+                            if st.button('Enable Assistant', help='Enable management of this warehouse by the Assistant. Clicking this button will _**not**_ remove existing permissions or change any warehouse settings. Clicking this button _**will**_ add a tag and value to this warehouse.'):
+                                run_sql(sql_builder.get_assistant_enabled_sql(selected_wh, True))
+                                get_result_cache().patch(main_url, 'tag_inventory', lambda rows: tag_inventory.patch_tag_inventory_rows(rows, selected_wh, assistant_enabled='y'))
+                                assist_enabled = 'y'
+                                st.success('Enabled')
+                        else:
+                            # Let's manage this thing a bit...
+                            if st.button('Disable Assistant', help='Disable management of this warehouse by the Assistant. Clicking this button will _**not**_ remove existing permissions or change any warehouse settings. Clicking this button _**will**_ modify a tag and value on this warehouse.'):
+                                run_sql(sql_builder.get_assistant_enabled_sql(selected_wh, False))
+                                get_result_cache().patch(main_url, 'tag_inventory', lambda rows: tag_inventory.patch_tag_inventory_rows(rows, selected_wh, assistant_enabled='n'))
+                                assist_enabled = 'n'
+                                st.warning('Disabled')
+
+                with st.container():
+                    # Display information about warehouse usage.
+                    st.write('Average Credit Usage Over 30 Days')
+                    wh_stats1, wh_stats2 = st.columns(2)
+                    account_timezone = get_page_result(page_queries, 'timezone', main_url)[0]['value'] or constants.DEFAULT_TIMEZONE
+                    with st.spinner('Getting Usage Stats...'):
+                        usage = get_page_result(page_queries, 'usage', main_url)
+                        if constants.USAGE_SOURCE == 'store':
+                            # Built once per store version and shared by every session, so changing the selection only slices it.
+                            warehouse_usage_cube = usage_cube.get_cube(usage, account_timezone)
+                            usage_by_day, usage_by_hour = warehouse_usage_cube.get_aggregates(selected_wh)
+                        else:
+                            # Aggregated in Snowflake for all warehouses at once, so changing the selection only filters a small result.
+                            usage_by_day, usage_by_hour = usage_stats.get_usage_aggregates(usage, selected_wh)
+                    if usage is not None and usage.attrs.get('truncated'):
+                        st.error('Usage is over the budget of ' + str(constants.STREAM_MAX_ROWS) + ' rows or ' + str(constants.STREAM_MAX_BYTES // (1024 * 1024)) + ' MB, so the charts only include the first ' + str(len(usage)) + ' rows. Set USAGE_SOURCE to \'store\' in constants.py to load usage incrementally.')
+                    with wh_stats1:
+                        st.area_chart(usage_by_day, x='START_DAY_NAME', y='CREDITS_USED')
+
+                    with wh_stats2:
+                        st.area_chart(usage_by_hour, x='START_HOUR', y='CREDITS_USED')
+
+                    if constants.USAGE_SOURCE == 'store':
+                        st.caption(str(round(warehouse_usage_cube.get_total_credits(selected_wh), 2)) + ' credits used in total.')
+                        if st.checkbox('Show Day x Hour Averages', value=False, key='show_usage_grid', help='Average credits for each hour of each day of the week.'):
+                            st.dataframe(warehouse_usage_cube.get_grid(selected_wh))
+
+                    if selected_wh != '' and st.checkbox('Show Hourly Detail', value=False, key='show_usage_detail', help='Load the individual hourly usage rows for this warehouse.'):
+                        if constants.USAGE_SOURCE == 'store':
+                            st.dataframe(warehouse_usage_cube.get_rows(selected_wh))
+                        else:
+                            # Newest first, so a truncated result keeps the most recent hours. Shown oldest first.
+                            usage_detail_sql = constants.USAGE_DETAIL_SQL + " where warehouse_name = '" + selected_wh + "' and start_time is not null order by start_time desc"
+                            usage_detail = cache_small_frame(usage_detail_sql, main_url, 'usage_detail', constants.USAGE_DETAIL_MAX_ROWS)
+                            if usage_detail.attrs.get('truncated'):
+                                st.caption('Showing the last ' + str(constants.USAGE_DETAIL_MAX_ROWS) + ' hours.')
+                            st.dataframe(usage_detail.iloc[::-1].reset_index(drop=True))
+
+                if selected_wh != '' and assist_enabled == 'y':
+                    ### Scheduling ###
+                    wh_schedule_tasks = get_page_result(page_queries, 'schedule_tasks', main_url, selected_wh)
+                    sch_col1, sch_col2 = st.columns([2, 6])
+                    with sch_col1:
+                        default_scheduled_enabled = 0
+                        if any(row['state'] == 'started' for row in wh_schedule_tasks):
+                            default_scheduled_enabled = 1
+                        # Keyed per warehouse, so changing the selection is not mistaken for a toggle.
+                        enable_schedules = st.radio('Enable Scheduling', (False, True), index=default_scheduled_enabled, key='enable_schedules_' + selected_wh, on_change=mark_schedules_toggled, args=(selected_wh,), help='If enabled, the warehouse size will be set to a specified size on a schedule. Disabling scheduling will pause existing schedules for selected warehouse, enabling it again resumes them.')
+
+                    if st.session_state.pop('schedules_toggled', None) == selected_wh and len(wh_schedule_tasks) > 0:
+                        if set_schedules_state(selected_wh, wh_schedule_tasks, enable_schedules):
+                            wh_schedule_tasks = get_view_result('schedule_tasks', selected_wh, run_sql, sql_builder.get_schedule_tasks_sql(selected_wh))
+
+                    with sch_col2:
+                        if enable_schedules:
+                            schedule_count = st.slider('Number of Schedules', 1, constants.MAX_SCHEDULE_COUNT, value=max(1, min(len(wh_schedule_tasks), constants.MAX_SCHEDULE_COUNT)), key='schedule_count')
+
+                    # Call a function to display and operate schedules.
+                    if enable_schedules:
+                        with st.container():
+                            active_fractions = None
+                            if constants.USAGE_SOURCE == 'store' and wh_record:
+                                active_fractions = warehouse_usage_cube.get_active_fractions(selected_wh, constants.WAREHOUSE_SIZES[wh_record.size]['credit_rate'])
+                            display_schedules(selected_wh, schedule_count, wh_schedule_tasks, account_timezone, wh_record.size if wh_record else None, active_fractions)
+
+                    with st.expander('Right-Sizing Recommendations', False):
+                        if st.checkbox('Analyze Query History', value=False, key='analyze_sizing', help='Analyze the last ' + str(constants.SIZING_ANALYSIS_DAYS) + ' days of queueing, spilling and load on this warehouse to recommend a size for each hour of the week.'):
+                            with st.spinner('Analyzing Query History...'):
+                                slot_sums, slot_hours = get_sizing_slots(main_url, selected_wh, account_timezone)
+                            recommended_sizes = sizing_advisor.recommend_sizes(slot_sums, slot_hours)
+                            st.dataframe(sizing_advisor.get_recommendation_grid(recommended_sizes))
+                            st.caption('Hours are in ' + account_timezone + '. Blank hours had no queries. Sustained queueing may be better served by more clusters than by a larger size.')
+
+                            recommended_schedules = sizing_advisor.build_schedules(recommended_sizes, account_timezone)
+                            if recommended_schedules:
+                                st.code('\n'.join(schedule['cron'].ljust(24) + constants.WAREHOUSE_SIZE_BY_CODE[schedule['size']] for schedule in recommended_schedules))
+                                if st.button('Save as Schedules', key='save_recommended_schedules', help='Replace the schedules of this warehouse with the recommended ones. They can be edited above afterwards.'):
+                                    save_schedules(selected_wh, recommended_schedules)
+
+                    ### Warehouse Settings ###
+                    simulate_auto_suspend = st.checkbox('Simulate Auto Suspend Costs', value=False, key='simulate_auto_suspend', help='Replay the last ' + str(constants.SUSPEND_SIMULATION_DAYS) + ' days of queries on this warehouse to estimate the credits each auto suspend setting would have used. Reads query_history, which can take a moment on busy warehouses.')
+                    # Outside the form, so searching and paging rerun right away.
+                    with st.expander('Also Apply To', False):
+                        also_alter_whs = warehouse_multi_picker(wh_catalog, 'also_alter_whs', 'Also Apply To', help='Apply the settings changed below to these warehouses as well. Each warehouse only gets the settings that differ from its own.', exclude=(selected_wh,), assist_enabled='y')
+
+                    with st.form('warehouse_settings', clear_on_submit=True):
+                        st.subheader('Edit ' + selected_wh + ' Settings')
+
+
+                        whcol1, whcol2 = st.columns([5, 2], gap='medium')
+                        with whcol2:
+                            # Display a table showing wh size credit cost
+                            st.code(utility.format_wh_usage(with_header=True))
+                            st.caption('Actual cost of credits (in currency) will vary based on cloud provider and region. 5x and 6x warehouses may not be available in your region.')
+
+                        with whcol1:
+                            new_wh_size = st.select_slider('Warehouse Size', constants.WAREHOUSE_SIZES, value=wh_record.size)
+
+                            # The current setting is always an option, so the default leaves it unchanged.
+                            current_suspend_seconds = int(wh_record.auto_suspend or 0)
+                            suspend_steps = sorted(set([val for val in constants.WAREHOUSE_AUTO_SUSPEND_STEPS if val != 0] + [current_suspend_seconds]) - set([0])) + [0]
+                            suspend_lookup = {}
+                            current_suspend_label = ''
+                            for val in suspend_steps:
+                                val_lookup = utility.format_seconds_interval(val)
+                                if val == 0:
+                                    suspend_lookup[val_lookup['status']] = val
+                                else:
+                                    suspend_lookup[val_lookup['description']] = val
+                                if val == current_suspend_seconds:
+                                    current_suspend_label = list(suspend_lookup.keys())[-1]
+
+                            new_wh_suspend_seconds = st.select_slider('Auto Suspend (current setting is ' + auto_suspend_breakdown['description'] + ')', suspend_lookup, value=current_suspend_label)
+                            new_wh_suspend_seconds = suspend_lookup[new_wh_suspend_seconds]
+
+                            if simulate_auto_suspend:
+                                with st.spinner('Simulating Auto Suspend...'):
+                                    suspend_simulation = suspend_simulator.simulate(get_busy_intervals(main_url, selected_wh), suspend_steps, constants.WAREHOUSE_SIZES[wh_record.size]['credit_rate'], constants.SUSPEND_SIMULATION_DAYS * 86400)
+                                suspend_labels = dict((val, label) for label, val in suspend_lookup.items())
+                                st.dataframe(pd.DataFrame([{
+                                    'Auto Suspend': suspend_labels[result['auto_suspend']] + (' (current)' if result['auto_suspend'] == current_suspend_seconds else ''),
+                                    'Credits': result['credits'],
+                                    'Idle Credits': result['idle_credits'],
+                                    'Resumes': result['resumes']
+                                    } for result in suspend_simulation]))
+                                st.caption('Estimated over the last ' + str(constants.SUSPEND_SIMULATION_DAYS) + ' days at the current size, for a single cluster. Each resume is billed at least one minute.')
+
+                            new_wh_auto_resume = st.radio('Auto Resume', (True, False), index=0 if warehouse_plan.is_true(wh_record.auto_resume) else 1, help='If set to True, the warehouse will automatically resume when queries are executed against it.')
+
+                            new_wh_comment = st.text_area('Comment', max_chars=constants.COMMENT_MAX_LENGTH, value=wh_record.comment, help='Add a comment to the Warehouse Definition')
+
+                        with st.expander('Clustering', False):
+                            new_wh_scaling_pol = st.radio('Scaling Policy', ('Standard', 'Economy'), index=1 if str(wh_record.scaling_policy).upper() == 'ECONOMY' else 0, help='Standard will attempt to minimize queueing by starting clusters. Conserves credits by allowing some queueing.')
+                            cluster_col1, cluster_col2 = st.columns(2)
+                            with cluster_col1:
+                                new_wh_cluster_min = st.slider('Minimum Clusters', min_value=1, max_value=10, value=wh_record.min_cluster_count, help='Clustering only supported on Enterprise or higher editions of Snowflake. Leave at 1 if needed.')
+                            with cluster_col2:
+                                new_wh_cluster_max = st.slider('Maximum Clusters', min_value=1, max_value=10, value=wh_record.max_cluster_count, help='Clustering only supported on Enterprise or higher editions of Snowflake. Leave at 1 if needed.')
+
+                        query_acc_col1, query_acc_col2 = st.columns([2, 7])
+                        with query_acc_col1:
+                            new_wh_query_acc = st.radio('Enable Acceleration', (False, True), index=1 if warehouse_plan.is_true(wh_record.query_acceleration_enabled) else 0, help='Enable __*query acceleration*__ service and allow the warehouse to automatically scale vertically. If in doubt, leave as False')
+
+                        with query_acc_col2:
+                            new_wh_query_acc_scaling = st.slider('Scale Factor', min_value=0, max_value=100, value=wh_record.query_acceleration_max_scale_factor, help='Unless Query Accleration is enabled, this setting does nothing. Allows resource scaling as a multiple of this number. If set to 2, the base warehouse size can scale up to 2x its normal resource amount.')
+
+                        if st.form_submit_button('Alter Warehouse'):
+                            wh_settings = {
+                                'warehouse_size': new_wh_size,
+                                'auto_suspend': new_wh_suspend_seconds,
+                                'auto_resume': new_wh_auto_resume,
+                                'comment': new_wh_comment,
+                                'scaling_policy': new_wh_scaling_pol,
+                                'min_cluster_count': new_wh_cluster_min,
+                                'max_cluster_count': new_wh_cluster_max,
+                                'enable_query_acceleration': new_wh_query_acc,
+                                'query_acceleration_max_scale_factor': new_wh_query_acc_scaling
+                                }
+                            # Only what the user changed on this warehouse is sent, to it and to the others.
+                            # The comment box holds at most COMMENT_MAX_LENGTH characters, so compare the comment as shown.
+                            wh_properties = wh_record.get_properties()
+                            wh_properties['comment'] = str(wh_properties['comment'] or '')[:constants.COMMENT_MAX_LENGTH]
+                            wh_settings['comment'] = str(wh_settings['comment'] or '')[:constants.COMMENT_MAX_LENGTH]
+                            wh_changes = warehouse_plan.diff_settings(wh_properties, wh_settings)
+                            wh_alterations = {}
+                            for wh_name in [selected_wh] + also_alter_whs:
+                                target_changes = warehouse_plan.diff_settings(wh_catalog.get(wh_name).get_properties(), wh_changes)
+                                if target_changes:
+                                    wh_alterations[wh_name] = target_changes
+                            alteration_names = dict((sql_builder.get_alter_warehouse_sql(wh_name, target_changes), wh_name) for wh_name, target_changes in wh_alterations.items())
+                            wh_alteration_queries = list(alteration_names.keys())
+                            if st.session_state['debug']: st.code(';\n'.join(wh_alteration_queries), language='sql')
+
+                            if not wh_alterations:
+                                st.info('No settings were changed.')
+                            else:
+                                with st.spinner('Altering...'):
+                                    done, failed = warehouse_plan.run_statements(run_sql, wh_alteration_queries)
+                                    altered_whs = [alteration_names[statement] for statement in done]
+
+                                    # Patch the cached rows of the warehouses that did change, whatever failed.
+                                    row_changes = dict((wh_name, warehouse_plan.get_row_changes(wh_alterations[wh_name])) for wh_name in altered_whs)
+                                    if row_changes:
+                                        get_result_cache().patch(main_url, 'warehouses', lambda rows: tag_inventory.patch_many_warehouse_rows(rows, row_changes))
+                                for statement, alter_error in failed:
+                                    st.error(alteration_names[statement] + ': ' + alter_error)
+                                if altered_whs == [selected_wh]:
+                                    st.success('Altered ' + selected_wh + ': ' + ', '.join(wh_alterations[selected_wh].keys()))
+                                elif altered_whs:
+                                    st.success('Altered ' + str(len(altered_whs)) + ' of ' + str(len(wh_alterations)) + ' warehouses')
+
+                with st.form('create_wh_form', clear_on_submit=True):
+                    st.subheader('Create New Warehouse', anchor='create_wh')
+                    new_wh_col1, new_wh_col2 = st.columns(2)
+                    with new_wh_col1:
+                        new_wh_name = st.text_input('Name', key='new_wh_name', help='Input a database-friendly name to call the new warehouse.')
+
+                    with new_wh_col2:
+                        new_wh_owner = st.text_input('Owner', key='new_wh_owner', value='SYSADMIN', help='The Snowflake role to which ownership will be assigned after creation.')
+                    if st.form_submit_button('Create Warehouse', help='Create a new warehouse with default settings. Use Edit Warehouse interface to customize.'):
+                        with st.spinner('Creating...'):
+                            create_wh_result = run_sql('create warehouse if not exists ' + new_wh_name)
+                            if new_wh_owner.lower() != 'sysadmin':
+                                run_sql('grant ownership on warehouse ' + new_wh_name + ' to role ' + new_wh_owner + ' copy current grants')
+                            # Only the warehouse list needs fetching again, to pick up the new row with its defaults.
+                            get_result_cache().invalidate(main_url, 'warehouses')
+                            st.success(create_wh_result[0]['status'])
+            if active_view == 'Tags':
+                st.subheader('Tags', 'tags')
+
+                if st.button('Refresh Tags', key='refresh_tags_button', help='Will re-acquire the list of tags. '):
+                    invalidate_view_results('tags')
+                    st.experimental_rerun()
 
-    if st.session_state['authenticated']:
-        with tab2:
-            st.subheader('Warehouses', 'wh')
+                tag_list, tag_lookup = tag_inventory.build_tag_lookup(get_page_result(page_queries, 'tags', main_url))
 
-            with st.spinner('Getting Warehouses'):
-                account_warehouses_df = cache_large_sql('show warehouses', main_url)
+                tag_col1, tag_col2, tag_col3, tag_col4 = st.columns([3, 3, 1, 1])
 
-            wh_col1, wh_col2 = st.columns(2, gap='medium')
+                for key in tag_lookup.keys():
+                    if key == 'TAG_ASSISTANT_ENABLED':
+                        continue
 
-            with wh_col1: 
-                assistant_enabled_setting = st.radio('Assistant Enabled', ('All', 'Yes', 'No'), key='assistant_enabled_setting', help='Filter warehouse list based on whether Assistant is enabled on that warehouse already.')
+                    with tag_col1:
+                        st.write(key)
 
-                if st.button('Refresh Warehouse List', key='refresh_wh_button', help='Clears the cache, so all large data sources will be rerun. You may need to push the button a second time to trigger a reload.'):
-                    st.experimental_memo.clear()
-                    st.experimental_rerun()
+                    with tag_col2:
+                        st.write('Allowed Values: ' + utility.convert_list_string(tag_lookup[key]['allowed_values']))
 
-                warehouse_list = ['']
-                wh_lookup = {}
-                with st.spinner('Getting Warehouse Information...'):
-                    for row in account_warehouses_df:
-                        wh_name = row['name']
-                        wh_lookup[wh_name] = {}
-                        wh_lookup[wh_name]['name'] = wh_name
-
-                        assist_is_enabled_wh = cache_small_sql("select nvl(system$get_tag('tagging_assist_db.tagging.tag_assistant_enabled', '" + wh_name + "', 'warehouse'), 'n') as enabled", main_url)
-                        assist_is_enabled_wh = assist_is_enabled_wh[0]['ENABLED']
-                        wh_lookup[wh_name]['assist_enabled'] = assist_is_enabled_wh
-
-                        if assistant_enabled_setting == 'All':
-                            warehouse_list.append(wh_name)
-                        elif assistant_enabled_setting == 'Yes' and assist_is_enabled_wh == 'y':
-                            warehouse_list.append(wh_name)
-                        elif assistant_enabled_setting == 'No' and assist_is_enabled_wh == 'n':
-                            warehouse_list.append(wh_name)
-
-                        wh_lookup[wh_name]['state'] = row['state']
-                        wh_lookup[wh_name]['type'] = row['type']
-                        wh_lookup[wh_name]['size'] = row['size']
-                        wh_lookup[wh_name]['auto_suspend'] = row['auto_suspend']
-                        wh_lookup[wh_name]['auto_resume'] = row['auto_resume']
-                        wh_lookup[wh_name]['owner'] = row['owner']
-                        wh_lookup[wh_name]['comment'] = row['comment'][:constants.COMMENT_MAX_LENGTH]
-                        wh_lookup[wh_name]['clustering'] = {}
-                        wh_lookup[wh_name]['clustering']['scaling_policy'] = row['scaling_policy']
-                        wh_lookup[wh_name]['clustering']['min'] = row['min_cluster_count']
-                        wh_lookup[wh_name]['clustering']['max'] = row['max_cluster_count']
-                        wh_lookup[wh_name]['clustering']['started'] = row['started_clusters']
-                        wh_lookup[wh_name]['clustering']['running'] = row['running']
-                        wh_lookup[wh_name]['query_acceleration'] = {}
-                        wh_lookup[wh_name]['query_acceleration']['enabled'] = row['enable_query_acceleration']
-                        wh_lookup[wh_name]['query_acceleration']['max_scale_factor'] = row['query_acceleration_max_scale_factor']
-                    
-            selected_wh = st.selectbox('Select', warehouse_list, key='selected_wh', help='Warehouses found in the account which are available to `sysadmin`')
-                
-            with wh_col2:
-                if selected_wh != '':
-                    st.markdown('Name: **' + selected_wh + '**')
-                    st.markdown('Current Size: **' + wh_lookup[selected_wh]['size'] + '**')
-                    auto_suspend_breakdown = utility.format_seconds_interval(wh_lookup[selected_wh]['auto_suspend'])
-                    st.markdown('Auto Suspend: **' + str(auto_suspend_breakdown['total_seconds']) + ' seconds** (' + auto_suspend_breakdown['description'] + ')')
-
-                    with st.expander('Additional Detail'):
-                        st.json(wh_lookup[selected_wh])
-
-                    if wh_lookup[selected_wh]['assist_enabled'] == 'n':
-                        if st.button('Enable Assistant', help='Enable management of this warehouse by the Assistant. Clicking this button will _**not**_ remove existing permissions or change any warehouse settings. Clicking this button _**will**_ add a tag and value to this warehouse.'):
-                            enable_sql = "alter warehouse " + selected_wh + " set tag tagging_assist_db.tagging.tag_assistant_enabled = 'y'" 
-                            st.session_state['main_session'].sql(enable_sql).collect()
-                            wh_lookup[selected_wh]['assist_enabled'] = 'y'
-                            st.success('Enabled')
-                    else:
-                        # Let's manage this thing a bit...
-                        if st.button('Disable Assistant', help='Disable management of this warehouse by the Assistant. Clicking this button will _**not**_ remove existing permissions or change any warehouse settings. Clicking this button _**will**_ modify a tag and value on this warehouse.'):
-                            disable_sql = "alter warehouse " + selected_wh + " set tag tagging_assist_db.tagging.tag_assistant_enabled = 'n'" 
-                            st.session_state['main_session'].sql(disable_sql).collect()
-                            wh_lookup[selected_wh]['assist_enabled'] = 'n'
-                            st.warning('Disabled')
-
-            with st.container():
-                # Display information about warehouse usage.
-                st.write('Average Credit Usage Over 30 Days')
-                wh_stats1, wh_stats2 = st.columns(2)
-                with st.spinner('Getting Usage Stats...'):
-                    warehouse_usage_stats = pd.DataFrame(cache_large_sql('''select warehouse_name, start_day_name, start_hour, round(credits_used, 2)::float as credits_used from tagging_assist_db.metadata.warehouse_usage_last_month order by 1, 2, 3 ''', main_url))
-                    if selected_wh != '':
-                        warehouse_usage_stats = warehouse_usage_stats[warehouse_usage_stats['WAREHOUSE_NAME'] == selected_wh]
-                with wh_stats1:
-                    st.area_chart(warehouse_usage_stats.groupby(['START_DAY_NAME'], as_index=False).mean(), x='START_DAY_NAME', y='CREDITS_USED')
-
-                with wh_stats2:
-                    st.area_chart(warehouse_usage_stats.groupby(['START_HOUR'], as_index=False).mean(), x='START_HOUR', y='CREDITS_USED')
-
-            if selected_wh != '' and wh_lookup[selected_wh]['assist_enabled'] == 'y':
-                ### Scheduling ###
-                wh_schedule_tasks = st.session_state['main_session'].sql("show tasks like 'resize_" + selected_wh.lower() + "%' in schema scheduling").collect()
-                sch_col1, sch_col2 = st.columns([2, 6])
-                with sch_col1:
-                    default_scheduled_enabled = 0
-                    if len(wh_schedule_tasks) > 0:
-                        default_scheduled_enabled = 1
-                    enable_schedules = st.radio('Enable Scheduling', (False, True), index=default_scheduled_enabled, key='enable_schedules', help='If enabled, the warehouse size will be set to a specified size on a schedule. Disabling scheduling will pause existing schedules for selected warehouse.')
-
-                with sch_col2:
-                    if enable_schedules:
-                        schedule_count = st.slider('Number of Schedules', 1, constants.MAX_SCHEDULE_COUNT, value=1, key='schedule_count')
-
-                # Call a function to display and operate schedules.
-                if enable_schedules:
-                    with st.container():
-                        use_schedule_tz = cache_small_sql("show parameters like 'timezone'", main_url)[0]['value']
-                        if use_schedule_tz:
-                            display_schedules(selected_wh, schedule_count, wh_schedule_tasks, use_schedule_tz)
+                    with tag_col3:
+                        want_to_del_tag = st.checkbox('Del', key=key+'_del_check', help='Drop this tag from the database.')
+
+                    with tag_col4:
+                        if want_to_del_tag:
+                            if st.button('Confirm', key=key+'_confirm_del', help='Clicking this button will permanently drop this tag and dissociate it from all objects in the account. Do not push this unless you mean it!'):
+                                drop_tag_result = run_sql('drop tag if exists tagging_assist_db.tagging.' + key)
+                                invalidate_view_results('tags')
+                                st.success('Dropped')
                         else:
-                            display_schedules(selected_wh, schedule_count, wh_schedule_tasks)
-                elif len(wh_schedule_tasks) > 0:
-                    for row in wh_schedule_tasks:
-                        pause_schedule_sql = "call utility.sp_pause_resume_warehouse_size_task('" + row['name'] + "', 'suspend')"
-                        st.session_state['main_session'].sql(pause_schedule_sql).collect()
-
-                ### Warehouse Settings ###
-                with st.form('warehouse_settings', clear_on_submit=True):
-                    st.subheader('Edit ' + selected_wh + ' Settings')
-
-
-                    whcol1, whcol2 = st.columns([5, 2], gap='medium')
-                    with whcol2:
-                        # Display a table showing wh size credit cost
-                        st.code(utility.format_wh_usage(with_header=True))
-                        st.caption('Actual cost of credits (in currency) will vary based on cloud provider and region. 5x and 6x warehouses may not be available in your region.')
-
-                    with whcol1:
-                        new_wh_size = st.select_slider('Warehouse Size', constants.WAREHOUSE_SIZES, value=wh_lookup[selected_wh]['size'])
-
-                        suspend_lookup = {}
-                        for val in constants.WAREHOUSE_AUTO_SUSPEND_STEPS:
-                            val_lookup = utility.format_seconds_interval(val)
-                            if val == 0:
-                                suspend_lookup[val_lookup['status']] = val
-                            else:
-                                suspend_lookup[val_lookup['description']] = val
-
-                        new_wh_suspend_seconds = st.select_slider('Auto Suspend (current setting is ' + auto_suspend_breakdown['description'] + ')', suspend_lookup, value='1 minute')
-                        new_wh_suspend_seconds = suspend_lookup[new_wh_suspend_seconds]
-
-                        new_wh_auto_resume = st.radio('Auto Resume', (True, False), help='If set to True, the warehouse will automatically resume when queries are executed against it.')
-
-                        new_wh_comment = st.text_area('Comment', max_chars=constants.COMMENT_MAX_LENGTH, value=wh_lookup[selected_wh]['comment'], help='Add a comment to the Warehouse Definition')
-
-                    with st.expander('Clustering', False):
-                        new_wh_scaling_pol = st.radio('Scaling Policy', ('Standard', 'Economy'), help='Standard will attempt to minimize queueing by starting clusters. Conserves credits by allowing some queueing.')
-                        cluster_col1, cluster_col2 = st.columns(2)
-                        with cluster_col1:
-                            new_wh_cluster_min = st.slider('Minimum Clusters', min_value=1, max_value=10, value=wh_lookup[selected_wh]['clustering']['min'], help='Clustering only supported on Enterprise or higher editions of Snowflake. Leave at 1 if needed.')
-                        with cluster_col2:
-                            new_wh_cluster_max = st.slider('Maximum Clusters', min_value=1, max_value=10, value=wh_lookup[selected_wh]['clustering']['max'], help='Clustering only supported on Enterprise or higher editions of Snowflake. Leave at 1 if needed.')
-
-                    query_acc_col1, query_acc_col2 = st.columns([2, 7])
-                    with query_acc_col1:
-                        new_wh_query_acc = st.radio('Enable Acceleration', (False, True), help='Enable __*query acceleration*__ service and allow the warehouse to automatically scale vertically. If in doubt, leave as False')
-
-                    with query_acc_col2:
-                        new_wh_query_acc_scaling = st.slider('Scale Factor', min_value=0, max_value=100, value=wh_lookup[selected_wh]['query_acceleration']['max_scale_factor'], help='Unless Query Accleration is enabled, this setting does nothing. Allows resource scaling as a multiple of this number. If set to 2, the base warehouse size can scale up to 2x its normal resource amount.')
-
-                    if st.form_submit_button('Alter Warehouse'):
-                        wh_alteration_query  = "alter warehouse " + selected_wh + ' \n'
-                        wh_alteration_query += "  set warehouse_size = " + constants.WAREHOUSE_SIZES[new_wh_size]['code'] + ' \n'
-                        wh_alteration_query += "     ,auto_suspend = " + str(new_wh_suspend_seconds) + " \n"
-                        wh_alteration_query += "     ,auto_resume = " + str(new_wh_auto_resume).lower() + " \n"
-                        if new_wh_comment.strip() != '':
-                            wh_alteration_query += "     -- The '$$' are Snowflake SQL for a multi-line string \n"
-                            wh_alteration_query += "     ,comment = $$" + new_wh_comment + "$$ \n"
-                        wh_alteration_query += "     ,scaling_policy = " + new_wh_scaling_pol.upper() + " \n"
-                        wh_alteration_query += "     ,min_cluster_count = " + str(new_wh_cluster_min) + " \n"
-                        wh_alteration_query += "     ,max_cluster_count = " + str(new_wh_cluster_max) + " \n"
-                        wh_alteration_query += "     ,enable_query_acceleration = " + str(new_wh_query_acc).lower() + " \n"
-                        wh_alteration_query += "     ,query_acceleration_max_scale_factor = " + str(new_wh_query_acc_scaling) + " \n"
-                        if st.session_state['debug']: st.code(wh_alteration_query, language='sql')
-                        with st.spinner('Altering...'):
-
-                            alter_result = st.session_state['main_session'].sql(wh_alteration_query).collect()
-                            st.success(alter_result[0]['status'])
-
-            with st.form('create_wh_form', clear_on_submit=True):
-                st.subheader('Create New Warehouse', anchor='create_wh')
-                new_wh_col1, new_wh_col2 = st.columns(2)
-                with new_wh_col1:
-                    new_wh_name = st.text_input('Name', key='new_wh_name', help='Input a database-friendly name to call the new warehouse.')
-
-                with new_wh_col2:
-                    new_wh_owner = st.text_input('Owner', key='new_wh_owner', value='SYSADMIN', help='The Snowflake role to which ownership will be assigned after creation.')
-                if st.form_submit_button('Create Warehouse', help='Create a new warehouse with default settings. Use Edit Warehouse interface to customize.'):
-                    with st.spinner('Creating...'):
-                        create_wh_result = st.session_state['main_session'].sql('create warehouse if not exists ' + new_wh_name).collect()
-                        if new_wh_owner.lower() != 'sysadmin':
-                            st.session_state['main_session'].sql('grant ownership on warehouse ' + new_wh_name + ' to role ' + new_wh_owner + ' copy current grants').collect()
-                        st.success(create_wh_result[0]['status'])
-        with tab3:
-            st.subheader('Tags', 'tags')
-
-            available_tags_df = st.session_state['main_session'].sql('show tags in tagging_assist_db.tagging').collect()
-            if st.button('Refresh Tags', key='refresh_tags_button', help='Will re-acquire the list of tags. '):
-                # Triggers a re-draw of the page, so it will refresh the data even though this button doesn't actually do anything.
-                pass
-
-            tag_list = ['']
-            tag_lookup = {}
-            for row in available_tags_df:
-                tag_key = row[1]
-                tag_list.append(tag_key)
-                tag_lookup[tag_key] = {}
-                tag_lookup[tag_key]['name'] = row[1]
-                # Disabling this for now because I don't want to deal with a datetime object
-                # tag_lookup[tag_key]['created_on'] = row[0] 
-                tag_lookup[tag_key]['database_name'] = row[2]
-                tag_lookup[tag_key]['schema_name'] = row[3]
-                tag_lookup[tag_key]['owner'] = row[4]
-                tag_lookup[tag_key]['comment'] = row[5]
-                # tag_lookup[tag_key]['allowed_values'] = json.loads(row[6])
-                tag_lookup[tag_key]['allowed_values'] = []
-                if row[6]:
-                    tag_lookup[tag_key]['allowed_values'] = json.loads(row[6])
-
-            tag_col1, tag_col2, tag_col3, tag_col4 = st.columns([3, 3, 1, 1])
-
-            for key in tag_lookup.keys():
-                if key == 'TAG_ASSISTANT_ENABLED':
-                    continue
-
-                with tag_col1:
-                    st.write(key)
-
-                with tag_col2:
-                    st.write('Allowed Values: ' + utility.convert_list_string(tag_lookup[key]['allowed_values']))
-
-                with tag_col3:
-                    want_to_del_tag = st.checkbox('Del', key=key+'_del_check', help='Drop this tag from the database.')
-
-                with tag_col4:
-                    if want_to_del_tag:
-                        if st.button('Confirm', key=key+'_confirm_del', help='Clicking this button will permanently drop this tag and dissociate it from all objects in the account. Do not push this unless you mean it!'):
-                            drop_tag_result = st.session_state['main_session'].sql('drop tag if exists tagging_assist_db.tagging.' + key).collect()
-                            st.success('Dropped')
-                    else:
-                        st.write('...')
+                            st.write('...')
 
-            with st.form('create_tag_form', clear_on_submit=False):
-                new_tag_name = st.text_input('Tag Name', max_chars=100, key='new_tag_name', help='Database-friendly name of the new tag. Name should contain only letters, numbers, and underscores.')
-                new_tag_allowed_values = st.text_input('Allowed Values (Optional)', key='new_tag_allowed_values', help='Comma separated list of possible allowed values for this tag. Use with caution.')
-                new_tag_comment = st.text_area('Comment (Optional)', max_chars=constants.COMMENT_MAX_LENGTH, key='new_tag_comment', help='Add a comment to the new tag.')
+                with st.form('create_tag_form', clear_on_submit=False):
+                    new_tag_name = st.text_input('Tag Name', max_chars=100, key='new_tag_name', help='Database-friendly name of the new tag. Name should contain only letters, numbers, and underscores.')
+                    new_tag_allowed_values = st.text_input('Allowed Values (Optional)', key='new_tag_allowed_values', help='Comma separated list of possible allowed values for this tag. Use with caution.')
+                    new_tag_comment = st.text_area('Comment (Optional)', max_chars=constants.COMMENT_MAX_LENGTH, key='new_tag_comment', help='Add a comment to the new tag.')
 
-                new_tag_replace = st.checkbox('Replace if already exists', value=False, key='new_tag_replace', help='Check this box if you want to create this tag even if it already exists.')
+                    new_tag_replace = st.checkbox('Replace if already exists', value=False, key='new_tag_replace', help='Check this box if you want to create this tag even if it already exists.')
+
+                    if st.form_submit_button('Create Tag'):
+                        create_tag_sql = ''
+                        if new_tag_replace:
+                            create_tag_sql += 'create or replace tag '
+                        else:
+                            create_tag_sql += 'create tag if not exists '
+                        create_tag_sql += 'tagging_assist_db.tagging.' + new_tag_name
 
-                if st.form_submit_button('Create Tag'):
-                    create_tag_sql = ''
-                    if new_tag_replace:
-                        create_tag_sql += 'create or replace tag '
-                    else:
-                        create_tag_sql += 'create tag if not exists '
-                    create_tag_sql += 'tagging_assist_db.tagging.' + new_tag_name
 
+                        if new_tag_allowed_values != '':
+                            new_tag_allowed_values = utility.convert_list_string(new_tag_allowed_values)
+                            new_tag_allowed_values = utility.convert_list_string(new_tag_allowed_values, remove_quotes=False)
+                            create_tag_sql += '\n  allowed_values ' + new_tag_allowed_values
 
-                    if new_tag_allowed_values != '':
-                        new_tag_allowed_values = utility.convert_list_string(new_tag_allowed_values)
-                        new_tag_allowed_values = utility.convert_list_string(new_tag_allowed_values, remove_quotes=False)
-                        create_tag_sql += '\n  allowed_values ' + new_tag_allowed_values
+                        if new_tag_comment != '':
+                            create_tag_sql += '\n  comment = $$' + new_tag_comment + '$$'
 
-                    if new_tag_comment != '':
-                        create_tag_sql += '\n  comment = $$' + new_tag_comment + '$$'
+                        if st.session_state['debug']: st.code(create_tag_sql, language='sql')
+                        create_tag_result = run_sql(create_tag_sql)
+                        invalidate_view_results('tags')
+                        st.success(create_tag_result[0]['status'])
 
-                    if st.session_state['debug']: st.code(create_tag_sql, language='sql')
-                    create_tag_result = st.session_state['main_session'].sql(create_tag_sql).collect()
-                    st.success(create_tag_result[0]['status'])
+            if active_view == 'Apply Tags':
+                st.subheader('Apply Tags')
 
-        with tab4:
-            st.subheader('Apply Tags')
+                wh_catalog = get_warehouse_catalog(page_queries, main_url)
+                tag_list, tag_lookup = tag_inventory.build_tag_lookup(get_page_result(page_queries, 'tags', main_url))
 
-            apply_tag_wh = st.selectbox('Warehouse', warehouse_list, key='apply_tag_wh', help='Warehouses are filtered based on the "Assistant Enabled" option from the "Warehouses" tab.')
+                apply_tag_wh = warehouse_picker(wh_catalog, 'apply_tag_wh', st.session_state.get('last_assistant_enabled_setting', 'All'), label='Warehouse', help='Warehouses are filtered based on the "Assistant Enabled" option from the "Warehouses" view.')
 
-            apply_tag_name = st.selectbox('Available Tags', tag_list, key='apply_tag_name')
+                apply_tag_name = st.selectbox('Available Tags', tag_list, index=get_saved_index(tag_list, 'last_apply_tag_name'), key='apply_tag_name')
+                st.session_state['last_apply_tag_name'] = apply_tag_name
 
-            with st.form('apply_tag_value'):
-                apply_tag_col1, apply_tag_col2 = st.columns(2)
+                if apply_tag_name != '':
+                    # Values already used for the tag, searched locally as the prefix is typed.
+                    tag_values = tag_value_index.get_index(get_page_result(page_queries, 'tag_values', main_url))
+                    suggest_col1, suggest_col2 = st.columns(2)
+                    with suggest_col1:
+                        value_prefix = st.text_input('Find Existing Values', '', max_chars=100, key='tag_value_prefix', help='Type the start of a value to search the values already set for this tag.')
+                    with suggest_col2:
+                        value_matches = tag_values.search(apply_tag_name, value_prefix, constants.TAG_SUGGESTION_LIMIT)
+                        st.selectbox('Suggested Values', [''] + value_matches, format_func=lambda value: value + ' (' + str(tag_values.get_count(apply_tag_name, value)) + ' objects)' if value else '', key='suggested_tag_value', on_change=use_suggested_tag_value, help='The most used values first. Choosing one fills in the Tag Value.')
 
-                with apply_tag_col1:
-                    apply_tag_value = st.text_input('Tag Value', '', max_chars=100, key='apply_tag_value', help='Help!')
+                current_tag_value = None
+                with st.form('apply_tag_value'):
+                    apply_tag_col1, apply_tag_col2 = st.columns(2)
+
+                    with apply_tag_col1:
+                        apply_tag_value = st.text_input('Tag Value', '', max_chars=100, key='apply_tag_value', help='Help!')
     
-                with apply_tag_col2:
-                    st.write('Current Value')
-                    if apply_tag_wh != '' and apply_tag_name != '':
-                        current_tag_value_sql = "select nvl(system$get_tag('tagging_assist_db.tagging." + apply_tag_name + "', '" + apply_tag_wh + "', 'warehouse'), '<none set>') as tag_value"
-                        current_tag_value_result = st.session_state['main_session'].sql(current_tag_value_sql).collect()
-                        st.markdown('**' + current_tag_value_result[0]['TAG_VALUE'] + '**')
-
-                    st.write('Allowed Values')
-                    if apply_tag_name != '' and tag_lookup[apply_tag_name]['allowed_values']:
-                        st.markdown('**' + utility.convert_list_string(tag_lookup[apply_tag_name]['allowed_values'], remove_quotes=False) + '**')
-                    else:
-                        st.markdown('**<any>**')
+                    with apply_tag_col2:
+                        st.write('Current Value')
+                        if apply_tag_wh != '' and apply_tag_name != '':
+                            current_tag_value_result = get_page_result(page_queries, 'current_tag_value', main_url, (apply_tag_name, apply_tag_wh))
+                            st.markdown('**' + current_tag_value_result[0]['TAG_VALUE'] + '**')
+                            if current_tag_value_result[0]['TAG_VALUE'] != '<none set>':
+                                current_tag_value = current_tag_value_result[0]['TAG_VALUE']
+
+                        st.write('Allowed Values')
+                        if apply_tag_name != '' and tag_lookup[apply_tag_name]['allowed_values']:
+                            st.markdown('**' + utility.convert_list_string(tag_lookup[apply_tag_name]['allowed_values'], remove_quotes=False) + '**')
+                        else:
+                            st.markdown('**<any>**')
                 
-                with apply_tag_col1:
-                    if st.form_submit_button('Apply Tag Value'):
-                        if apply_tag_value == '':
-                            apply_tag_sql = "alter warehouse " + apply_tag_wh + " unset tag tagging_assist_db.tagging." + apply_tag_name
+                    with apply_tag_col1:
+                        if st.form_submit_button('Apply Tag Value'):
+                            applied_value = apply_tag_value if apply_tag_value != '' else None
+                            apply_tag_sql = sql_builder.get_set_tags_sql(apply_tag_wh, {apply_tag_name: applied_value})[0]
+                            with st.spinner('Applying Tag Value...'):
+                                apply_tag_result = run_sql(apply_tag_sql)
+                                get_result_cache().patch(main_url, 'tag_inventory', lambda rows: tag_inventory.patch_tag_inventory_rows(rows, apply_tag_wh, tag_name=apply_tag_name, tag_value=applied_value))
+                                get_result_cache().patch(main_url, 'tag_values', lambda rows: tag_value_index.patch_tag_value_rows(rows, apply_tag_name, current_tag_value, applied_value))
+                                set_view_result('current_tag_value', (apply_tag_name, apply_tag_wh), [{'TAG_VALUE': applied_value or '<none set>'}])
+                                st.success(apply_tag_result[0]['status'])
+
+                st.warning('Tag values may take up to 3 hours to appear in stats')
+
+                with st.expander('Bulk Tagging', False):
+                    st.caption('Set several tags on many warehouses at once. Current values come from the tag inventory already loaded for the warehouse list, and all changes are applied with one call of utility.sp_set_warehouse_tags per ' + str(sql_builder.TAG_CALL_MAX_WAREHOUSES) + ' warehouses.')
+                    bulk_select_by = st.radio('Select Warehouses By', ('Filter', 'List'), index=get_saved_index(('Filter', 'List'), 'last_bulk_select_by'), key='bulk_select_by', horizontal=True)
+                    st.session_state['last_bulk_select_by'] = bulk_select_by
+                    bulk_assistant_setting = st.session_state.get('last_assistant_enabled_setting', 'All')
+                    bulk_criteria = {}
+                    if warehouse_catalog.ASSISTANT_ENABLED_SETTINGS[bulk_assistant_setting]:
+                        bulk_criteria['assist_enabled'] = warehouse_catalog.ASSISTANT_ENABLED_SETTINGS[bulk_assistant_setting]
+                    if bulk_select_by == 'Filter':
+                        bulk_col1, bulk_col2, bulk_col3 = st.columns([3, 1, 1])
+                        with bulk_col1:
+                            bulk_search = st.text_input('Name Contains', '', key='bulk_tag_search', help='Warehouses whose name contains this text. Leave blank for all.')
+                        with bulk_col2:
+                            bulk_size = st.selectbox('Size', ['Any'] + [size for size in constants.WAREHOUSE_SIZES.keys() if size in wh_catalog.indexes['size']], key='bulk_tag_size')
+                        with bulk_col3:
+                            bulk_owner = st.selectbox('Owner', ['Any'] + wh_catalog.get_values('owner'), key='bulk_tag_owner')
+                        if bulk_size != 'Any':
+                            bulk_criteria['size'] = bulk_size
+                        if bulk_owner != 'Any':
+                            bulk_criteria['owner'] = bulk_owner
+                        bulk_whs = wh_catalog.search(bulk_search, 0, None, **bulk_criteria)[0]
+                    else:
+                        bulk_whs = warehouse_multi_picker(wh_catalog, 'bulk_tag_whs', 'Warehouses', help='Warehouses are filtered based on the "Assistant Enabled" option from the "Warehouses" view.', **bulk_criteria)
+
+                    bulk_tag_names = st.multiselect('Tags', [tag_name for tag_name in tag_list if tag_name not in ('', 'TAG_ASSISTANT_ENABLED')], key='bulk_tag_names')
+                    bulk_tag_values = {}
+                    for tag_name in bulk_tag_names:
+                        if tag_lookup[tag_name]['allowed_values']:
+                            bulk_tag_values[tag_name] = st.selectbox(tag_name, [''] + tag_lookup[tag_name]['allowed_values'], key='bulk_tag_value_' + tag_name, help='Leave blank to unset the tag.')
                         else:
-                            apply_tag_sql = "alter warehouse " + apply_tag_wh + " set tag tagging_assist_db.tagging." + apply_tag_name + " = $$" + apply_tag_value + "$$"
-                        with st.spinner('Applying Tag Value...'):
-                            apply_tag_result = st.session_state['main_session'].sql(apply_tag_sql).collect()
-                            st.success(apply_tag_result[0]['status'])
-
-            st.warning('Tag values may take up to 3 hours to appear in stats')
-
-            suggested_tag_sql = constants.SUGGESTED_VALUE_SQL + " where tag_name = '" + apply_tag_name + "'"
-            if apply_tag_name != '':
-                if st.session_state['debug']: st.code(suggested_tag_sql)
-                with st.spinner('Searching for Suggestions...'):
-                    suggested_tag_result = cache_small_sql(suggested_tag_sql, main_url)
-                    st.write('Suggested Values')
-                    st.markdown('**' + suggested_tag_result[0]['SUGGESTED_VALUES'] + '**')
-
-    # Bottom. EVERYTHING goes above this...
-    if st.session_state.debug:
-        st.markdown('---')
-        st.subheader('Debug', 'debug')
+                            bulk_tag_values[tag_name] = st.text_input(tag_name, '', max_chars=100, key='bulk_tag_value_' + tag_name, help='Leave blank to unset the tag.')
+                    bulk_tag_values = dict((tag_name, value if value != '' else None) for tag_name, value in bulk_tag_values.items())
+
+                    # Every picked tag is sent to every warehouse. The cached tag inventory can lag behind the 
+                    # account, so it is only used for the preview, and setting a tag to its value again changes nothing.
+                    bulk_changes = {}
+                    bulk_preview = []
+                    if bulk_tag_values:
+                        for wh_name in bulk_whs:
+                            tag_assignments = wh_catalog.get(wh_name).tag_assignments
+                            bulk_changes[wh_name] = dict(bulk_tag_values)
+                            preview_row = {'WAREHOUSE': wh_name}
+                            for tag_name in bulk_tag_names:
+                                preview_row[tag_name] = tag_assignments.get(tag_name, '<none set>')
+                            preview_row['CHANGES'] = ', '.join(tag_name + ' -> ' + (value if value is not None else '<unset>') for tag_name, value in bulk_tag_values.items() if tag_assignments.get(tag_name) != value)
+                            bulk_preview.append(preview_row)
+
+                    st.caption(str(len(bulk_whs)) + ' warehouses selected.')
+                    if bulk_preview and bulk_tag_names:
+                        st.dataframe(pd.DataFrame(bulk_preview))
+
+                    if st.button('Apply to ' + str(len(bulk_changes)) + ' Warehouses', key='bulk_tag_apply', disabled=not bulk_changes):
+                        bulk_errors = []
+                        applied_changes = {}
+                        with st.spinner('Applying Tag Values...'):
+                            for call_sql, result_column, call_whs in sql_builder.get_set_tags_calls(bulk_changes):
+                                if st.session_state['debug']: st.code(call_sql, language='sql')
+                                try:
+                                    call_errors = warehouse_plan.get_tag_errors(json.loads(run_sql(call_sql)[0][result_column]), call_whs)
+                                except Exception as err:
+                                    bulk_errors.append(str(err) + ' (in a call for ' + str(len(call_whs)) + ' warehouses starting with ' + call_whs[0] + ')')
+                                    continue
+                                bulk_errors.extend(wh_name + ': ' + call_error for wh_name, call_error in call_errors.items())
+                                applied_changes.update((wh_name, bulk_changes[wh_name]) for wh_name in call_whs if wh_name not in call_errors)
+
+                            if applied_changes:
+                                value_changes = [(tag_name, wh_catalog.get(wh_name).tag_assignments.get(tag_name), value) for wh_name, wh_tag_changes in applied_changes.items() for tag_name, value in wh_tag_changes.items()]
+                                get_result_cache().patch(main_url, 'tag_inventory', lambda rows: tag_inventory.patch_many_tag_inventory_rows(rows, applied_changes))
+                                get_result_cache().patch(main_url, 'tag_values', lambda rows: tag_value_index.patch_many_tag_value_rows(rows, value_changes))
+                                invalidate_view_results('current_tag_value')
+                        for bulk_error in bulk_errors:
+                            st.error(bulk_error)
+                        if applied_changes:
+                            st.success('Tagged ' + str(len(applied_changes)) + ' warehouses')
+
+            if active_view == 'Chargeback':
+                st.subheader('Chargeback', 'chargeback')
+                st.caption('Credits by tag value, from the hourly rollup tables kept up to date by the scheduling.refresh_warehouse_usage_rollups task. Each hour counts toward the tag values its warehouse had when the hour was rolled up.')
+
+                tag_list, tag_lookup = tag_inventory.build_tag_lookup(get_page_result(page_queries, 'tags', main_url))
+                chargeback_tags = [tag_name for tag_name in tag_list if tag_name != 'TAG_ASSISTANT_ENABLED']
+
+                if 'last_chargeback_days' not in st.session_state:
+                    st.session_state['last_chargeback_days'] = constants.CHARGEBACK_DEFAULT_DAYS
+
+                chargeback_col1, chargeback_col2, chargeback_col3 = st.columns([4, 2, 2])
+                with chargeback_col1:
+                    chargeback_tag = st.selectbox('Tag', chargeback_tags, index=get_saved_index(chargeback_tags, 'last_chargeback_tag'), key='chargeback_tag')
+                with chargeback_col2:
+                    chargeback_days = st.selectbox('Days', constants.CHARGEBACK_DAY_OPTIONS, index=get_saved_index(constants.CHARGEBACK_DAY_OPTIONS, 'last_chargeback_days'), key='chargeback_days')
+                with chargeback_col3:
+                    if st.button('Refresh', key='refresh_chargeback_button', help='Roll up the latest metering history now, then read the rollup tables again.'):
+                        with st.spinner('Rolling Up Usage...'):
+                            # The call returns once the procedure has finished, so the reads after it see the new rows.
+                            refresh_result = json.loads(run_sql(sql_builder.get_call_sql('sp_refresh_warehouse_usage_rollups'))[0]['SP_REFRESH_WAREHOUSE_USAGE_ROLLUPS'])
+                        if 'error' in refresh_result:
+                            st.error(refresh_result['error'])
+                        else:
+                            # Let this run's prefetch finish first, so it can't cache the old rollups after the invalidation.
+                            page_queries.wait()
+                            get_result_cache().invalidate(main_url, 'chargeback')
+                            st.experimental_rerun()
+                st.session_state['last_chargeback_tag'] = chargeback_tag
+                st.session_state['last_chargeback_days'] = chargeback_days
+
+                if chargeback_tag != '':
+                    chargeback_sql = sql_builder.get_chargeback_sql(chargeback_tag, chargeback_days)
+                    if st.session_state['debug']: st.code(chargeback_sql, language='sql')
+                    with st.spinner('Getting Chargeback...'):
+                        chargeback_df = get_page_result(page_queries, 'chargeback', main_url, (chargeback_tag, chargeback_days))
+
+                    if chargeback_df.empty:
+                        st.info('No rolled up usage yet. The rollup task fills the tables at 15 minutes past each hour.')
+                    else:
+                        chargeback_by_value, chargeback_by_day = usage_stats.get_chargeback_summary(chargeback_df)
+                        st.metric('Credits Used, Last ' + str(chargeback_days) + ' Days', round(chargeback_by_value['CREDITS_USED'].sum(), 2))
+
+                        chargeback_chart1, chargeback_chart2 = st.columns(2)
+                        with chargeback_chart1:
+                            st.bar_chart(chargeback_by_value, x='TAG_VALUE', y='CREDITS_USED')
+                        with chargeback_chart2:
+                            st.area_chart(chargeback_by_day)
+
+                        st.dataframe(chargeback_by_value.rename(columns={'TAG_VALUE': chargeback_tag}))
+
+        # Bottom. EVERYTHING goes above this...
+        if st.session_state.debug:
+            st.markdown('---')
+            st.subheader('Debug', 'debug')
 
-        debug_1, debug_2, debug_3 = st.columns(3)
-        with debug_1:
-            st.write('Session State:')
-            st.json(st.session_state)
+            debug_1, debug_2, debug_3 = st.columns(3)
+            with debug_1:
+                st.write('Session State:')
+                st.json(st.session_state)
 
-        with debug_2:
-            st.write('Selected Warehouse:')
-            if st.session_state['authenticated'] and selected_wh != '':
-                st.json(wh_lookup[selected_wh])
+                st.write('Session Pool:')
+                st.json(get_session_pool().status())
 
-                st.write('Duration Breakdown')
-                st.json(auto_suspend_breakdown)
+                result_cache_status = get_result_cache().status()
+                st.write('Result Cache:')
+                st.json({'entries': result_cache_status['entries'], 'bytes': result_cache_status['bytes'], 'stats': result_cache_status['stats']})
 
-        with debug_3:
-            st.write('Available Tags:')
-            if st.session_state['authenticated']:
-                st.json(tag_lookup, expanded=False)
+                st.write('Disk Cache:')
+                st.json(result_cache_status['disk'])
+
+            with debug_2:
+                st.write('Selected Warehouse:')
+                if st.session_state['authenticated'] and wh_record:
+                    st.json(wh_record.as_dict())
+
+                    st.write('Duration Breakdown')
+                    st.json(auto_suspend_breakdown)
+
+            with debug_3:
+                st.write('Available Tags:')
+                if st.session_state['authenticated']:
+                    st.json(tag_lookup, expanded=False)
+
+            st.write('Queries This Rerun:')
+            rerun_queries = get_query_log().current['queries']
+            st.json(get_query_log().summary())
+            if rerun_queries:
+                query_timeline_df = pd.DataFrame(rerun_queries)
+                st.bar_chart(query_timeline_df, x='offset', y='seconds')
+                st.dataframe(query_timeline_df[['offset', 'seconds', 'rows', 'bytes', 'cached', 'source', 'statement']])
+
+                st.write('Slowest Queries:')
+                st.table(pd.DataFrame(get_query_log().slowest(5))[['seconds', 'rows', 'cached', 'fingerprint', 'statement']])
+
+            st.download_button('Download Query Metrics', query_log.render_openmetrics(), file_name='tagging_assistant_metrics.txt', help='Process-wide query counters in OpenMetrics format.')
+    finally:
+        # Runs on reruns, stops and errors too. No background query may still be using the session once it goes back to the pool.
+        if page_queries is not None:
+            page_queries.wait()
+        release_session()
+
+    if os.environ.get('TAGGING_ASSIST_METRICS_FILE'):
+        # Exported for scraping, e.g. by the node_exporter textfile collector.
+        query_log.write_openmetrics(os.environ['TAGGING_ASSIST_METRICS_FILE'])
 
     return True
 